@@ -0,0 +1,62 @@
+from django.conf import settings
+from django.db.models import BigIntegerField, Q
+from django.db.models.functions import Cast
+from django.utils.module_loading import import_string
+from guardian.models import GroupObjectPermission, UserObjectPermission
+from guardian.shortcuts import get_objects_for_user
+
+from .models import Account
+
+
+class GuardianAccessBackend:
+    """
+    Resolve account access purely from guardian object permissions.
+
+    Joins guardian's user and group permission tables and compares `object_pk` as text,
+    so its cost grows with the size of those tables.
+    """
+
+    def accounts_for(self, user, perm='view_account'):
+        return get_objects_for_user(user=user, perms=perm, klass=Account, accept_global_perms=False)
+
+
+class OwnerAccessBackend:
+    """
+    Resolve account access from the indexed `account_owner` foreign key, consulting guardian
+    only for accounts explicitly shared with the user or one of their groups.
+
+    The shared lookup is a subquery on guardian's (permission, user, content type, object) index,
+    so it touches only the permission rows that belong to the user.
+    """
+
+    def accounts_for(self, user, perm='view_account'):
+        if not user.is_active:
+            return Account.objects.none()
+        if user.is_superuser:
+            return Account.objects.all()
+        return Account.objects.filter(Q(account_owner=user) | self.shared_filter(user, perm))
+
+    def shared_filter(self, user, perm):
+        # Match the content type by name inside the subquery rather than fetching it first.
+        account_type = {
+            'content_type__app_label': Account._meta.app_label,
+            'content_type__model': Account._meta.model_name,
+        }
+        user_shared = UserObjectPermission.objects.filter(
+            user=user, permission__codename=perm, **account_type
+        ).values(pk_value=Cast('object_pk', BigIntegerField()))
+        group_shared = GroupObjectPermission.objects.filter(
+            group__user=user, permission__codename=perm, **account_type
+        ).values(pk_value=Cast('object_pk', BigIntegerField()))
+        return Q(pk__in=user_shared) | Q(pk__in=group_shared)
+
+
+def get_access_backend():
+    """
+    The backend named by the `ACCOUNT_ACCESS_BACKEND` setting, owner-first by default.
+    """
+    return import_string(getattr(settings, 'ACCOUNT_ACCESS_BACKEND', 'accounts.access.OwnerAccessBackend'))()
+
+
+def accessible_accounts(user, perm='view_account'):
+    return get_access_backend().accounts_for(user, perm)
@@ -1,24 +1,172 @@
+import datetime
+
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connections
+from django.db.models import Max, Min, QuerySet
+from django.utils.functional import cached_property
 
 from .models import *
+from .search import search_terms, search_transactions
+
+
+def estimated_row_count(model, using):
+    """
+    The planner's estimate of the model's row count, read from the statistics `ANALYZE` keeps
+    (`sqlite_stat1` on SQLite, `pg_class` on PostgreSQL). None where there are no statistics.
+    """
+    connection = connections[using]
+    table = model._meta.db_table
+    if connection.vendor == 'sqlite':
+        # Each index's statistics start with the number of rows it holds: every row, for a full index.
+        sql, params = "SELECT MAX(CAST(stat AS INTEGER)) FROM sqlite_stat1 WHERE tbl = %s", [table]
+    elif connection.vendor == 'postgresql':
+        sql, params = "SELECT reltuples FROM pg_class WHERE oid = %s::regclass", [connection.ops.quote_name(table)]
+    else:
+        return None
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            row = cursor.fetchone()
+    except DatabaseError:
+        # sqlite_stat1 only exists once the database has been analyzed.
+        return None
+    # reltuples is -1 for a table PostgreSQL has never analyzed.
+    return int(row[0]) if row and row[0] is not None and row[0] >= 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    A changelist paginator that never counts a whole large table. Unfiltered lists take the
+    row count from the database statistics; filtered ones count at most `count_limit` rows, so
+    a broad filter reports `count_limit + 1` and pages past that are reached by narrowing it.
+    Small tables, and tables without statistics, are counted exactly up to the limit.
+    """
+    count_limit = 100000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimated_row_count(queryset.model, queryset.db)
+            if estimate is not None and estimate > self.count_limit:
+                return estimate
+        return queryset.order_by()[:self.count_limit + 1].count()
+
+
+class IndexedDatesQuerySet(QuerySet):
+    """
+    A queryset whose `dates()` finds each period with an index seek for the first date past the
+    previous one, rather than truncating the date of every row: the date hierarchy of a changelist
+    costs one query per year, month or day shown instead of a scan of the whole table.
+    """
+
+    def dates(self, field_name, kind, order='ASC'):
+        if kind not in ('year', 'month', 'day'):
+            return super().dates(field_name, kind, order)
+        periods = []
+        # Any date filter of the changelist bounds the first seek; subsequent ones start past each period found.
+        seek = self.filter(**{'%s__gte' % field_name: datetime.date.min})
+        while seek is not None:
+            first = seek.order_by(field_name).values_list(field_name, flat=True).first()
+            if first is None:
+                break
+            period = truncate_date(first, kind)
+            periods.append(period)
+            start = next_period(period, kind)
+            # The seek's bound goes first: given several lower bounds on a column, SQLite starts
+            # the index range at the first, which would be the changelist's own date filter.
+            seek = start and self.model._base_manager.using(self.db).filter(**{'%s__gte' % field_name: start}) & self
+        return periods if order == 'ASC' else periods[::-1]
+
+    def aggregate(self, *args, **kwargs):
+        # SQLite reads a lone MIN or MAX off an index but scans the table for both together,
+        # as the date hierarchy asks for them.
+        if not args and len(kwargs) > 1 and all(isinstance(value, (Min, Max)) for value in kwargs.values()):
+            result = {}
+            for name, value in kwargs.items():
+                result.update(super().aggregate(**{name: value}))
+            return result
+        return super().aggregate(*args, **kwargs)
+
 
+def truncate_date(date, kind):
+    if kind == 'year':
+        return date.replace(month=1, day=1)
+    if kind == 'month':
+        return date.replace(day=1)
+    return date
 
-class AccountAdmin(admin.ModelAdmin):
+
+def next_period(period, kind):
+    """The first day after the year, month or day starting on `period`; None past the last representable date."""
+    try:
+        if kind == 'year':
+            return period.replace(year=period.year + 1)
+        if kind == 'month':
+            return (period + datetime.timedelta(days=31)).replace(day=1)
+        return period + datetime.timedelta(days=1)
+    except (OverflowError, ValueError):
+        return None
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """
+    Changelist defaults for tables too large to count or facet on every page view: the count
+    is estimated, the "show all" total is skipped and filter facets are never computed.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    show_facets = admin.ShowFacets.NEVER
+
+
+class AccountAdmin(LargeTableAdmin):
     # ...
-    list_display = ["id", "name", "account_type", "last_updated", "latest_transaction_id"]
+    list_display = ["id", "name", "account_owner", "account_type", "last_updated", "latest_transaction_id"]
+    list_select_related = ["account_owner"]
+    list_filter = ["account_type", "mortgage"]
+    search_fields = ["name"]
+    autocomplete_fields = ["account_owner"]
 
-class TransactionAdmin(admin.ModelAdmin):
+
+class TransactionAdmin(LargeTableAdmin):
     list_display = ["id", "vendor", "date", "amount", "type", "account", "category", "paid_off"]
+    # Joined into the page query rather than fetched row by row for the FK columns.
+    list_select_related = ["vendor", "account", "category"]
+    # Choice and boolean filters render without querying; related-object filters would list every account.
+    list_filter = ["type", "paid_off", "recurring"]
+    # Drilling down filters on a date range, and the ordering matches the (date, id) index.
+    date_hierarchy = "date"
+    ordering = ["-date", "-id"]
+    search_fields = ["description", "vendor__name"]
+    autocomplete_fields = ["vendor", "account", "category"]
+    raw_id_fields = ["series"]
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        return IndexedDatesQuerySet(self.model, query=queryset.query, using=queryset._db, hints=queryset._hints)
+
+    def get_search_results(self, request, queryset, search_term):
+        # The full-text index instead of a LIKE scan over every description and vendor name.
+        if not search_terms(search_term):
+            return queryset, False
+        return search_transactions(queryset, search_term), False
 
-class CategoryAdmin(admin.ModelAdmin):
+
+class CategoryAdmin(LargeTableAdmin):
     list_display = ["id", "name"]
+    search_fields = ["name"]
+    ordering = ["name"]
+
 
-class VendorAdmin(admin.ModelAdmin):
+class VendorAdmin(LargeTableAdmin):
     list_display = ["id", "name"]
+    search_fields = ["name"]
+    ordering = ["name"]
 
 admin.site.register(Account, AccountAdmin)
 admin.site.register(Transaction, TransactionAdmin)
 admin.site.register(Category, CategoryAdmin)
 admin.site.register(Vendor, VendorAdmin)
-admin.site.register(User, UserAdmin)
\ No newline at end of file
+admin.site.register(User, UserAdmin)
@@ -1,6 +1,15 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_migrate, pre_migrate
 
 
 class AccountsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'accounts'
+
+    def ready(self):
+        from . import database, metrics, search, signals  # noqa: F401
+        pre_migrate.connect(search.drop_triggers, sender=self)
+        post_migrate.connect(search.install, sender=self)
+        connection_created.connect(metrics.install_query_timer)
+        connection_created.connect(database.apply_pragmas)
@@ -0,0 +1,80 @@
+"""
+Async versions of the read endpoints that dominate traffic, for ASGI deployments.
+
+They reuse `TransactionViewSet` for authentication, permissions (`IsAuthenticated`, `IsOwnerOrAdmin`),
+content negotiation, filters, pagination and serialization, so their output matches the router
+endpoints; only the database reads go through the async ORM. Conditional GETs and the response
+cache stay with the sync endpoints.
+"""
+from asgiref.sync import sync_to_async
+from django.contrib.auth.decorators import login_required, permission_required
+from django.shortcuts import aget_object_or_404, render
+from django.views.decorators.http import require_safe
+from rest_framework.response import Response
+
+from .access import accessible_accounts
+from .dashboard import abuild_dashboard
+from .ownership import aowned_account_ids
+from .views import TransactionViewSet
+
+
+@require_safe
+async def transaction_list(request):
+    return await dispatch(TransactionViewSet, 'list', request, list_transactions)
+
+
+@require_safe
+async def transaction_detail(request, pk):
+    return await dispatch(TransactionViewSet, 'retrieve', request, retrieve_transaction, pk=pk)
+
+
+@login_required
+@permission_required('accounts.view_account')
+async def dashboard(request):
+    user = await request.auser()
+    # Access backends may resolve object permissions with queries of their own.
+    accounts = await sync_to_async(accessible_accounts)(user, 'view_account')
+    context = await abuild_dashboard(accounts)
+    # The template reads request.user; hand it the resolved user rather than the lazy sync one.
+    request.user = user
+    return render(request, "accounts/index.html", context)
+
+
+async def dispatch(viewset_class, action, request, handler, **kwargs):
+    """
+    Run `handler(view, request)` the way DRF runs a viewset action: authenticate, check permissions
+    and negotiate the renderer first, and turn any exception into the usual error response.
+    """
+    view = viewset_class(action_map={request.method.lower(): action}, args=(), kwargs=kwargs)
+    request = view.initialize_request(request, **kwargs)
+    view.request = request
+    view.headers = view.default_response_headers
+    try:
+        # Authentication classes and permission checks are synchronous and may query the database.
+        await sync_to_async(view.initial)(request)
+        user = request.user
+        if not (user.is_staff or user.is_superuser):
+            # Loaded now so get_queryset() and the object permission check never query synchronously.
+            await aowned_account_ids(request)
+        response = await handler(view, request)
+    except Exception as exc:
+        response = view.handle_exception(exc)
+    return view.finalize_response(request, response)
+
+
+async def list_transactions(view, request):
+    queryset = view.filter_queryset(view.get_queryset())
+    if view.is_flat():
+        plan = view.get_flat_plan()
+        page = await view.paginator.apaginate_queryset(plan.values(queryset), request, view=view)
+        return view.get_paginated_response(plan.render(page))
+    page = await view.paginator.apaginate_queryset(queryset, request, view=view)
+    return view.get_paginated_response(view.get_serializer(page, many=True).data)
+
+
+async def retrieve_transaction(view, request):
+    instance = await aget_object_or_404(view.filter_queryset(view.get_queryset()), pk=view.kwargs['pk'])
+    view.check_object_permissions(request, instance)
+    if view.is_flat():
+        return Response(view.get_flat_plan().render_instance(instance))
+    return Response(view.get_serializer(instance).data)
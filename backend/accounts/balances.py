@@ -0,0 +1,84 @@
+from django.db import connections
+from django.db.models import Case, F, Sum, When
+from django.db.models.functions import TruncMonth, TruncWeek
+from django.utils.dateparse import parse_date
+
+from .ledger import ZERO, as_decimal, signed_amount_expression
+from .models import Transaction
+
+# Dates are already days; grouping on the column itself lets the index order serve the GROUP BY.
+INTERVALS = {'day': F, 'week': TruncWeek, 'month': TruncMonth}
+MAX_POINTS = 2000
+
+# Running sums over the per-period nets. The NULL period carries everything before the requested
+# range (and undated transactions) into the first point without becoming a point itself. With a
+# point budget, only the last period of every `step` consecutive periods is kept: its running sum
+# is the exact balance at that point, so downsampling loses resolution but never accuracy.
+SERIES_SQL = """
+SELECT period, change FROM (
+    SELECT period,
+        SUM(net) OVER (ORDER BY {carried}, period) AS change,
+        ROW_NUMBER() OVER (PARTITION BY {carried} ORDER BY period) AS position,
+        COUNT(*) OVER (PARTITION BY {carried}) AS periods
+    FROM ({periods}) AS periods
+) AS series
+WHERE period IS NOT NULL AND (position %% ((periods + %s - 1) / %s) = 0 OR position = periods)
+ORDER BY period
+"""
+CARRIED = 'CASE WHEN period IS NULL THEN 0 ELSE 1 END'
+
+
+def period_nets(account, interval, start=None, end=None):
+    """
+    The signed total of the account's transactions per `interval`, as an aggregate queryset.
+    Transactions before `start`, and undated ones, fall into a NULL period.
+    The `(account, date, type, amount)` index covers the whole read.
+    """
+    period = INTERVALS[interval]('date')
+    if start is not None:
+        period = Case(When(date__lt=start, then=None), default=period)
+    queryset = Transaction.objects.filter(account=account)
+    if end is not None:
+        queryset = queryset.exclude(date__gt=end)
+    return (
+        queryset.order_by()
+        .annotate(period=period)
+        .values('period')
+        .annotate(net=Sum(signed_amount_expression()))
+    )
+
+
+def balance_series(account, interval='day', start=None, end=None, points=None):
+    """
+    The account's balance at the end of every `interval` (day, week or month) with transactions,
+    as `(period start, balance)` pairs, computed in one query with window functions. `start` and
+    `end` bound the range; `points` caps the number of pairs by keeping every n-th period.
+    """
+    nets = period_nets(account, interval, start, end)
+    connection = connections[nets.db]
+    sql, params = nets.query.get_compiler(connection=connection).as_sql()
+    step_points = points or MAX_POINTS
+    with connection.cursor() as cursor:
+        cursor.execute(
+            SERIES_SQL.format(carried=CARRIED, periods=sql), [*params, step_points, step_points]
+        )
+        rows = cursor.fetchall()
+
+    opening = opening_balance(account)
+    return [(as_date(period), opening + as_decimal(change)) for period, change in rows]
+
+
+def opening_balance(account):
+    """
+    The balance before any transaction. Accounts created before opening balances were recorded
+    start from their current balance less the ledger, as `ledger.reconcile` assumes.
+    """
+    if account.opening_balance is not None:
+        return account.opening_balance
+    total = Transaction.objects.filter(account=account).aggregate(total=Sum(signed_amount_expression()))['total']
+    return account.current_balance - as_decimal(total or ZERO)
+
+
+def as_date(value):
+    # Raw cursors return dates as text on SQLite.
+    return parse_date(value) if isinstance(value, str) else value
@@ -0,0 +1,115 @@
+from django.db import router, transaction as db_transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from . import ledger, rollups, snapshots
+from .cache import invalidate_users
+from .conditional import record_deletion
+from .ledger import as_decimal
+from .models import Account, Recurrence, Transaction
+
+# Fields a bulk update may change, named as in the API.
+UPDATABLE_FIELDS = ('date', 'vendor', 'description', 'amount', 'type', 'category', 'account', 'paid_off', 'recurring')
+# Most ids one request may list; larger selections should use the filters.
+MAX_IDS = 1000
+
+
+def transaction_groups(queryset):
+    """
+    The transactions of the queryset summed per account, category, vendor, month and type, read
+    with one aggregate query. Each group has the `rollups.ROLLUP_FIELDS` keys, with the month as
+    `date` and the summed `amount`, and the `count` of transactions in it: enough for the ledger
+    and the rollups to undo the group, or to apply it again with some fields changed.
+    """
+    rows = (
+        queryset.order_by()
+        .annotate(month=TruncMonth('date'))
+        .values('account_id', 'category_id', 'vendor_id', 'month', 'type')
+        .annotate(total=Sum('amount'), count=Count('id'))
+    )
+    return [
+        {
+            'account_id': row['account_id'],
+            'category_id': row['category_id'],
+            'vendor_id': row['vendor_id'],
+            'date': row['month'],
+            'type': row['type'],
+            'amount': as_decimal(row['total']),
+            'count': row['count'],
+        }
+        for row in rows
+    ]
+
+
+def patch_group(group, changes):
+    """
+    The group as it stands once `changes` (attribute names to values) is written to its transactions.
+    """
+    group = dict(group)
+    for field in ('account_id', 'category_id', 'vendor_id', 'date', 'type'):
+        if field in changes:
+            group[field] = changes[field]
+    if 'amount' in changes:
+        group['amount'] = as_decimal(changes['amount']) * group['count']
+    return group
+
+
+def attribute_changes(changes):
+    """
+    Map validated field values to model attributes: related objects become their ids.
+    """
+    attributes = {}
+    for name, value in changes.items():
+        field = Transaction._meta.get_field(name)
+        attributes[field.attname] = value.pk if field.is_relation and value is not None else value
+    return attributes
+
+
+def update_transactions(queryset, changes):
+    """
+    Write `changes` (field names to validated values) to every transaction in the queryset with a
+    single UPDATE, bumping their `last_updated`. Balances and rollups are adjusted from one aggregate
+    read beforehand, with one update per affected account and bucket. Returns the number updated.
+    """
+    changes = attribute_changes(changes)
+    with db_transaction.atomic():
+        before = transaction_groups(queryset)
+        if not before:
+            return 0
+        updated = queryset.update(**changes, last_updated=timezone.now())
+        after = [patch_group(group, changes) for group in before]
+        ledger.record_bulk_change(before, after)
+        rollups.record_bulk_change(before, after)
+        owners = owner_ids(before + after)
+        invalidate_users(owners)
+        snapshots.refresh(owners, snapshots.earliest(group['date'] for group in before + after))
+    return updated
+
+
+def delete_transactions(queryset):
+    """
+    Delete every transaction in the queryset with a single DELETE, reversing them on balances and
+    rollups the way `update_transactions` adjusts them. Their recurrence schedules go first.
+    Returns the number deleted.
+    """
+    with db_transaction.atomic():
+        before = transaction_groups(queryset)
+        if not before:
+            return 0
+        Recurrence.objects.filter(transaction__in=queryset).delete()
+        # A collector delete would load every row to send the per-row signals this replaces.
+        deleted = queryset.order_by()._raw_delete(router.db_for_write(Transaction))
+        ledger.record_bulk_change(before, [])
+        rollups.record_bulk_change(before, [])
+        owners = owner_ids(before)
+        for owner_id in owners:
+            record_deletion(Transaction, owner_id)
+        invalidate_users(owners)
+        snapshots.refresh(owners, snapshots.earliest(group['date'] for group in before))
+    return deleted
+
+
+def owner_ids(groups):
+    account_ids = {group['account_id'] for group in groups}
+    return set(Account.objects.filter(pk__in=account_ids).values_list('account_owner', flat=True))
@@ -0,0 +1,166 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_http_date_safe
+
+from .metrics import registry
+from .models import Account
+
+# Response headers replayed on a cache hit.
+CACHED_HEADERS = ('ETag', 'Last-Modified', 'Vary', 'Allow')
+USER_VERSION = 'responses:version:user:%s'
+SHARED_VERSION = 'responses:version:shared'
+ALL_VERSION = 'responses:version:all'
+
+
+class LRUCache(LocMemCache):
+    """
+    A local-memory cache bounded by `MAX_ENTRIES` that evicts exactly the least recently used
+    entries when full, rather than culling a fraction of the cache like `LocMemCache`.
+
+    Like `LocMemCache` it lives in one process; use a shared backend (e.g. `FileBasedCache`)
+    when several worker processes must see each other's invalidations.
+    """
+
+    def _cull(self):
+        # LocMemCache keeps the most recently used entries at the front.
+        while self._cache and len(self._cache) >= self._max_entries:
+            key, _ = self._cache.popitem()
+            self._expire_info.pop(key, None)
+
+
+def get_response_cache():
+    """The cache named by the `RESPONSE_CACHE` setting, or None when response caching is off."""
+    alias = getattr(settings, 'RESPONSE_CACHE', None)
+    return caches[alias] if alias else None
+
+
+def new_version():
+    # Fresh versions are never reused, so an evicted version key can never revive stale entries.
+    return time.time_ns()
+
+
+def bump(cache, keys):
+    """
+    Move the versions on once the current database transaction commits, at once outside one.
+    Bumped before the commit, a concurrent reader could take the new version, still read the
+    old rows and cache them under it until they expire.
+    """
+    def apply():
+        for key in keys:
+            try:
+                cache.incr(key)
+            except ValueError:
+                cache.set(key, new_version(), None)
+
+    transaction.on_commit(apply)
+
+
+def current_versions(cache, keys):
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, new_version(), None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def invalidate_users(user_ids):
+    """
+    Drop the cached responses of these users (and of staff, who see everyone's data) by bumping
+    their versions; entries under old versions are never read again and age out of the cache.
+    """
+    cache = get_response_cache()
+    if cache is None:
+        return
+    user_ids = {user_id for user_id in user_ids if user_id is not None}
+    bump(cache, [USER_VERSION % user_id for user_id in sorted(user_ids)] + [ALL_VERSION])
+
+
+def invalidate_accounts(account_ids):
+    """Drop the cached responses of the owners of these accounts."""
+    if get_response_cache() is None or not account_ids:
+        return
+    invalidate_users(Account.objects.filter(pk__in=account_ids).values_list('account_owner', flat=True))
+
+
+def invalidate_all():
+    """Drop every cached response, e.g. after vendor or category changes or set-based repairs."""
+    cache = get_response_cache()
+    if cache is None:
+        return
+    bump(cache, [SHARED_VERSION, ALL_VERSION])
+
+
+class CachedResponseMixin:
+    """
+    Serve list and retrieve from the response cache, keyed by user, path, query string and
+    media type under the user's current version. A hit costs no queries and no serialization.
+
+    Entries are never deleted on writes: the signal handlers bump the owners' versions instead
+    (see `invalidate_users`). Hits and misses are counted on `/metrics`.
+    """
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, lambda: super(CachedResponseMixin, self).list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            request, lambda: super(CachedResponseMixin, self).retrieve(request, *args, **kwargs)
+        )
+
+    def cached_response(self, request, render):
+        cache = get_response_cache()
+        renderer = getattr(request, 'accepted_renderer', None)
+        # Browsable API pages embed per-session forms and CSRF tokens; only cache data formats.
+        if cache is None or getattr(renderer, 'format', None) == 'api':
+            return render()
+
+        self._response_cache_key = key = self.response_cache_key(cache, request)
+        entry = cache.get(key)
+        if entry is None:
+            registry.increment('budget_response_cache_misses_total')
+            return render()
+
+        registry.increment('budget_response_cache_hits_total')
+        self._response_cache_key = None
+        content, content_type, headers = entry
+        last_modified = headers.get('Last-Modified')
+        response = get_conditional_response(
+            request, etag=headers.get('ETag'),
+            last_modified=parse_http_date_safe(last_modified) if last_modified else None,
+        )
+        if response is None:
+            response = HttpResponse(content, content_type=content_type)
+        for header, value in headers.items():
+            response[header] = value
+        return response
+
+    def response_cache_key(self, cache, request):
+        user = request.user
+        if user.is_staff or user.is_superuser:
+            versions = current_versions(cache, [ALL_VERSION])
+        else:
+            versions = current_versions(cache, [USER_VERSION % user.pk, SHARED_VERSION])
+        digest = hashlib.md5(
+            repr((request.get_full_path(), request.accepted_renderer.media_type)).encode(), usedforsecurity=False
+        ).hexdigest()
+        return 'responses:%s:%s:%s' % (user.pk, '.'.join(map(str, versions)), digest)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        key = getattr(self, '_response_cache_key', None)
+        if key is not None and response.status_code == 200:
+            response.add_post_render_callback(lambda rendered: store_response(key, rendered))
+        return response
+
+
+def store_response(key, response):
+    headers = {header: response[header] for header in CACHED_HEADERS if response.has_header(header)}
+    get_response_cache().set(key, (response.content, response['Content-Type'], headers))
@@ -0,0 +1,107 @@
+import hashlib
+
+from django.db import IntegrityError, transaction as db_transaction
+from django.db.models import Count, Max, Q, Subquery
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from .models import Account, DeletionMark
+
+
+def record_deletion(model, user_id=None):
+    """
+    Note that rows of `model` owned by `user_id` (or shared rows, with no user) were just deleted.
+    """
+    key = {'model': model._meta.label_lower, 'user_id': user_id}
+    now = timezone.now()
+    if DeletionMark.objects.filter(**key).update(deleted_at=now):
+        return
+    try:
+        with db_transaction.atomic():
+            DeletionMark.objects.create(deleted_at=now, **key)
+    except IntegrityError:
+        # Created concurrently by another request; ours is at least as recent.
+        DeletionMark.objects.filter(**key).update(deleted_at=now)
+
+
+def account_owner_id(account_id):
+    return Account.objects.filter(pk=account_id).values_list('account_owner', flat=True).first()
+
+
+class ConditionalGetMixin:
+    """
+    Answer list and retrieve requests with `ETag` and `Last-Modified` validators, and with
+    304 Not Modified when the client's copy is current.
+
+    A list's validators come from one aggregate over the filtered queryset (row count and
+    `MAX(last_updated)`) plus the latest deletion mark of `deletion_models`, so a 304 costs neither
+    the page query nor any serialization. An object's come from its `last_updated` plus the latest
+    deletion mark of the other `deletion_models`, since deleting a related row nulls its foreign
+    keys with a queryset update that leaves `last_updated` alone. The ETag also covers the user,
+    the full path and the negotiated media type, so every query and format gets its own validator.
+    """
+    # Models whose deletions change this endpoint's output; the viewset's own model by default.
+    deletion_models = ()
+
+    def list(self, request, *args, **kwargs):
+        state, last_modified = self.list_state(self.filter_queryset(self.get_queryset()))
+        return self.conditional_response(
+            request, state, last_modified, lambda: super(ConditionalGetMixin, self).list(request, *args, **kwargs)
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        # Deleting the object itself leaves nothing to validate, so only the related models count.
+        related = [model for model in self.deletion_models if not isinstance(instance, model)]
+        deleted = self.deletion_marks(related).aggregate(deleted=Max('deleted_at'))['deleted'] if related else None
+        modified = max((value for value in (instance.last_updated, deleted) if value is not None), default=None)
+        return self.conditional_response(
+            request, (instance.pk, instance.last_updated, deleted), modified,
+            lambda: super(ConditionalGetMixin, self).retrieve(request, *args, **kwargs),
+        )
+
+    def get_object(self):
+        # retrieve() reads the object for its validators; the serializing path reuses it.
+        if not hasattr(self, '_object'):
+            self._object = super().get_object()
+        return self._object
+
+    def list_state(self, queryset):
+        """
+        `(count, MAX(last_updated), latest deletion)` for the queryset, read in one query,
+        and the most recent of the two timestamps.
+        """
+        marks = self.deletion_marks(self.deletion_models or [queryset.model])
+        state = queryset.order_by().aggregate(
+            count=Count('pk'),
+            updated=Max('last_updated'),
+            # Empty lists read no mark, which is fine: a deletion cannot change an empty list.
+            deleted=Max(Subquery(marks.order_by('-deleted_at').values('deleted_at')[:1])),
+        )
+        modified = max((value for value in (state['updated'], state['deleted']) if value is not None), default=None)
+        return (state['count'], state['updated'], state['deleted']), modified
+
+    def deletion_marks(self, models):
+        """The deletion marks of `models` the requesting user's responses depend on."""
+        marks = DeletionMark.objects.filter(model__in=[model._meta.label_lower for model in models])
+        user = self.request.user
+        if not (user.is_staff or user.is_superuser):
+            marks = marks.filter(Q(user=user) | Q(user__isnull=True))
+        return marks
+
+    def conditional_response(self, request, state, last_modified, render):
+        etag = self.make_etag(request, state)
+        timestamp = int(last_modified.timestamp()) if last_modified is not None else None
+        response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+        if response is None:
+            response = render()
+        response['ETag'] = etag
+        if timestamp is not None:
+            response['Last-Modified'] = http_date(timestamp)
+        return response
+
+    def make_etag(self, request, state):
+        renderer = getattr(request, 'accepted_renderer', None)
+        key = repr((request.user.pk, request.get_full_path(), getattr(renderer, 'media_type', None), state))
+        return 'W/' + quote_etag(hashlib.md5(key.encode(), usedforsecurity=False).hexdigest())
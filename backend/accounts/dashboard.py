@@ -0,0 +1,88 @@
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+
+from .models import Account, Transaction
+
+# Number of most recent transactions shown under each account on the dashboard.
+RECENT_TRANSACTION_LIMIT = 10
+
+
+def build_dashboard(accounts, recent_limit=RECENT_TRANSACTION_LIMIT):
+    """
+    Build the dashboard context for the given account queryset.
+
+    Runs a fixed number of queries regardless of how many accounts or transactions exist:
+    one for the accounts and one for the recent transaction window. The per-type totals are
+    summed from the accounts already loaded.
+    """
+    account_list = list(accounts.order_by('id'))
+    recent = recent_transactions_by_account(displayed_account_ids(account_list), recent_limit)
+    return dashboard_context(account_list, account_totals(account_list), recent)
+
+
+async def abuild_dashboard(accounts, recent_limit=RECENT_TRANSACTION_LIMIT):
+    """`build_dashboard` running the same two queries with the async ORM."""
+    account_list = [account async for account in accounts.order_by('id')]
+    account_ids = displayed_account_ids(account_list)
+    recent = {}
+    if account_ids:
+        async for transaction in recent_transactions(account_ids, recent_limit):
+            recent.setdefault(transaction.account_id, []).append(transaction)
+    return dashboard_context(account_list, account_totals(account_list), recent)
+
+
+def account_totals(account_list):
+    """Current balance totals per account type, mortgages excluded."""
+    totals = {}
+    for account in account_list:
+        if not account.mortgage:
+            totals[account.account_type] = totals.get(account.account_type, 0) + account.current_balance
+    return totals
+
+
+def displayed_account_ids(account_list):
+    return [account.id for account in account_list if not account.mortgage]
+
+
+def dashboard_context(account_list, totals, recent):
+    displayed = [account for account in account_list if not account.mortgage]
+    for account in displayed:
+        account.recent_transactions = recent.get(account.id, [])
+
+    context = {"mortgage": [account for account in account_list if account.mortgage]}
+    for type in Account.AccountType:
+        account_name = type.name.lower()
+        context[account_name + "_accounts"] = [account for account in displayed if account.account_type == type]
+        context["total_" + account_name] = totals.get(type.value, 0)
+    return context
+
+
+def recent_transactions_by_account(account_ids, limit=RECENT_TRANSACTION_LIMIT):
+    """
+    Return the newest `limit` transactions of each account, keyed by account id,
+    with vendor and category joined in.
+    """
+    if not account_ids:
+        return {}
+
+    recent = {}
+    for transaction in recent_transactions(account_ids, limit):
+        recent.setdefault(transaction.account_id, []).append(transaction)
+    return recent
+
+
+def recent_transactions(account_ids, limit=RECENT_TRANSACTION_LIMIT):
+    """The newest `limit` transactions of each account, ordered by account and recency."""
+    return (
+        Transaction.objects.filter(account_id__in=account_ids)
+        .select_related('vendor', 'category')
+        .annotate(
+            row_number=Window(
+                RowNumber(),
+                partition_by=F('account_id'),
+                order_by=[F('date').desc(nulls_last=True), F('id').desc()],
+            )
+        )
+        .filter(row_number__lte=limit)
+        .order_by('account_id', 'row_number')
+    )
@@ -0,0 +1,110 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# The read-only alias of the primary database (see DATABASES).
+REPLICA_DB_ALIAS = 'replica'
+
+
+class WriteTracker:
+    """Whether the current request (or `track_writes` block) has written to the primary."""
+
+    def __init__(self):
+        self.wrote = False
+
+
+# A context variable rather than a thread-local, so async views and the ORM threads they use share it.
+current_tracker = ContextVar('current_tracker', default=None)
+
+
+@contextmanager
+def track_writes():
+    """
+    Scope read-your-writes to a block: once it writes, its later reads go to the primary.
+    Used per request by `ReadYourWritesMiddleware`; management commands may use it too.
+    """
+    token = current_tracker.set(WriteTracker())
+    try:
+        yield
+    finally:
+        current_tracker.reset(token)
+
+
+class PrimaryReplicaRouter:
+    """
+    Send writes to the primary and reads to the read-only replica alias.
+
+    Reads go to the primary instead inside a transaction on the primary, which must see its own
+    uncommitted writes, and, with `READ_YOUR_WRITES`, for the rest of a request that has written,
+    so a replica that lags behind never hides a request's own changes from it.
+    """
+
+    def db_for_read(self, model, **hints):
+        if REPLICA_DB_ALIAS not in connections.settings or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        tracker = current_tracker.get()
+        if tracker is not None and tracker.wrote and getattr(settings, 'READ_YOUR_WRITES', True):
+            return DEFAULT_DB_ALIAS
+        return REPLICA_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        tracker = current_tracker.get()
+        if tracker is not None:
+            tracker.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases are the same database.
+        aliases = {DEFAULT_DB_ALIAS, REPLICA_DB_ALIAS}
+        return obj1._state.db in aliases and obj2._state.db in aliases or None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReadYourWritesMiddleware:
+    """
+    Give every request its own `track_writes` scope, so the router pins its reads to the primary
+    after its first write.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        with track_writes():
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        with track_writes():
+            return await self.get_response(request)
+
+
+def apply_pragmas(sender, connection, **kwargs):
+    """
+    `connection_created` receiver running the `SQLITE_PRAGMAS` setting on every new SQLite connection.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = getattr(settings, 'SQLITE_PRAGMAS', {})
+    read_only = is_read_only(connection)
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            # The journal mode is stored in the file; only a writable connection can change it.
+            if name == 'journal_mode' and read_only:
+                continue
+            cursor.execute('PRAGMA %s = %s' % (name, value))
+
+
+def is_read_only(connection):
+    return 'mode=ro' in str(connection.settings_dict['NAME'])
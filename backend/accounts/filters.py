@@ -0,0 +1,97 @@
+from decimal import Decimal, InvalidOperation
+
+from django.utils.dateparse import parse_date
+from rest_framework import serializers
+from rest_framework.filters import BaseFilterBackend
+
+from .models import Transaction
+
+TRUE_VALUES = {'true', '1', 'yes'}
+FALSE_VALUES = {'false', '0', 'no'}
+PARAMS = ('start', 'end', 'account', 'category', 'vendor', 'type', 'paid_off', 'recurring', 'min_amount', 'max_amount')
+
+
+class TransactionFilter(BaseFilterBackend):
+    """
+    Narrow the transaction list with query parameters:
+
+    - `start`, `end`: inclusive date range (YYYY-MM-DD)
+    - `account`, `category`, `vendor`: one id or a comma-separated list of ids
+    - `type`: `INC` or `DEC`
+    - `paid_off`, `recurring`: `true` or `false`
+    - `min_amount`, `max_amount`: inclusive amount range
+
+    Every filter is combined with the owned-account restriction, so the `(account, ...)` indexes
+    on `Transaction` serve each of them with an index search.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        params = request.query_params
+        filters = {}
+        if params.get('start'):
+            filters['date__gte'] = parse_date_param(params, 'start')
+        if params.get('end'):
+            filters['date__lte'] = parse_date_param(params, 'end')
+        for field in ('account', 'category', 'vendor'):
+            if params.get(field):
+                filters[field + '_id__in'] = parse_ids_param(params, field)
+        if params.get('type'):
+            if params['type'] not in Transaction.TransactionType.values:
+                raise serializers.ValidationError({'type': ['"%s" is not a valid choice.' % params['type']]})
+            filters['type'] = params['type']
+        for field in ('paid_off', 'recurring'):
+            if params.get(field):
+                filters[field] = parse_boolean_param(params, field)
+        if params.get('min_amount'):
+            filters['amount__gte'] = parse_amount_param(params, 'min_amount')
+        if params.get('max_amount'):
+            filters['amount__lte'] = parse_amount_param(params, 'max_amount')
+        return queryset.filter(**filters) if filters else queryset
+
+
+def is_filtered(request):
+    """Whether the request narrows the transactions with any of the filter parameters."""
+    return any(request.query_params.get(param) for param in PARAMS)
+
+
+def parse_date_param(params, param):
+    try:
+        value = parse_date(params[param])
+    except ValueError:
+        value = None
+    if value is None:
+        raise serializers.ValidationError({param: ['Date has wrong format. Use YYYY-MM-DD.']})
+    return value
+
+
+def parse_ids_param(params, param):
+    values = params[param].split(',')
+    if not all(value.strip().isdigit() for value in values):
+        raise serializers.ValidationError({param: ['Expected an id or a comma-separated list of ids.']})
+    return [int(value) for value in values]
+
+
+def parse_boolean_param(params, param):
+    value = params[param].lower()
+    if value in TRUE_VALUES:
+        return True
+    if value in FALSE_VALUES:
+        return False
+    raise serializers.ValidationError({param: ['Must be "true" or "false".']})
+
+
+def parse_count_param(params, param, maximum):
+    value = params[param]
+    if not value.isdigit() or not 1 <= int(value) <= maximum:
+        raise serializers.ValidationError({param: ['Ensure this value is a whole number from 1 to %d.' % maximum]})
+    return int(value)
+
+
+def parse_amount_param(params, param):
+    try:
+        value = Decimal(params[param])
+    except InvalidOperation:
+        value = None
+    if value is None or not value.is_finite():
+        raise serializers.ValidationError({param: ['A valid number is required.']})
+    return value
@@ -0,0 +1,85 @@
+from rest_framework import relations, serializers
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+# Field types whose database values need the serializer's formatting (decimal strings, ISO dates).
+CONVERTED_FIELDS = (serializers.DecimalField, serializers.DateTimeField, serializers.DateField)
+
+
+class FlatJSONRenderer(JSONRenderer):
+    """
+    JSON for the compact representation, selected with `?format=flat`
+    or `Accept: application/vnd.budget.flat+json`.
+    """
+    media_type = 'application/vnd.budget.flat+json'
+    format = 'flat'
+
+
+class FlatPlan:
+    """
+    A precompiled list of `(output key, column, converter)` entries for a model serializer.
+
+    Rows are read with `values()` and turned into the serializer's output directly, skipping
+    model instantiation and hyperlink building: foreign keys are emitted as ids and `url` is omitted.
+    """
+
+    def __init__(self, serializer):
+        self.entries = []
+        model = serializer.Meta.model
+        for name, field in serializer.fields.items():
+            if isinstance(field, relations.HyperlinkedIdentityField):
+                continue
+            model_field = model._meta.get_field(field.source)
+            converter = field.to_representation if isinstance(field, CONVERTED_FIELDS) else None
+            self.entries.append((name, model_field.attname, converter))
+        self.columns = [column for _, column, _ in self.entries]
+
+    def values(self, queryset):
+        return queryset.values(*self.columns)
+
+    def render_row(self, row):
+        return {
+            key: row[column] if converter is None or row[column] is None else converter(row[column])
+            for key, column, converter in self.entries
+        }
+
+    def render(self, rows):
+        render_row = self.render_row
+        return [render_row(row) for row in rows]
+
+    def render_instance(self, instance):
+        return self.render_row({column: getattr(instance, column) for column in self.columns})
+
+
+class FlatSerializationMixin:
+    """
+    Serve list and retrieve through a `FlatPlan` when the flat format is requested.
+    """
+    flat_plans = {}
+
+    def is_flat(self):
+        return getattr(self.request, 'accepted_renderer', None) is not None and \
+            self.request.accepted_renderer.format == FlatJSONRenderer.format
+
+    def get_flat_plan(self):
+        # Plans depend only on the serializer class, so build each one once per process.
+        serializer_class = self.get_serializer_class()
+        if serializer_class not in self.flat_plans:
+            self.flat_plans[serializer_class] = FlatPlan(serializer_class(context=self.get_serializer_context()))
+        return self.flat_plans[serializer_class]
+
+    def list(self, request, *args, **kwargs):
+        if not self.is_flat():
+            return super().list(request, *args, **kwargs)
+
+        plan = self.get_flat_plan()
+        rows = plan.values(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(plan.render(page))
+        return Response(plan.render(rows))
+
+    def retrieve(self, request, *args, **kwargs):
+        if not self.is_flat():
+            return super().retrieve(request, *args, **kwargs)
+        return Response(self.get_flat_plan().render_instance(self.get_object()))
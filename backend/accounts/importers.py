@@ -0,0 +1,304 @@
+import csv
+import io
+import re
+from datetime import date as Date
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction as db_transaction
+from django.utils.dateparse import parse_date
+
+from . import ledger, rollups, snapshots
+from .cache import invalidate_users
+from .models import Account, Category, Transaction, Vendor
+from .rules import matcher_for
+from .vendors import vendor_ids
+
+CSV = 'csv'
+OFX = 'ofx'
+FORMATS = (CSV, OFX)
+
+DESCRIPTION_LENGTH = Transaction._meta.get_field('description').max_length
+NAME_LENGTH = Vendor._meta.get_field('name').max_length
+MAX_AMOUNT = Decimal(10) ** 8
+CENT = Decimal('0.01')
+TRUE_VALUES = {'1', 'true', 't', 'yes', 'y'}
+
+
+class UnreadableFile(ValueError):
+    """
+    The file is not text the parser can read, such as bytes that are not UTF-8 or a malformed CSV.
+    """
+
+
+def detect_format(filename, requested=None):
+    """
+    Resolve the import format from an explicit request or the file extension.
+    """
+    if requested:
+        return requested.lower()
+    if filename and filename.lower().endswith(('.ofx', '.qfx')):
+        return OFX
+    return CSV
+
+
+def parse_csv(stream):
+    """
+    Yield one dict per CSV row. The first line must be a header naming the columns:
+    date, description, amount and optionally type, vendor, category, account, paid_off, recurring.
+    """
+    for row in csv.DictReader(stream):
+        yield {key.strip().lower(): (value or '').strip() for key, value in row.items() if key}
+
+
+OFX_TAG = re.compile(r'<(/?)([A-Z0-9.]+)>([^<\r\n]*)', re.IGNORECASE)
+
+
+def parse_ofx(stream):
+    """
+    Yield one dict per <STMTTRN> block of an OFX/QFX statement, reading the file line by line.
+    Handles both SGML (unclosed leaf tags) and XML flavoured files.
+    """
+    current = None
+    for line in stream:
+        for closing, tag, value in OFX_TAG.findall(line):
+            tag = tag.upper()
+            if tag == 'STMTTRN':
+                if closing:
+                    if current is not None:
+                        yield ofx_row(current)
+                    current = None
+                else:
+                    current = {}
+            elif current is not None and not closing:
+                current[tag] = value.strip()
+
+
+def ofx_row(fields):
+    amount = fields.get('TRNAMT', '')
+    return {
+        'date': fields.get('DTPOSTED', '')[:8],
+        'description': fields.get('MEMO') or fields.get('NAME', ''),
+        'amount': amount,
+        'vendor': fields.get('NAME', ''),
+    }
+
+
+def parse_amount(value):
+    amount = Decimal(value.replace(',', '').replace('$', '')).quantize(CENT)
+    if not amount.is_finite() or abs(amount) >= MAX_AMOUNT:
+        raise InvalidOperation
+    return amount
+
+
+def parse_row_date(value):
+    if not value:
+        return None
+    if len(value) == 8 and value.isdigit():
+        return Date(int(value[:4]), int(value[4:6]), int(value[6:]))
+    parsed = parse_date(value)
+    if parsed is None:
+        raise ValueError
+    return parsed
+
+
+class TransactionImporter:
+    """
+    Bulk-load parsed rows as transactions for one user.
+
+    Vendors (by normalized name) and categories are resolved through a cache shared by the whole
+    import, and rows without them get them from the account owner's rules, compiled once per import.
+    Ownership is checked once per account and rows are inserted with chunked `bulk_create` inside a
+    single database transaction, with balances updated once per account and chunk.
+    Invalid rows are skipped and reported.
+    """
+
+    def __init__(self, user, default_account=None, batch_size=1000):
+        self.user = user
+        self.default_account = default_account
+        self.batch_size = batch_size
+        self.vendors = {}
+        self.categories = {}
+        self.accounts = {}
+        self.owners = {}
+        self.matchers = {}
+        self.created = 0
+        self.errors = []
+        self.dates = set()
+
+    def run(self, rows):
+        with db_transaction.atomic():
+            batch = []
+            for index, row in enumerate(rows, start=1):
+                parsed = self.parse_row(index, row)
+                if parsed is not None:
+                    batch.append(parsed)
+                if len(batch) >= self.batch_size:
+                    self.flush(batch)
+                    batch = []
+            if batch:
+                self.flush(batch)
+            if self.created:
+                snapshots.refresh(self.owners.values(), snapshots.earliest(self.dates))
+        return self.report()
+
+    def report(self):
+        return {'created': self.created, 'failed': len(self.errors), 'errors': self.errors}
+
+    def parse_row(self, index, row):
+        errors = {}
+        fields = {'row': index}
+
+        try:
+            amount = parse_amount(row.get('amount', ''))
+        except (InvalidOperation, ValueError):
+            errors['amount'] = 'A valid number is required.'
+            amount = None
+
+        type = row.get('type', '').upper()
+        if type and type not in Transaction.TransactionType.values:
+            errors['type'] = '"%s" is not a valid choice.' % row.get('type')
+        elif amount is not None:
+            if not type:
+                type = Transaction.TransactionType.DECREASE if amount < 0 else Transaction.TransactionType.INCREASE
+            fields['amount'] = abs(amount)
+            fields['type'] = type
+
+        try:
+            fields['date'] = parse_row_date(row.get('date', ''))
+        except ValueError:
+            errors['date'] = 'Date has wrong format. Use YYYY-MM-DD.'
+
+        description = row.get('description', '')
+        if not description:
+            errors['description'] = 'This field may not be blank.'
+        fields['description'] = description[:DESCRIPTION_LENGTH]
+
+        account_id = row.get('account') or self.default_account
+        if not account_id:
+            errors['account'] = 'This field is required.'
+        else:
+            account_id = str(account_id).rstrip('/').split('/')[-1]
+            error = self.check_account(account_id)
+            if error:
+                errors['account'] = error
+            else:
+                fields['account_id'] = int(account_id)
+
+        if errors:
+            self.errors.append({'row': index, 'errors': errors})
+            return None
+
+        fields['vendor'] = row.get('vendor', '')[:NAME_LENGTH]
+        fields['category'] = row.get('category', '')[:NAME_LENGTH]
+        fields['paid_off'] = row.get('paid_off', '').lower() in TRUE_VALUES
+        fields['recurring'] = row.get('recurring', '').lower() in TRUE_VALUES
+        return fields
+
+    def check_account(self, account_id):
+        """
+        Return an error message if the user may not import into the account, checking each account once.
+        """
+        if account_id not in self.accounts:
+            if not account_id.isdigit():
+                self.accounts[account_id] = 'Invalid pk "%s" - object does not exist.' % account_id
+            else:
+                account = Account.objects.filter(id=account_id).values('account_owner').first()
+                if account is None:
+                    self.accounts[account_id] = 'Invalid pk "%s" - object does not exist.' % account_id
+                elif account['account_owner'] != self.user.id and not (self.user.is_staff or self.user.is_superuser):
+                    self.accounts[account_id] = 'You do not have permission to import into this account.'
+                else:
+                    self.accounts[account_id] = None
+                    self.owners[int(account_id)] = account['account_owner']
+        return self.accounts[account_id]
+
+    def resolve(self, model, cache, names):
+        """
+        Map names to ids, loading the unseen ones in one query and creating any that are missing.
+        """
+        missing = {name for name in names if name and name not in cache}
+        if missing:
+            for pk, name in model.objects.filter(name__in=missing).order_by('-id').values_list('id', 'name'):
+                cache[name] = pk
+            new = [model(name=name) for name in missing if name not in cache]
+            if new:
+                model.objects.bulk_create(new)
+                for pk, name in model.objects.filter(name__in=[obj.name for obj in new]).values_list('id', 'name'):
+                    cache.setdefault(name, pk)
+
+    def apply_rules(self, fields):
+        """
+        Fill in the row's missing vendor and category ids from the rules of the account's owner.
+        """
+        owner_id = self.owners[fields['account_id']]
+        if owner_id is None or fields['vendor_id'] and fields['category_id']:
+            return
+        if owner_id not in self.matchers:
+            self.matchers[owner_id] = matcher_for(owner_id)
+        vendor_id, category_id = self.matchers[owner_id].match(
+            fields['description'], fields['amount'], fields['account_id']
+        )
+        fields['vendor_id'] = fields['vendor_id'] or vendor_id
+        fields['category_id'] = fields['category_id'] or category_id
+
+    def resolve_vendors(self, names):
+        """
+        Map names to vendor ids by normalized name, so "AMAZON" and "Amazon.com" rows share one
+        vendor, creating the missing vendors in one insert.
+        """
+        # In row order, so a new vendor takes its name from the first row naming it.
+        missing = [name for name in dict.fromkeys(names) if name and name not in self.vendors]
+        if missing:
+            self.vendors.update(vendor_ids(missing))
+
+    def flush(self, batch):
+        self.resolve_vendors([fields['vendor'] for fields in batch])
+        self.resolve(Category, self.categories, [fields['category'] for fields in batch])
+        for fields in batch:
+            fields['vendor_id'] = self.vendors.get(fields['vendor'])
+            fields['category_id'] = self.categories.get(fields['category'])
+            self.apply_rules(fields)
+        transactions = Transaction.objects.bulk_create(
+            [
+                Transaction(
+                    vendor_id=fields['vendor_id'],
+                    category_id=fields['category_id'],
+                    description=fields['description'],
+                    date=fields['date'],
+                    amount=fields['amount'],
+                    type=fields['type'],
+                    account_id=fields['account_id'],
+                    paid_off=fields['paid_off'],
+                    recurring=fields['recurring'],
+                )
+                for fields in batch
+            ],
+            batch_size=self.batch_size,
+        )
+        ledger.record_bulk_create(transactions)
+        rollups.record_bulk_create(transactions, self.owners)
+        invalidate_users({self.owners[fields['account_id']] for fields in batch})
+        self.dates.update(fields['date'] for fields in batch)
+        self.created += len(batch)
+
+
+def import_transactions(user, stream, format=CSV, default_account=None, batch_size=1000):
+    """
+    Import a text stream of CSV or OFX data for the user and return the per-row report.
+    The import is all or nothing when the file itself cannot be read: its rows are rolled back
+    and `UnreadableFile` is raised.
+    """
+    parser = parse_ofx if format == OFX else parse_csv
+    try:
+        return TransactionImporter(user, default_account, batch_size).run(parser(stream))
+    except UnicodeDecodeError:
+        raise UnreadableFile("The file is not UTF-8 encoded text.")
+    except csv.Error as error:
+        raise UnreadableFile("The file is not valid CSV: %s." % error)
+
+
+def text_stream(binary):
+    """
+    Wrap an uploaded (binary) file so it can be parsed line by line without reading it into memory.
+    """
+    return io.TextIOWrapper(binary, encoding='utf-8-sig', newline='')
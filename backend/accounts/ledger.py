@@ -0,0 +1,191 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db.models import Case, DecimalField, F, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from .cache import invalidate_all
+from .models import Account, Transaction
+
+ZERO = Decimal('0.00')
+CENT = Decimal('0.01')
+LEDGER_FIELDS = ('account_id', 'amount', 'type')
+
+
+def signed_amount(type, amount):
+    """
+    The effect of a transaction on its account's balance: INC adds, DEC subtracts.
+    """
+    return amount if type == Transaction.TransactionType.INCREASE else -amount
+
+
+def as_decimal(amount):
+    """
+    Amounts assigned by hand may be floats or strings; the ledger always works in cents.
+    """
+    return Decimal(str(amount)).quantize(CENT)
+
+
+def signed_amount_expression(prefix=''):
+    """
+    Database-side equivalent of `signed_amount`, for aggregates over transactions.
+    """
+    return Case(
+        When(**{prefix + 'type': Transaction.TransactionType.INCREASE}, then=F(prefix + 'amount')),
+        default=-F(prefix + 'amount'),
+        output_field=DecimalField(max_digits=12, decimal_places=2),
+    )
+
+
+def latest_transaction_subquery():
+    return Subquery(
+        Transaction.objects.filter(account=OuterRef('pk')).order_by('-id').values('id')[:1]
+    )
+
+
+def original_values(instance, fields=LEDGER_FIELDS):
+    """
+    The values of `fields` as currently stored for the instance, or None for a new row.
+    Must be called inside the write's database transaction: the row is re-read and locked there,
+    not taken from when the instance was loaded, so two overlapping edits of one transaction each
+    reverse what the other left rather than both reversing the same old amount.
+    """
+    if instance.pk is None:
+        return None
+    return Transaction.objects.select_for_update().filter(pk=instance.pk).values(*fields).first()
+
+
+def apply_deltas(deltas, latest=None):
+    """
+    Add signed amounts to account balances with one `F()` update per account.
+    `latest` maps account ids to a newly written transaction id to record as latest.
+    """
+    latest = latest or {}
+    now = timezone.now()
+    for account_id in set(deltas) | set(latest):
+        changes = {'last_updated': now}
+        delta = deltas.get(account_id, ZERO)
+        if delta:
+            changes['current_balance'] = F('current_balance') + delta
+        if account_id in latest:
+            changes['latest_transaction_id'] = Greatest(Coalesce('latest_transaction_id', 0), Value(latest[account_id]))
+        Account.objects.filter(pk=account_id).update(**changes)
+
+
+def record_save(instance, original):
+    """
+    Apply a saved transaction to the ledger, given its values before the save.
+    Moving a transaction between accounts reverses it on the old account and applies it on the new one.
+    """
+    deltas = defaultdict(Decimal)
+    deltas[instance.account_id] += signed_amount(instance.type, as_decimal(instance.amount))
+    if original is None:
+        apply_deltas(deltas, {instance.account_id: instance.pk})
+        return
+
+    deltas[original['account_id']] -= signed_amount(original['type'], original['amount'])
+    moved = original['account_id'] != instance.account_id
+    apply_deltas(
+        {account_id: delta for account_id, delta in deltas.items() if delta},
+        {instance.account_id: instance.pk} if moved else None,
+    )
+    if moved:
+        Account.objects.filter(pk=original['account_id']).update(
+            latest_transaction_id=latest_transaction_subquery(), last_updated=timezone.now()
+        )
+
+
+def record_delete(instance, original):
+    """
+    Reverse a deleted transaction on its account and re-point `latest_transaction_id` if it was the latest.
+    """
+    Account.objects.filter(pk=original['account_id']).update(
+        current_balance=F('current_balance') - signed_amount(original['type'], original['amount']),
+        latest_transaction_id=latest_transaction_subquery(),
+        last_updated=timezone.now(),
+    )
+
+
+def record_bulk_create(transactions):
+    """
+    Apply transactions inserted with `bulk_create` (which sends no signals) with one update per account.
+    """
+    deltas = defaultdict(Decimal)
+    latest = {}
+    for transaction in transactions:
+        deltas[transaction.account_id] += signed_amount(transaction.type, as_decimal(transaction.amount))
+        if transaction.pk is not None:
+            latest[transaction.account_id] = max(transaction.pk, latest.get(transaction.account_id, 0))
+    apply_deltas(deltas, latest)
+
+    missing_ids = {transaction.account_id for transaction in transactions if transaction.pk is None}
+    if missing_ids:
+        Account.objects.filter(pk__in=missing_ids).update(
+            latest_transaction_id=latest_transaction_subquery(), last_updated=timezone.now()
+        )
+
+
+def record_bulk_change(before, after):
+    """
+    Apply a set-based update or delete of transactions with one update per account, given the
+    `(account_id, type, amount)` groups it changed as before and after it (nothing after a delete).
+    Accounts that lost or gained transactions have their latest transaction id re-pointed.
+    """
+    deltas = defaultdict(Decimal)
+    for group in before:
+        deltas[group['account_id']] -= signed_amount(group['type'], as_decimal(group['amount']))
+    for group in after:
+        deltas[group['account_id']] += signed_amount(group['type'], as_decimal(group['amount']))
+    apply_deltas({account_id: delta for account_id, delta in deltas.items() if delta})
+
+    before_ids = {group['account_id'] for group in before}
+    after_ids = {group['account_id'] for group in after}
+    if before_ids != after_ids:
+        Account.objects.filter(pk__in=before_ids | after_ids).update(
+            latest_transaction_id=latest_transaction_subquery(), last_updated=timezone.now()
+        )
+
+
+def ledger_balances():
+    """
+    Annotate every account with the balance implied by its opening balance and transactions,
+    computed in a single aggregate query.
+    """
+    return Account.objects.annotate(
+        expected_balance=Coalesce('opening_balance', ZERO) + Coalesce(
+            Sum(signed_amount_expression('transaction__')), ZERO
+        ),
+    ).order_by('id')
+
+
+def reconcile(fix=False):
+    """
+    Compare every account's stored balance with the ledger and return the drifted accounts as
+    `(account, stored balance, expected balance)`. With `fix`, rewrite every balance and latest
+    transaction id from the ledger in one set-based update. Accounts created before opening
+    balances were recorded adopt their current balance as the starting point.
+    """
+    drift = [
+        (account, account.current_balance, as_decimal(account.expected_balance))
+        for account in ledger_balances()
+        if account.opening_balance is not None and account.current_balance != account.expected_balance
+    ]
+    if fix:
+        ledger_sum = Subquery(
+            Transaction.objects.filter(account=OuterRef('pk'))
+            .order_by()
+            .values('account')
+            .annotate(total=Sum(signed_amount_expression()))
+            .values('total')
+        )
+        Account.objects.filter(opening_balance__isnull=True).update(
+            opening_balance=Coalesce('opening_balance', F('current_balance') - Coalesce(ledger_sum, ZERO)),
+        )
+        Account.objects.update(
+            current_balance=Coalesce('opening_balance', ZERO) + Coalesce(ledger_sum, ZERO),
+            latest_transaction_id=latest_transaction_subquery(),
+            last_updated=timezone.now(),
+        )
+        invalidate_all()
+    return drift
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from accounts.models import Rule
+from accounts.rules import reapply_rules
+
+
+class Command(BaseCommand):
+    help = (
+        "Run users' categorization rules over all their transactions, assigning the vendor and "
+        "category of the matching rules. Safe to rerun."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', help="Only these user ids; defaults to every user with rules.")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Transactions per bulk update.")
+
+    def handle(self, *args, **options):
+        user_ids = options['user'] or Rule.objects.order_by('user').values_list('user', flat=True).distinct()
+        updated = sum(reapply_rules(user_id, options['batch_size']) for user_id in user_ids)
+        self.stdout.write(self.style.SUCCESS("Updated %d transactions." % updated))
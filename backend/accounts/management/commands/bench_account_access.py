@@ -0,0 +1,81 @@
+import statistics
+import time
+
+from django.contrib.auth.models import Permission
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from guardian.models import UserObjectPermission
+from guardian.shortcuts import assign_perm
+
+from accounts.access import GuardianAccessBackend, OwnerAccessBackend
+from accounts.models import Account, User
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare guardian-only and owner-first account access resolution as guardian's permission "
+        "table grows. All data is created inside a transaction that is rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[10_000, 100_000, 1_000_000],
+                            help="Permission table sizes to measure at.")
+        parser.add_argument('--users', type=int, default=1000, help="Synthetic users owning the permission rows.")
+        parser.add_argument('--accounts', type=int, default=20, help="Accounts owned by the measured user.")
+        parser.add_argument('--repeat', type=int, default=25, help="Timed runs per backend and size.")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            try:
+                self.run(options)
+            finally:
+                transaction.set_rollback(True)
+
+    def run(self, options):
+        user = User.objects.create_user(username='bench-access-user')
+        others = User.objects.bulk_create(
+            User(username='bench-access-%d' % i) for i in range(options['users'])
+        )
+        owned = Account.objects.bulk_create(
+            Account(name='owned %d' % i, account_owner=user, account_type='C') for i in range(options['accounts'])
+        )
+        shared = Account.objects.bulk_create(
+            Account(name='shared %d' % i, account_owner=others[i], account_type='C') for i in range(3)
+        )
+        # The guardian path only sees accounts with explicit object permissions, so grant them for parity.
+        for account in owned + shared:
+            assign_perm('view_account', user, account)
+
+        content_type = ContentType.objects.get_for_model(Account)
+        permission = Permission.objects.get(content_type=content_type, codename='view_account')
+        backends = {'guardian': GuardianAccessBackend(), 'owner': OwnerAccessBackend()}
+
+        self.stdout.write("%10s  %-9s %9s %9s" % ('rows', 'backend', 'p50 ms', 'p95 ms'))
+        created = UserObjectPermission.objects.count()
+        for rows in sorted(options['rows']):
+            batch = [
+                UserObjectPermission(
+                    user=others[i % len(others)], permission=permission,
+                    content_type=content_type, object_pk=str(1_000_000_000 + i),
+                )
+                for i in range(created, rows)
+            ]
+            UserObjectPermission.objects.bulk_create(batch, batch_size=5000)
+            created = max(created, rows)
+
+            expected = None
+            for name, backend in backends.items():
+                timings = []
+                for _ in range(options['repeat']):
+                    start = time.perf_counter()
+                    ids = sorted(backend.accounts_for(user).values_list('id', flat=True))
+                    timings.append((time.perf_counter() - start) * 1000)
+                if expected is None:
+                    expected = ids
+                elif ids != expected:
+                    self.stderr.write("%s returned different accounts than guardian." % name)
+                timings.sort()
+                self.stdout.write("%10d  %-9s %9.2f %9.2f" % (
+                    rows, name, statistics.median(timings), timings[int(len(timings) * 0.95) - 1]
+                ))
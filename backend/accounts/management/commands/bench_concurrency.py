@@ -0,0 +1,263 @@
+import asyncio
+import datetime
+import importlib.util
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+
+from accounts.management.commands.bench_endpoints import Command as EndpointBenchmark, git_commit
+
+# (name, WSGI path, ASGI path): each deployment serves its own flavour of the same read.
+ENDPOINTS = [
+    ('transactions', '/transactions/', '/async/transactions/'),
+    ('transactions-cursor', '/transactions/?pagination=cursor&page_size=100',
+     '/async/transactions/?pagination=cursor&page_size=100'),
+    ('dashboard', '/dashboard/', '/async/dashboard/'),
+]
+# Server command lines; both are optional dependencies installed only for benchmarking.
+SERVERS = {
+    'wsgi': ('gunicorn', [
+        'gunicorn', 'backend.wsgi:application', '--bind', '127.0.0.1:{port}',
+        '--worker-class', 'gthread', '--workers', '{workers}', '--threads', '{threads}',
+    ]),
+    'asgi': ('uvicorn', [
+        'uvicorn', 'backend.asgi:application', '--host', '127.0.0.1', '--port', '{port}',
+        '--workers', '{workers}', '--no-access-log',
+    ]),
+}
+# Deployment settings: production-like (no DEBUG query log) and without the response cache,
+# which only the sync endpoints use and would otherwise turn the comparison into a cache benchmark.
+BENCH_SETTINGS = """from backend.settings import *  # noqa: F401,F403
+
+DEBUG = False
+ALLOWED_HOSTS = ['127.0.0.1']
+RESPONSE_CACHE = None
+"""
+REQUEST_TIMEOUT = 60
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare requests per second of a WSGI deployment (gunicorn, threaded) serving the sync endpoints "
+        "against an ASGI deployment (uvicorn) serving the async ones, at increasing numbers of concurrent clients. "
+        "Requires `pip install gunicorn uvicorn`."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help="Username to benchmark as; defaults to the user with most transactions.")
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[50, 100, 200, 500],
+                            help="Numbers of concurrent clients to measure.")
+        parser.add_argument('--duration', type=float, default=30.0, help="Seconds of load per measurement.")
+        parser.add_argument('--ramp', type=float, default=10.0,
+                            help="Seconds of unmeasured load before each measurement.")
+        parser.add_argument('--deployment', choices=sorted(SERVERS), nargs='+', default=['wsgi', 'asgi'])
+        parser.add_argument('--endpoint', choices=[name for name, _, _ in ENDPOINTS], nargs='+',
+                            default=[name for name, _, _ in ENDPOINTS])
+        parser.add_argument('--workers', type=int, default=1, help="Server worker processes.")
+        parser.add_argument('--threads', type=int, default=16, help="Threads per gunicorn worker.")
+        parser.add_argument('--output', default='bench-concurrency.json', help="Where to write the JSON results.")
+
+    def handle(self, *args, **options):
+        for deployment in options['deployment']:
+            module = SERVERS[deployment][0]
+            if importlib.util.find_spec(module) is None:
+                raise CommandError("%s is not installed; run `pip install gunicorn uvicorn`." % module)
+
+        user = EndpointBenchmark().get_user(options['user'])
+        endpoints = [endpoint for endpoint in ENDPOINTS if endpoint[0] in options['endpoint']]
+        if 'dashboard' in options['endpoint'] and not user.has_perm('accounts.view_account'):
+            self.stderr.write("Skipping the dashboard: %s lacks accounts.view_account." % user.username)
+            endpoints = [endpoint for endpoint in endpoints if endpoint[0] != 'dashboard']
+
+        # A real session shared by both servers through the database.
+        client = Client()
+        client.force_login(user)
+        cookie = '%s=%s' % (settings.SESSION_COOKIE_NAME, client.cookies[settings.SESSION_COOKIE_NAME].value)
+
+        results = {}
+        try:
+            with tempfile.TemporaryDirectory() as directory:
+                write_settings(directory, 'bench_settings', BENCH_SETTINGS)
+                for deployment in options['deployment']:
+                    with Server(deployment, directory, 'bench_settings', options) as server:
+                        results[deployment] = self.run_deployment(deployment, server, endpoints, cookie, options)
+        finally:
+            client.logout()
+
+        report = {
+            'commit': git_commit(),
+            'created': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'user': user.username,
+            'duration': options['duration'],
+            'ramp': options['ramp'],
+            'workers': options['workers'],
+            'threads': options['threads'],
+            'results': results,
+        }
+        with open(options['output'], 'w') as stream:
+            json.dump(report, stream, indent=2)
+        self.stdout.write(self.style.SUCCESS("Wrote %s" % options['output']))
+
+    def run_deployment(self, deployment, server, endpoints, cookie, options):
+        results = {}
+        for name, wsgi_path, asgi_path in endpoints:
+            path = wsgi_path if deployment == 'wsgi' else asgi_path
+            request = build_request(server.port, path, cookie)
+            # Warm up imports, connections and caches on every server thread before measuring.
+            mix = {name: (1, request)}
+            asyncio.run(load(server.port, mix, concurrency=options['threads'], duration=1.0))
+            results[name] = {}
+            for concurrency in options['concurrency']:
+                result = asyncio.run(load(server.port, mix, concurrency, options['duration'], options['ramp']))[name]
+                results[name][concurrency] = result
+                self.stdout.write("%-5s %-20s %4d clients  %8.1f req/s  p50 %8.1f ms  p95 %8.1f ms  %5d errors" % (
+                    deployment, name, concurrency, result['rps'],
+                    result['p50_ms'] or 0, result['p95_ms'] or 0, result['errors'],
+                ))
+        return results
+
+
+class Server:
+    """One benchmark server process on a free local port, stopped on exit."""
+
+    def __init__(self, deployment, settings_directory, settings_module, options):
+        self.port = free_port()
+        module, arguments = SERVERS[deployment]
+        values = {'port': self.port, 'workers': options['workers'], 'threads': options['threads']}
+        self.command = [sys.executable, '-m', module] + [argument.format(**values) for argument in arguments[1:]]
+        self.env = dict(
+            os.environ, DJANGO_SETTINGS_MODULE=settings_module,
+            PYTHONPATH=os.pathsep.join([settings_directory, str(settings.BASE_DIR), os.environ.get('PYTHONPATH', '')]),
+        )
+
+    def __enter__(self):
+        self.log = tempfile.TemporaryFile()
+        self.process = subprocess.Popen(
+            self.command, cwd=settings.BASE_DIR, env=self.env, stdout=self.log, stderr=subprocess.STDOUT
+        )
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                break
+            try:
+                socket.create_connection(('127.0.0.1', self.port), timeout=1).close()
+                return self
+            except OSError:
+                time.sleep(0.1)
+        output = self.output()
+        self.__exit__(None, None, None)
+        raise CommandError("%s did not start:\n%s" % (' '.join(self.command), output))
+
+    def __exit__(self, *exc_info):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+        self.log.close()
+
+    def output(self):
+        self.log.seek(0)
+        return self.log.read().decode(errors='replace')[-2000:]
+
+
+def write_settings(directory, module, source):
+    with open(os.path.join(directory, module + '.py'), 'w') as stream:
+        stream.write(source)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def build_request(port, path, cookie, method='GET', body=b'', headers=()):
+    head = [
+        '%s %s HTTP/1.1' % (method, path), 'Host: 127.0.0.1:%d' % port, 'Accept: application/json',
+        'Cookie: %s' % cookie, 'Connection: close', *headers,
+    ]
+    if body:
+        head += ['Content-Type: application/json', 'Content-Length: %d' % len(body)]
+    return ('\r\n'.join(head) + '\r\n\r\n').encode() + body
+
+
+async def fetch(port, request):
+    """Send one request on a fresh connection and return its status code."""
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    try:
+        writer.write(request)
+        await writer.drain()
+        status_line = await reader.readline()
+        await reader.read()
+        return int(status_line.split()[1])
+    finally:
+        writer.close()
+
+
+async def load(port, mix, concurrency, duration, ramp=0.0):
+    """
+    Keep `concurrency` clients issuing requests back to back, measuring the `duration` seconds after
+    `ramp` seconds of unmeasured load. `mix` maps a name to `(weight, request)`; each request is drawn
+    by weight. Only requests completed inside the window count; anything but a 2xx within
+    `REQUEST_TIMEOUT` is an error. Returns results per name once the server has worked off the
+    requests abandoned at the end of the window.
+    """
+    names = list(mix)
+    weights = [mix[name][0] for name in names]
+    timings = {name: [] for name in names}
+    errors = dict.fromkeys(names, 0)
+    measuring = stopped = False
+
+    async def client():
+        # The flag as well as cancel(): wait_for() can swallow a cancellation that races a completion.
+        while not stopped:
+            name = random.choices(names, weights)[0]
+            start = time.perf_counter()
+            try:
+                status = await asyncio.wait_for(fetch(port, mix[name][1]), REQUEST_TIMEOUT)
+            except (OSError, ValueError, IndexError, asyncio.TimeoutError):
+                status = None
+            if not measuring:
+                continue
+            if status is not None and 200 <= status < 300:
+                timings[name].append((time.perf_counter() - start) * 1000)
+            else:
+                errors[name] += 1
+
+    clients = [asyncio.create_task(client()) for _ in range(concurrency)]
+    # Servers without admission control (uvicorn) start every request at once, so the first
+    # completions arrive late; measure the steady state only.
+    await asyncio.sleep(ramp)
+    measuring = True
+    await asyncio.sleep(duration)
+    stopped = True
+    for task in clients:
+        task.cancel()
+    await asyncio.gather(*clients, return_exceptions=True)
+    # The server still works through abandoned requests; a probe queued behind them waits them out.
+    await asyncio.wait_for(fetch(port, mix[names[0]][1]), REQUEST_TIMEOUT * 5)
+
+    return {name: summarize(timings[name], errors[name], duration) for name in names}
+
+
+def summarize(timings, errors, duration):
+    timings.sort()
+    return {
+        'requests': len(timings),
+        'errors': errors,
+        'rps': round(len(timings) / duration, 1),
+        'p50_ms': round(statistics.median(timings), 1) if timings else None,
+        'p95_ms': round(timings[max(int(len(timings) * 0.95) - 1, 0)], 1) if timings else None,
+    }
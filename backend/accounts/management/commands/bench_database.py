@@ -0,0 +1,117 @@
+import asyncio
+import datetime
+import importlib.util
+import json
+import tempfile
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import Client
+from django.utils.crypto import get_random_string
+
+from accounts.management.commands.bench_concurrency import BENCH_SETTINGS, Server, build_request, load, \
+    write_settings
+from accounts.management.commands.bench_endpoints import Command as EndpointBenchmark, git_commit
+from accounts.models import Account, Transaction
+
+# The database setup before the router, pragmas and persistent connections: one connection per
+# request to the primary in rollback-journal mode, with SQLite's default 5 second lock timeout.
+BASELINE_SETTINGS = BENCH_SETTINGS + """
+DATABASES = {'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': DATABASES['default']['NAME']}}
+DATABASE_ROUTERS = []
+SQLITE_PRAGMAS = {'journal_mode': 'delete'}
+"""
+# Description of the transactions the writers create; they are deleted again afterwards.
+WRITE_MARKER = 'bench_database write'
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare throughput under mixed read/write load between the baseline database setup and the "
+        "current one (read replica router, WAL and the other SQLITE_PRAGMAS, persistent connections), "
+        "each served by gunicorn. Requires `pip install gunicorn`."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help="Username to benchmark as; defaults to the user with most transactions.")
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[16, 64],
+                            help="Numbers of concurrent clients to measure.")
+        parser.add_argument('--write-ratio', type=float, default=0.2, help="Share of requests that are writes.")
+        parser.add_argument('--duration', type=float, default=30.0, help="Seconds of load per measurement.")
+        parser.add_argument('--ramp', type=float, default=5.0, help="Seconds of unmeasured load before each measurement.")
+        parser.add_argument('--workers', type=int, default=1, help="Server worker processes.")
+        parser.add_argument('--threads', type=int, default=16, help="Threads per gunicorn worker.")
+        parser.add_argument('--output', default='bench-database.json', help="Where to write the JSON results.")
+
+    def handle(self, *args, **options):
+        if importlib.util.find_spec('gunicorn') is None:
+            raise CommandError("gunicorn is not installed; run `pip install gunicorn`.")
+        if not 0 <= options['write_ratio'] <= 1:
+            raise CommandError("--write-ratio must be between 0 and 1.")
+
+        user = EndpointBenchmark().get_user(options['user'])
+        account = Account.objects.filter(account_owner=user).order_by('id').first()
+        client = Client()
+        client.force_login(user)
+        session = client.cookies[settings.SESSION_COOKIE_NAME].value
+        csrf_token = get_random_string(32)
+        cookie = '%s=%s; %s=%s' % (settings.SESSION_COOKIE_NAME, session, settings.CSRF_COOKIE_NAME, csrf_token)
+        # Switching the journal mode back to DELETE needs every other connection to the file closed.
+        connections.close_all()
+
+        results = {}
+        try:
+            with tempfile.TemporaryDirectory() as directory:
+                write_settings(directory, 'bench_baseline', BASELINE_SETTINGS)
+                write_settings(directory, 'bench_settings', BENCH_SETTINGS)
+                for profile, module in [('baseline', 'bench_baseline'), ('tuned', 'bench_settings')]:
+                    with Server('wsgi', directory, module, options) as server:
+                        mix = self.request_mix(server.port, cookie, csrf_token, account, options['write_ratio'])
+                        results[profile] = self.run_profile(profile, server, mix, options)
+        finally:
+            client.logout()
+            deleted, _ = Transaction.objects.filter(description=WRITE_MARKER).delete()
+            self.stdout.write("Deleted %d benchmark transactions." % deleted)
+
+        report = {
+            'commit': git_commit(),
+            'created': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'user': user.username,
+            'write_ratio': options['write_ratio'],
+            'duration': options['duration'],
+            'threads': options['threads'],
+            'results': results,
+        }
+        with open(options['output'], 'w') as stream:
+            json.dump(report, stream, indent=2)
+        self.stdout.write(self.style.SUCCESS("Wrote %s" % options['output']))
+
+    def request_mix(self, port, cookie, csrf_token, account, write_ratio):
+        body = json.dumps({
+            'description': WRITE_MARKER,
+            'amount': '1.00',
+            'type': Transaction.TransactionType.DECREASE,
+            'date': datetime.date.today().isoformat(),
+            'account': 'http://127.0.0.1:%d/accounts/%d/' % (port, account.id),
+        }).encode()
+        return {
+            'read': (1 - write_ratio, build_request(port, '/transactions/?pagination=cursor&page_size=50', cookie)),
+            'write': (write_ratio, build_request(
+                port, '/transactions/', cookie, method='POST', body=body, headers=['X-CSRFToken: %s' % csrf_token]
+            )),
+        }
+
+    def run_profile(self, profile, server, mix, options):
+        asyncio.run(load(server.port, mix, concurrency=options['threads'], duration=1.0))
+        results = {}
+        for concurrency in options['concurrency']:
+            result = asyncio.run(load(server.port, mix, concurrency, options['duration'], options['ramp']))
+            results[concurrency] = result
+            self.stdout.write("%-8s %4d clients  reads %7.1f/s (p95 %7.1f ms, %d errors)  "
+                              "writes %7.1f/s (p95 %7.1f ms, %d errors)" % (
+                                  profile, concurrency,
+                                  result['read']['rps'], result['read']['p95_ms'] or 0, result['read']['errors'],
+                                  result['write']['rps'], result['write']['p95_ms'] or 0, result['write']['errors'],
+                              ))
+        return results
@@ -0,0 +1,164 @@
+import datetime
+import inspect
+import json
+import statistics
+import subprocess
+import time
+import tracemalloc
+from contextlib import ExitStack
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.db.models import Count
+from django.test import RequestFactory, override_settings
+from rest_framework.test import APIClient
+
+from accounts.models import Transaction, User
+from accounts.views import index
+
+# (name, path) of the router endpoints exercised through the full middleware and URL stack.
+ENDPOINTS = [
+    ('transactions', '/transactions/'),
+    ('transactions-cursor', '/transactions/?pagination=cursor&page_size=100'),
+    ('transactions-flat', '/transactions/?format=flat'),
+    ('accounts', '/accounts/'),
+    ('vendors', '/vendors/'),
+    ('category', '/category/'),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark every router endpoint and the dashboard as one user, recording p50/p95 latency, "
+        "SQL query counts and peak memory, and write the results as JSON for comparison between commits."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help="Username to benchmark as; defaults to the user with most transactions.")
+        parser.add_argument('--repeat', type=int, default=30, help="Timed requests per endpoint.")
+        parser.add_argument('--warmup', type=int, default=3, help="Untimed requests per endpoint.")
+        parser.add_argument('--output', default='bench-results.json', help="Where to write the JSON results.")
+        parser.add_argument('--compare', help="Earlier results file to print the change against.")
+        parser.add_argument('--response-cache', action='store_true',
+                            help="Leave the response cache on; by default every request is rendered from the database.")
+
+    def handle(self, *args, **options):
+        user = self.get_user(options['user'])
+        client = APIClient(HTTP_HOST='localhost')
+        client.force_authenticate(user=user)
+
+        cases = [(name, lambda path=path: client.get(path)) for name, path in ENDPOINTS]
+        cases.append(('dashboard', lambda: self.dashboard(user)))
+
+        results = {}
+        with override_settings(**({} if options['response_cache'] else {'RESPONSE_CACHE': None})):
+            for name, call in cases:
+                results[name] = self.measure(call, options['repeat'], options['warmup'])
+                self.stdout.write("%-20s p50 %8.2f ms  p95 %8.2f ms  %3d queries  %8.1f KiB peak" % (
+                    name, results[name]['p50_ms'], results[name]['p95_ms'],
+                    results[name]['queries'], results[name]['peak_kib'],
+                ))
+
+        report = {
+            'commit': git_commit(),
+            'created': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'database': connection.vendor,
+            'user': user.username,
+            'transactions': Transaction.objects.filter(account__account_owner=user).count(),
+            'repeat': options['repeat'],
+            'response_cache': options['response_cache'],
+            'results': results,
+        }
+        with open(options['output'], 'w') as stream:
+            json.dump(report, stream, indent=2)
+        self.stdout.write(self.style.SUCCESS("Wrote %s" % options['output']))
+
+        if options['compare']:
+            self.compare(options['compare'], results)
+
+    def get_user(self, username):
+        if username:
+            try:
+                return User.objects.get(username=username)
+            except User.DoesNotExist:
+                raise CommandError('User "%s" does not exist.' % username)
+        user = (
+            User.objects.filter(account__transaction__isnull=False)
+            .annotate(activity=Count('account__transaction'))
+            .order_by('-activity')
+            .first()
+        )
+        if user is None:
+            raise CommandError("No users with transactions; run seed_data first or pass --user.")
+        return user
+
+    def dashboard(self, user):
+        request = RequestFactory().get('/', HTTP_HOST='localhost')
+        request.user = user
+        # Skip the login and global permission decorators: they are not what is being measured.
+        return inspect.unwrap(index)(request)
+
+    def measure(self, call, repeat, warmup):
+        for _ in range(warmup):
+            response = call()
+            if response.status_code != 200:
+                raise CommandError("Request failed with status %d" % response.status_code)
+
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            call()
+            timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+
+        # Count through execute wrappers: the request cycle resets connection.queries. Every alias is
+        # wrapped, since the router sends reads to the replica.
+        queries = []
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(
+                    lambda execute, sql, *args: queries.append(sql) or execute(sql, *args)
+                ))
+            call()
+
+        # Memory is traced in a separate pass so tracing overhead does not skew the latency numbers.
+        tracemalloc.start()
+        call()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        return {
+            'p50_ms': round(statistics.median(timings), 3),
+            'p95_ms': round(timings[max(int(len(timings) * 0.95) - 1, 0)], 3),
+            'queries': len(queries),
+            'peak_kib': round(peak / 1024, 1),
+        }
+
+    def compare(self, path, results):
+        with open(path) as stream:
+            baseline = json.load(stream)
+        self.stdout.write("Change against %s (%s):" % (path, baseline.get('commit') or 'unknown commit'))
+        for name, result in results.items():
+            before = baseline['results'].get(name)
+            if before is None:
+                continue
+            self.stdout.write("%-20s p50 %+7.1f%%  p95 %+7.1f%%  queries %+d  peak %+7.1f%%" % (
+                name,
+                percent_change(before['p50_ms'], result['p50_ms']),
+                percent_change(before['p95_ms'], result['p95_ms']),
+                result['queries'] - before['queries'],
+                percent_change(before['peak_kib'], result['peak_kib']),
+            ))
+
+
+def percent_change(before, after):
+    return (after - before) / before * 100 if before else 0.0
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
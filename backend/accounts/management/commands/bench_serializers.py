@@ -0,0 +1,65 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from accounts.flat import FlatPlan
+from accounts.models import Account, Category, Transaction, User, Vendor
+from accounts.serializers import AccountSerializer, TransactionSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare rows per second of the hyperlinked serializers and the flat representation. "
+        "All data is created inside a transaction that is rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=500, help="Rows serialized per run (one page).")
+        parser.add_argument('--repeat', type=int, default=20, help="Timed runs per serializer.")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            try:
+                self.run(options)
+            finally:
+                transaction.set_rollback(True)
+
+    def run(self, options):
+        rows = options['rows']
+        user = User.objects.create_user(username='bench-serializer-user')
+        vendor = Vendor.objects.create(name='bench vendor')
+        category = Category.objects.create(name='bench category')
+        Account.objects.bulk_create(
+            Account(name='account %d' % i, account_owner=user, account_type='C') for i in range(rows)
+        )
+        account = Account.objects.filter(account_owner=user).first()
+        Transaction.objects.bulk_create(
+            Transaction(vendor=vendor, category=category, description='item %d' % i, amount=i,
+                        type='DEC', account=account)
+            for i in range(rows)
+        )
+
+        context = {'request': Request(APIRequestFactory().get('/', SERVER_NAME='localhost'))}
+        cases = [
+            ('transactions', TransactionSerializer, Transaction.objects.filter(account=account).order_by('id')),
+            ('accounts', AccountSerializer, Account.objects.filter(account_owner=user).order_by('id')),
+        ]
+
+        self.stdout.write("%-13s %-12s %12s" % ('model', 'serializer', 'rows/sec'))
+        for name, serializer_class, queryset in cases:
+            plan = FlatPlan(serializer_class(context=context))
+            self.report(name, 'hyperlinked', rows, options['repeat'],
+                        lambda: serializer_class(list(queryset), many=True, context=context).data)
+            self.report(name, 'flat', rows, options['repeat'], lambda: plan.render(plan.values(queryset)))
+
+    def report(self, name, label, rows, repeat, serialize):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            serialize()
+            timings.append(time.perf_counter() - start)
+        self.stdout.write("%-13s %-12s %12.0f" % (name, label, rows / statistics.median(timings)))
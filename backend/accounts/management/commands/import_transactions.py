@@ -0,0 +1,34 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.importers import FORMATS, UnreadableFile, detect_format, import_transactions
+
+
+class Command(BaseCommand):
+    help = "Bulk import transactions for a user from a CSV or OFX file."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="CSV or OFX file to import.")
+        parser.add_argument('--user', required=True, help="Username the transactions are imported for.")
+        parser.add_argument('--account', help="Account id for rows that do not name one (required for OFX).")
+        parser.add_argument('--format', choices=FORMATS, help="File format; defaults to the file extension.")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Rows per bulk insert.")
+
+    def handle(self, *args, **options):
+        try:
+            user = get_user_model().objects.get(username=options['user'])
+        except get_user_model().DoesNotExist:
+            raise CommandError('User "%s" does not exist.' % options['user'])
+
+        format = detect_format(options['path'], options['format'])
+        with open(options['path'], encoding='utf-8-sig', newline='') as stream:
+            try:
+                report = import_transactions(user, stream, format, options['account'], options['batch_size'])
+            except UnreadableFile as error:
+                raise CommandError(str(error))
+
+        for error in report['errors']:
+            self.stderr.write("Row %d: %s" % (error['row'], error['errors']))
+        self.stdout.write(self.style.SUCCESS(
+            "Imported %d transactions, %d rows failed." % (report['created'], report['failed'])
+        ))
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.models import Vendor
+from accounts.vendors import duplicate_groups, fold_duplicates, merge_vendors
+
+
+class Command(BaseCommand):
+    help = (
+        "Fold vendors whose names normalize alike into the oldest of them, repointing their "
+        "transactions and rules. With vendor ids and --into, fold those vendors into another "
+        "instead, for aliases normalization cannot tell apart (\"AMZN Mktp\" and \"Amazon\"). Run once "
+        "after migrating to normalized vendor names, to backfill them for existing vendors. Safe to rerun."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('vendors', nargs='*', type=int, help="Ids of vendors to fold into --into.")
+        parser.add_argument('--into', type=int, help="Id of the vendor the given vendors are folded into.")
+        parser.add_argument('--dry-run', action='store_true', help="List the vendors that would be folded without changing anything.")
+
+    def handle(self, *args, **options):
+        if bool(options['vendors']) != (options['into'] is not None):
+            raise CommandError("Vendor ids and --into must be given together.")
+
+        if options['into'] is not None:
+            ids = {*options['vendors'], options['into']}
+            missing = ids - set(Vendor.objects.filter(pk__in=ids).values_list('pk', flat=True))
+            if missing:
+                raise CommandError("No vendors with ids %s." % ', '.join(map(str, sorted(missing))))
+            merges = {pk: options['into'] for pk in options['vendors'] if pk != options['into']}
+            if options['dry_run']:
+                self.stdout.write("Would fold %d vendors." % len(merges))
+                return
+            folded, repointed = len(merges), merge_vendors(merges)
+        else:
+            groups = duplicate_groups()
+            if options['dry_run']:
+                names = dict(Vendor.objects.values_list('id', 'name'))
+                folded = 0
+                for ids in groups.values():
+                    if len(ids) > 1:
+                        folded += len(ids) - 1
+                        self.stdout.write("%s <- %s" % (names[ids[0]], ', '.join(names[pk] for pk in ids[1:])))
+                self.stdout.write("Would fold %d vendors." % folded)
+                return
+            folded, repointed = fold_duplicates(groups)
+        self.stdout.write(self.style.SUCCESS("Folded %d vendors, repointing %d transactions." % (folded, repointed)))
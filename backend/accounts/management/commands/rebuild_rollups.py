@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from accounts.rollups import rebuild
+
+
+class Command(BaseCommand):
+    help = "Rebuild the monthly rollups from the transaction table."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--account', type=int, action='append', help="Only rebuild these account ids.")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Rollup rows per bulk insert.")
+
+    def handle(self, *args, **options):
+        written = rebuild(options['account'], options['batch_size'])
+        self.stdout.write(self.style.SUCCESS("Wrote %d rollup rows." % written))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from accounts.search import is_supported, rebuild
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search index over transaction descriptions and vendor names."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS, help="Database to rebuild the index in.")
+
+    def handle(self, *args, **options):
+        if not is_supported(connections[options['database']]):
+            raise CommandError("Full-text search needs SQLite with FTS5.")
+        indexed = rebuild(options['database'])
+        self.stdout.write(self.style.SUCCESS("Indexed %d transactions." % indexed))
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from accounts.ledger import reconcile
+from accounts.models import Account
+
+
+class Command(BaseCommand):
+    help = "Recompute every account balance from its transactions and report any drift."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help="Rewrite drifted balances from the ledger.")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            unknown = Account.objects.filter(opening_balance__isnull=True).count()
+            drift = reconcile(fix=options['fix'])
+
+        for account, stored, expected in drift:
+            self.stdout.write("Account %d (%s): stored %s, ledger %s, drift %s" % (
+                account.id, account.name, stored, expected, stored - expected
+            ))
+        if unknown:
+            self.stdout.write("%d accounts have no recorded opening balance%s." % (
+                unknown, "; adopted their current balance" if options['fix'] else ""
+            ))
+
+        if not drift:
+            self.stdout.write(self.style.SUCCESS("All balances match the ledger."))
+        elif options['fix']:
+            self.stdout.write(self.style.SUCCESS("Fixed %d drifted balances." % len(drift)))
+        else:
+            self.stdout.write(self.style.WARNING("%d balances drifted; rerun with --fix to correct them." % len(drift)))
@@ -0,0 +1,146 @@
+import datetime
+import itertools
+import random
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from accounts import ledger, rollups
+from accounts.models import Account, Category, Transaction, User
+from accounts.vendors import vendor_ids
+
+CATEGORIES = [
+    'Groceries', 'Dining', 'Rent', 'Utilities', 'Transport', 'Fuel', 'Subscriptions', 'Shopping',
+    'Health', 'Insurance', 'Travel', 'Entertainment', 'Gifts', 'Education', 'Salary', 'Interest',
+]
+# Series every account gets: (description, category, amount, type, day of month).
+RECURRING_SERIES = [
+    ('Rent', 'Rent', Decimal('1450.00'), Transaction.TransactionType.DECREASE, 1),
+    ('Paycheck', 'Salary', Decimal('2600.00'), Transaction.TransactionType.INCREASE, 15),
+    ('Streaming', 'Subscriptions', Decimal('15.99'), Transaction.TransactionType.DECREASE, 20),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a realistic synthetic dataset: users with accounts of every type and transactions with "
+        "skewed vendor/category distributions plus monthly recurring series. Users are named "
+        "seed-user-N with the password 'password'."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10, help="Number of users to create.")
+        parser.add_argument('--accounts-per-type', type=int, default=2, help="Accounts of each AccountType per user.")
+        parser.add_argument('--transactions', type=int, default=100_000, help="Total one-off transactions.")
+        parser.add_argument('--vendors', type=int, default=500, help="Number of vendors.")
+        parser.add_argument('--months', type=int, default=36, help="How far back transactions go.")
+        parser.add_argument('--skew', type=float, default=1.1,
+                            help="Zipf exponent for vendor/category popularity; higher is more skewed.")
+        parser.add_argument('--batch-size', type=int, default=5000, help="Rows per bulk insert.")
+        parser.add_argument('--seed', type=int, default=0, help="Random seed, for reproducible datasets.")
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        today = datetime.date.today()
+        start = today - datetime.timedelta(days=options['months'] * 30)
+
+        with transaction.atomic():
+            offset = User.objects.filter(username__startswith='seed-user-').count()
+            password = make_password('password')
+            users = User.objects.bulk_create(
+                User(username='seed-user-%d' % (offset + i), password=password) for i in range(options['users'])
+            )
+            categories = {
+                category.name: category
+                for category in Category.objects.bulk_create(Category(name=name) for name in CATEGORIES)
+            }
+            # Vendor names are unique once normalized, so reruns reuse the vendors already seeded.
+            vendors = list(vendor_ids(['Vendor %d' % i for i in range(options['vendors'])]).values())
+
+            accounts = []
+            for user in users:
+                for account_type in Account.AccountType:
+                    for i in range(options['accounts_per_type']):
+                        balance = Decimal(rng.randint(0, 5000))
+                        accounts.append(Account(
+                            name='%s %d' % (account_type.label, i),
+                            account_owner=user,
+                            account_type=account_type,
+                            mortgage=account_type == Account.AccountType.DEBT and i == 0 and rng.random() < 0.3,
+                            current_balance=balance,
+                            opening_balance=balance,
+                        ))
+            accounts = Account.objects.bulk_create(accounts)
+
+            category_list = list(categories.values())
+            vendor_weights = cumulative_zipf_weights(len(vendors), options['skew'])
+            category_weights = cumulative_zipf_weights(len(category_list), options['skew'])
+            # Accounts are also skewed: a few busy accounts carry most of the activity.
+            account_weights = cumulative_zipf_weights(len(accounts), 0.6)
+            days = (today - start).days
+
+            created = 0
+            remaining = options['transactions']
+            while remaining > 0:
+                size = min(remaining, options['batch_size'])
+                remaining -= size
+                created += len(Transaction.objects.bulk_create(
+                    Transaction(
+                        vendor_id=vendor,
+                        category=category,
+                        description='Purchase %d' % rng.randint(1, 99999),
+                        date=start + datetime.timedelta(days=rng.randint(0, days)),
+                        amount=Decimal(round(rng.lognormvariate(3, 1), 2)).quantize(ledger.CENT),
+                        type=Transaction.TransactionType.DECREASE if rng.random() < 0.9
+                        else Transaction.TransactionType.INCREASE,
+                        account=account,
+                        paid_off=rng.random() < 0.5,
+                    )
+                    for vendor, category, account in zip(
+                        rng.choices(vendors, cum_weights=vendor_weights, k=size),
+                        rng.choices(category_list, cum_weights=category_weights, k=size),
+                        rng.choices(accounts, cum_weights=account_weights, k=size),
+                    )
+                ))
+
+            batch = []
+            for account in accounts:
+                for description, category, amount, type, day in RECURRING_SERIES:
+                    for date in monthly_dates(start, today, day):
+                        batch.append(Transaction(
+                            description=description, category=categories[category], date=date,
+                            amount=amount, type=type, account=account, recurring=True,
+                        ))
+                if len(batch) >= options['batch_size']:
+                    created += len(Transaction.objects.bulk_create(batch))
+                    batch = []
+            created += len(Transaction.objects.bulk_create(batch))
+
+            # Balances and rollups are derived data: rebuild them set-based instead of row by row.
+            ledger.reconcile(fix=True)
+            rollups.rebuild()
+
+        self.stdout.write(self.style.SUCCESS(
+            "Seeded %d users, %d accounts, %d vendors and %d transactions." % (
+                len(users), len(accounts), len(vendors), created
+            )
+        ))
+
+
+def cumulative_zipf_weights(count, skew):
+    return list(itertools.accumulate(1 / (rank ** skew) for rank in range(1, count + 1)))
+
+
+def monthly_dates(start, end, day):
+    year, month = start.year, start.month
+    while True:
+        date = datetime.date(year, month, min(day, 28))
+        if date > end:
+            return
+        if date >= start:
+            yield date
+        month += 1
+        if month > 12:
+            year, month = year + 1, 1
@@ -0,0 +1,36 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.snapshots import fill, rebuild
+
+
+class Command(BaseCommand):
+    help = (
+        "Record every user's daily net worth snapshots through a date, continuing from each user's "
+        "latest one; users without snapshots are backfilled from their first transaction. "
+        "Meant to run daily; safe to rerun."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--through', help="Snapshot up to this date (YYYY-MM-DD); defaults to today.")
+        parser.add_argument('--rebuild', action='store_true',
+                            help="Recompute all history from the transactions instead of continuing it.")
+        parser.add_argument('--user', type=int, action='append', help="With --rebuild, only these user ids.")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Snapshot rows per bulk insert.")
+
+    def handle(self, *args, **options):
+        through = None
+        if options['through']:
+            try:
+                through = datetime.date.fromisoformat(options['through'])
+            except ValueError:
+                raise CommandError("--through must be a date in YYYY-MM-DD format.")
+        if options['user'] and not options['rebuild']:
+            raise CommandError("--user is only supported with --rebuild.")
+
+        if options['rebuild']:
+            written = rebuild(options['user'], None, through, options['batch_size'])
+        else:
+            written = fill(through, options['batch_size'])
+        self.stdout.write(self.style.SUCCESS("Wrote %d snapshots." % written))
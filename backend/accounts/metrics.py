@@ -0,0 +1,243 @@
+import hmac
+import threading
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+# Upper bounds for the latency histograms, in seconds, and for the query count histogram.
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200, 500)
+
+# (metric name, help text, buckets) for every per-request observation.
+METRICS = [
+    ('budget_request_duration_seconds', "Wall time spent handling the request.", SECONDS_BUCKETS),
+    ('budget_request_sql_seconds', "Time spent executing SQL for the request.", SECONDS_BUCKETS),
+    ('budget_request_render_seconds', "Time spent rendering the response body.", SECONDS_BUCKETS),
+    ('budget_request_queries', "SQL queries executed for the request.", QUERY_BUCKETS),
+]
+# (metric name, help text) of process-wide counters.
+COUNTERS = [
+    ('budget_response_cache_hits_total', "API responses served from the response cache."),
+    ('budget_response_cache_misses_total', "Cacheable API responses that had to be rendered."),
+]
+
+
+class Histogram:
+    """
+    A cumulative histogram in the Prometheus sense, kept as per-bucket counts plus a running sum.
+    """
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        index = 0
+        for bound in self.buckets:
+            if value <= bound:
+                break
+            index += 1
+        self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self):
+        """Yield `(le, cumulative count)` pairs, ending with `+Inf`."""
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            yield format_number(bound), total
+        yield '+Inf', self.count
+
+
+class MetricsRegistry:
+    """
+    In-process histograms per metric and view, and plain counters, shared by every thread of the worker.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {name: {} for name, _, _ in METRICS}
+        self.counters = {name: 0 for name, _ in COUNTERS}
+
+    def observe(self, view, **values):
+        with self.lock:
+            for name, _, buckets in METRICS:
+                by_view = self.histograms[name]
+                if view not in by_view:
+                    by_view[view] = Histogram(buckets)
+                by_view[view].observe(values[name])
+
+    def increment(self, name, amount=1):
+        with self.lock:
+            self.counters[name] += amount
+
+    def reset(self):
+        with self.lock:
+            self.histograms = {name: {} for name, _, _ in METRICS}
+            self.counters = {name: 0 for name, _ in COUNTERS}
+
+    def render(self):
+        """The registry in the Prometheus text exposition format."""
+        lines = []
+        with self.lock:
+            for name, help_text, _ in METRICS:
+                lines.append('# HELP %s %s' % (name, help_text))
+                lines.append('# TYPE %s histogram' % name)
+                for view, histogram in sorted(self.histograms[name].items()):
+                    label = escape_label(view)
+                    for le, count in histogram.samples():
+                        lines.append('%s_bucket{view="%s",le="%s"} %d' % (name, label, le, count))
+                    lines.append('%s_sum{view="%s"} %s' % (name, label, format_number(histogram.sum)))
+                    lines.append('%s_count{view="%s"} %d' % (name, label, histogram.count))
+            for name, help_text in COUNTERS:
+                lines.append('# HELP %s %s' % (name, help_text))
+                lines.append('# TYPE %s counter' % name)
+                lines.append('%s %d' % (name, self.counters[name]))
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+class QueryTimer:
+    """
+    A database execute wrapper that counts queries and accumulates their duration.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - start
+            self.count += 1
+
+
+# The timer of the request being handled. A context variable rather than a wrapper installed on the
+# request thread's connection, because async views run their queries on the ORM's worker thread.
+current_timer = ContextVar('current_timer', default=None)
+
+
+def time_query(execute, sql, params, many, context):
+    timer = current_timer.get()
+    if timer is None:
+        return execute(sql, params, many, context)
+    return timer(execute, sql, params, many, context)
+
+
+def install_query_timer(sender, connection, **kwargs):
+    """`connection_created` receiver adding `time_query` to every new database connection."""
+    if time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, time_query)
+
+
+class RequestMetricsMiddleware:
+    """
+    Record wall time, SQL time, query count and render time per resolved view and action
+    (e.g. `TransactionViewSet.list`) into the process-wide `registry`.
+
+    With `METRICS_SERVER_TIMING` enabled the same numbers are sent back in a `Server-Timing` header.
+    Works in both sync and async mode, so async views stay async under ASGI.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.server_timing = getattr(settings, 'METRICS_SERVER_TIMING', False)
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        start = time.perf_counter()
+        timer = QueryTimer()
+        token = current_timer.set(timer)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_timer.reset(token)
+        return self.record(request, response, timer, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        timer = QueryTimer()
+        token = current_timer.set(timer)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_timer.reset(token)
+        return self.record(request, response, timer, time.perf_counter() - start)
+
+    def record(self, request, response, timer, duration):
+        view = getattr(request, '_metrics_view', None)
+        if view is None:
+            return response
+        render = getattr(request, '_metrics_render_seconds', 0.0)
+        registry.observe(
+            view,
+            budget_request_duration_seconds=duration,
+            budget_request_sql_seconds=timer.seconds,
+            budget_request_render_seconds=render,
+            budget_request_queries=timer.count,
+        )
+        if self.server_timing:
+            response['Server-Timing'] = 'sql;dur=%.2f;desc="%d queries", render;dur=%.2f, total;dur=%.2f' % (
+                timer.seconds * 1000, timer.count, render * 1000, duration * 1000
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._metrics_view = view_name(request, view_func)
+
+    def process_template_response(self, request, response):
+        # Listed first in MIDDLEWARE, this hook runs last, right before the response is rendered.
+        start = time.perf_counter()
+
+        def record_render(rendered):
+            request._metrics_render_seconds = time.perf_counter() - start
+
+        response.add_post_render_callback(record_render)
+        return response
+
+
+def may_scrape(request):
+    """
+    Whether the request may read the metrics: staff users may, and so may scrapers sending
+    `Authorization: Bearer <METRICS_TOKEN>` when that setting is set.
+    """
+    if request.user.is_staff:
+        return True
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if not token:
+        return False
+    return hmac.compare_digest(request.headers.get('Authorization', ''), 'Bearer %s' % token)
+
+
+def view_name(request, view_func):
+    """`ViewSet.action` for routed viewsets, `Class.method` for class views, the function name otherwise."""
+    view_class = getattr(view_func, 'cls', None) or getattr(view_func, 'view_class', None)
+    if view_class is None:
+        return getattr(view_func, '__name__', type(view_func).__name__)
+    actions = getattr(view_func, 'actions', None) or {}
+    method = request.method.lower()
+    return '%s.%s' % (view_class.__name__, actions.get(method, method))
+
+
+def escape_label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
@@ -1,6 +1,12 @@
+import re
+import unicodedata
+from functools import lru_cache
+
 from django.conf import settings
+from django.core.exceptions import ValidationError
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.db import models, transaction
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 from rest_framework.exceptions import PermissionDenied
 
@@ -18,14 +24,53 @@ class Category(models.Model):
         return self.name
 
 
+WEB_DOMAIN = re.compile(r'^www\.|\.(?:com|net|org|co|io)\b')
+APOSTROPHES = re.compile(r"['\u2019]")
+NON_WORD = re.compile(r'[\W_]+')
+
+
+@lru_cache(maxsize=10000)
+def normalize_vendor_name(name):
+    """
+    The form vendor names are compared in: accents, case, punctuation and a web domain suffix
+    dropped and whitespace collapsed, so "AMAZON", "Amazon.com" and "amazon " are one vendor.
+    Cached, since imports and the API normalize the same few names over and over.
+    """
+    text = ''.join(c for c in unicodedata.normalize('NFKD', name) if not unicodedata.combining(c)).casefold()
+    text = NON_WORD.sub(' ', APOSTROPHES.sub('', WEB_DOMAIN.sub(' ', text))).strip()
+    # Names of punctuation alone still need a key of their own.
+    return (text or name.strip().casefold())[:50]
+
+
 class Vendor(models.Model):
     name = models.CharField(max_length=50)
+    # Unique, so concurrent creates of the same vendor cannot both succeed; see vendors.py.
+    # Nullable so the column can be added to existing tables: vendors saved before it have no key
+    # until `manage.py merge_vendors`, run once after migrating, backfills it. It can be made
+    # non-null once every database has been backfilled.
+    normalized_name = models.CharField(max_length=50, unique=True, null=True, editable=False)
     created = models.DateTimeField(default=timezone.now)
     last_updated = models.DateTimeField(auto_now=True)
 
+    DUPLICATE_NAME = "A vendor with this name already exists."
+
     def __str__(self):
         return self.name
 
+    def validate_unique(self, exclude=None):
+        super().validate_unique(exclude)
+        # normalized_name is not editable, so forms leave its unique check out; check the name it comes from.
+        if exclude is None or 'name' not in exclude:
+            if Vendor.objects.exclude(pk=self.pk).filter(normalized_name=normalize_vendor_name(self.name)).exists():
+                raise ValidationError({'name': [self.DUPLICATE_NAME]})
+
+    def save(self, *args, **kwargs):
+        self.normalized_name = normalize_vendor_name(self.name)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'name' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'normalized_name'}
+        super().save(*args, **kwargs)
+
 
 class Account(models.Model):
     class AccountType(models.TextChoices):
@@ -36,9 +81,17 @@ class Account(models.Model):
     
     name = models.CharField(max_length=50)
     account_owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
+    # Maintained by the ledger (see ledger.py) from the opening balance and every transaction write.
     current_balance = models.DecimalField(
         max_digits=10,
-        decimal_places=2
+        decimal_places=2,
+        default=0
+    )
+    opening_balance = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        null=True,
+        blank=True
     )
     account_type = models.CharField(
         max_length=2,
@@ -54,6 +107,18 @@ class Account(models.Model):
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored owner so a change of owner can invalidate both owners' cached responses.
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def save(self, *args, **kwargs):
+        if self._state.adding and self.opening_balance is None:
+            self.opening_balance = self.current_balance
+        super().save(*args, **kwargs)
+
     def perform_create(self, serializer):
         # Get the account from the validated data
         requested_account_owner = serializer.validated_data['account_owner']
@@ -89,11 +154,46 @@ class Transaction(models.Model):
     account = models.ForeignKey(Account, on_delete=models.CASCADE)
     paid_off = models.BooleanField(default=False)
     recurring = models.BooleanField(default=False)
+    # Set on transactions generated from a recurrence schedule; together they identify the occurrence.
+    series = models.ForeignKey(
+        'Recurrence', on_delete=models.SET_NULL, null=True, blank=True, related_name='occurrences'
+    )
+    occurrence_date = models.DateField(null=True, blank=True)
     created = models.DateTimeField(default=timezone.now)
     last_updated = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        constraints = [
+            # Makes materializing a schedule idempotent: each occurrence is generated at most once.
+            models.UniqueConstraint(fields=['series', 'occurrence_date'], name='transaction_series_occurrence'),
+        ]
+        indexes = [
+            # Backs keyset pagination over (date, id) within an account.
+            models.Index(fields=['account', 'date', 'id'], name='transaction_account_date_id'),
+            # Back the list filters; each leads with the account so owned-account lookups stay index searches.
+            models.Index(fields=['account', 'category', 'date'], name='transaction_account_category'),
+            models.Index(fields=['account', 'vendor', 'date'], name='transaction_account_vendor'),
+            models.Index(fields=['account', 'amount'], name='transaction_account_amount'),
+            # Staff lists span every account, so date ranges need an index of their own.
+            models.Index(fields=['date', 'id'], name='transaction_date_id'),
+            # Covers the per-period sums behind an account's balance series.
+            models.Index(fields=['account', 'date', 'type', 'amount'], name='transaction_account_balance'),
+            # Covers the COUNT/MAX(last_updated) behind conditional GET validators.
+            models.Index(fields=['account', 'last_updated'], name='transaction_account_updated'),
+        ]
+
     def __str__(self):
-        return self.vendor.name + " " + str(self.amount)
+        return "%s %s" % (self.vendor or self.description, self.amount)
+
+    def save(self, *args, **kwargs):
+        # Keep the write, the locked re-read of the stored row its pre_save handler makes and the
+        # ledger updates made by its post_save handlers in one database transaction.
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            return super().delete(*args, **kwargs)
 
     def perform_create(self, serializer):
         # Get the account from the validated data
@@ -105,4 +205,159 @@ class Transaction(models.Model):
             raise PermissionDenied("You do not have permission to create transactions in this account.")
 
         # Save the object if permissions pass
-        serializer.save()
\ No newline at end of file
+        serializer.save()
+
+
+class TransactionSearch(models.Model):
+    """
+    A row of the full-text index over transactions, maintained by triggers; see search.py.
+    Unmanaged, since migrations cannot create the virtual table, and only ever read through a
+    join from `Transaction.search_entry`.
+    """
+    transaction = models.OneToOneField(
+        Transaction, primary_key=True, db_column='rowid', db_constraint=False,
+        # The delete trigger removes index rows; the ORM never touches them.
+        on_delete=models.DO_NOTHING, related_name='search_entry',
+    )
+    # FTS5's hidden column named after the table: the left side of MATCH.
+    document = models.TextField(db_column='accounts_transaction_search')
+    rank = models.FloatField()
+
+    class Meta:
+        managed = False
+        db_table = 'accounts_transaction_search'
+
+
+class Recurrence(models.Model):
+    """
+    The schedule of a recurring transaction: it repeats every `interval` days, weeks, months or years
+    from `anchor_date` (the template's own occurrence) until `end_date`, if any.
+    Occurrences are generated by `materialize_recurring`; `materialized_through` records how far it got.
+    """
+    class Frequency(models.TextChoices):
+        DAILY = 'D', 'Daily'
+        WEEKLY = 'W', 'Weekly'
+        MONTHLY = 'M', 'Monthly'
+        YEARLY = 'Y', 'Yearly'
+
+    transaction = models.OneToOneField(Transaction, on_delete=models.CASCADE, related_name='recurrence')
+    frequency = models.CharField(max_length=1, choices=Frequency, default=Frequency.MONTHLY)
+    interval = models.PositiveIntegerField(default=1)
+    anchor_date = models.DateField()
+    end_date = models.DateField(null=True, blank=True)
+    materialized_through = models.DateField(null=True, blank=True)
+    created = models.DateTimeField(default=timezone.now)
+    last_updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return "%s every %d %s" % (self.transaction.description, self.interval, self.get_frequency_display())
+
+
+class MonthlyRollup(models.Model):
+    """
+    Summed INC/DEC amounts and counts of a user's transactions per account, category, vendor and month.
+    Kept up to date by the transaction signal handlers and rebuilt with `rebuild_rollups`.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True, blank=True)
+    account = models.ForeignKey(Account, on_delete=models.CASCADE)
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, null=True, blank=True)
+    vendor = models.ForeignKey(Vendor, on_delete=models.CASCADE, null=True, blank=True)
+    month = models.DateField()
+    inc_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    dec_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    inc_count = models.IntegerField(default=0)
+    dec_count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                'account', Coalesce('category', 0), Coalesce('vendor', 0), 'month',
+                name='monthly_rollup_key',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'month'], name='monthly_rollup_user_month'),
+        ]
+
+    def __str__(self):
+        return "%s %s" % (self.account, self.month)
+
+
+class NetWorthSnapshot(models.Model):
+    """
+    A user's summed account balances of one account type at the end of a day, by transaction date,
+    with mortgage accounts in groups of their own. Filled by `snapshot_net_worth` and kept current
+    by the transaction and account signal handlers.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    date = models.DateField()
+    account_type = models.CharField(max_length=2, choices=Account.AccountType)
+    mortgage = models.BooleanField(default=False)
+    total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            # Its index also serves the "this group from this date on" updates of backdated writes.
+            models.UniqueConstraint(
+                fields=['user', 'account_type', 'mortgage', 'date'], name='net_worth_snapshot_key'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'date'], name='net_worth_snapshot_user_date'),
+        ]
+
+    def __str__(self):
+        return "%s %s %s" % (self.user, self.date, self.get_account_type_display())
+
+
+class Rule(models.Model):
+    """
+    A user's rule for filling in the vendor and category of their transactions. It matches when the
+    description contains (or starts with) `pattern`, ignoring case, and the account and amount
+    conditions that are set hold. Rules are tried by `priority`, then id; the first matching rule
+    with a vendor sets the vendor, and likewise for the category. See rules.py.
+    """
+    class MatchType(models.TextChoices):
+        CONTAINS = 'C', 'Contains'
+        STARTS_WITH = 'S', 'Starts with'
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    match_type = models.CharField(max_length=1, choices=MatchType, default=MatchType.CONTAINS)
+    # Blank matches every description.
+    pattern = models.CharField(max_length=50, blank=True)
+    account = models.ForeignKey(Account, on_delete=models.CASCADE, null=True, blank=True)
+    min_amount = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    max_amount = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    # Deleted along with their vendor or category, so a compiled rule never assigns a missing one.
+    vendor = models.ForeignKey(Vendor, on_delete=models.CASCADE, null=True, blank=True)
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, null=True, blank=True)
+    priority = models.IntegerField(default=0)
+    created = models.DateTimeField(default=timezone.now)
+    last_updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Covers the COUNT/MAX(last_updated) that tells whether a user's compiled rules are current.
+            models.Index(fields=['user', 'last_updated'], name='rule_user_updated'),
+        ]
+
+    def __str__(self):
+        return "%s %s" % (self.get_match_type_display(), self.pattern)
+
+
+class DeletionMark(models.Model):
+    """
+    When rows of a model were last deleted, per owning user (no user for shared models such as vendors).
+    Deletions leave no `last_updated` behind, so conditional GETs consult these marks as well.
+    """
+    model = models.CharField(max_length=100)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True, blank=True)
+    deleted_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint('model', Coalesce('user', 0), name='deletion_mark_key'),
+        ]
+
+    def __str__(self):
+        return "%s %s" % (self.model, self.deleted_at)
@@ -0,0 +1,51 @@
+from .models import Account
+
+
+def owned_account_ids(request):
+    """
+    Ids of the accounts owned by the requesting user, loaded with one query and cached on the request
+    so permissions, querysets and nested checks all share it.
+    """
+    # Cache on the underlying HttpRequest so plain Django views and DRF views see the same set.
+    http_request = getattr(request, '_request', request)
+    ids = getattr(http_request, '_owned_account_ids', None)
+    if ids is None:
+        ids = frozenset(Account.objects.filter(account_owner=request.user).values_list('id', flat=True))
+        http_request._owned_account_ids = ids
+    return ids
+
+
+async def aowned_account_ids(request):
+    """`owned_account_ids` read with the async ORM, sharing the same per-request cache."""
+    http_request = getattr(request, '_request', request)
+    ids = getattr(http_request, '_owned_account_ids', None)
+    if ids is None:
+        ids = frozenset([
+            pk async for pk in Account.objects.filter(account_owner=request.user).values_list('id', flat=True)
+        ])
+        http_request._owned_account_ids = ids
+    return ids
+
+
+def account_id_from_reference(reference):
+    """
+    Extract an account id from a hyperlink, a bare id or a nested `{'id': ...}` / `{'url': ...}` object.
+    Returns None when the reference cannot name an account.
+    """
+    if isinstance(reference, dict):
+        reference = reference.get('id') or reference.get('url')
+    if reference is None or isinstance(reference, bool):
+        return None
+    value = str(reference).rstrip('/').split('/')[-1]
+    return int(value) if value.isdigit() else None
+
+
+def owns_account_reference(request, reference):
+    return account_id_from_reference(reference) in owned_account_ids(request)
+
+
+def owner_id_from_reference(reference):
+    try:
+        return int(reference)
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,214 @@
+from base64 import b64decode, b64encode
+from urllib import parse
+
+from django.core.paginator import InvalidPage
+from django.db.models import F, Q
+from django.utils.dateparse import parse_date
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination, _positive_int
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination keyed on `(date, id)`.
+
+    Each page is a range scan starting right after the last row of the previous one,
+    so deep pages cost the same as the first and ties on `date` never shift between pages.
+    Rows with no date sort first, matching the default ordering of the transaction list.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    page_size = 100
+    max_page_size = 1000
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.finish_page(list(self.page_queryset(queryset, request)))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """`paginate_queryset` reading the page with the async ORM."""
+        return self.finish_page([row async for row in self.page_queryset(queryset, request)])
+
+    def page_queryset(self, queryset, request):
+        """The page (plus one row to detect a next page) as an unevaluated queryset."""
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+
+        self.reverse, self.position = self.decode_cursor(request)
+        queryset = queryset.order_by(*self.get_ordering(self.reverse))
+        if self.position is not None:
+            queryset = queryset.filter(self.get_position_filter(self.position, self.reverse))
+        return queryset[:self.page_size + 1]
+
+    def finish_page(self, results):
+        reverse, position = self.reverse, self.position
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        if reverse:
+            self.page.reverse()
+
+        first = self.page[0] if self.page else None
+        last = self.page[-1] if self.page else None
+        # Moving forward we can always come back; moving backward we can always go forward again.
+        self.has_next = has_more if not reverse else position is not None
+        self.has_previous = has_more if reverse else position is not None
+        self.next_position = self.get_position(last) if last else position
+        self.previous_position = self.get_position(first) if first else position
+        return self.page
+
+    def get_position(self, row):
+        # Rows are model instances, or dicts when the queryset was narrowed with `values()`.
+        if isinstance(row, dict):
+            return row['date'], row['id']
+        return row.date, row.pk
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        try:
+            return _positive_int(
+                request.query_params[self.page_size_query_param],
+                strict=True,
+                cutoff=self.max_page_size
+            )
+        except (KeyError, ValueError):
+            return self.page_size
+
+    def get_ordering(self, reverse):
+        if reverse:
+            return [F('date').desc(nulls_last=True), '-id']
+        return [F('date').asc(nulls_first=True), 'id']
+
+    def get_position_filter(self, position, reverse):
+        date, pk = position
+        if not reverse:
+            if date is None:
+                return Q(date__isnull=True, id__gt=pk) | Q(date__isnull=False)
+            return Q(date__gt=date) | Q(date=date, id__gt=pk)
+        if date is None:
+            return Q(date__isnull=True, id__lt=pk)
+        return Q(date__lt=date) | Q(date=date, id__lt=pk) | Q(date__isnull=True)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.encode_cursor(False, self.next_position)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        return self.encode_cursor(True, self.previous_position)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return False, None
+
+        try:
+            tokens = parse.parse_qs(b64decode(encoded.encode('ascii')).decode('ascii'), keep_blank_values=True)
+            reverse = bool(int(tokens.get('r', ['0'])[0]))
+            date = tokens['d'][0]
+            pk = int(tokens['i'][0])
+        except (TypeError, ValueError, KeyError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+        if date:
+            date = parse_date(date)
+            if date is None:
+                raise NotFound(self.invalid_cursor_message)
+        else:
+            date = None
+        return reverse, (date, pk)
+
+    def encode_cursor(self, reverse, position):
+        date, pk = position
+        tokens = {'d': date.isoformat() if date else '', 'i': pk}
+        if reverse:
+            tokens['r'] = '1'
+        encoded = b64encode(parse.urlencode(tokens, doseq=True).encode('ascii')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+
+class AsyncPageNumberPagination(PageNumberPagination):
+    """
+    `PageNumberPagination` that can also read the count and the page with the async ORM.
+    """
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+
+        paginator = self.django_paginator_class(queryset, page_size)
+        # Count up front with the async ORM; the paginator uses the cached value from here on.
+        paginator.count = await queryset.acount()
+        page_number = self.get_page_number(request, paginator)
+        try:
+            self.page = paginator.page(page_number)
+        except InvalidPage as exc:
+            raise NotFound(self.invalid_page_message.format(page_number=page_number, message=str(exc)))
+
+        if paginator.num_pages > 1 and self.template is not None:
+            self.display_page_controls = True
+        self.page.object_list = [row async for row in self.page.object_list]
+        return list(self.page)
+
+
+class TransactionPagination(BasePagination):
+    """
+    Page-number pagination by default; `?pagination=cursor` switches to keyset pagination.
+    """
+    mode_query_param = 'pagination'
+    cursor_mode = 'cursor'
+
+    def __init__(self):
+        self.delegate = AsyncPageNumberPagination()
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.select_delegate(request).paginate_queryset(queryset, request, view)
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        return await self.select_delegate(request).apaginate_queryset(queryset, request, view)
+
+    def select_delegate(self, request):
+        if request.query_params.get(self.mode_query_param) == self.cursor_mode:
+            self.delegate = KeysetPagination()
+        else:
+            self.delegate = AsyncPageNumberPagination()
+        return self.delegate
+
+    def get_paginated_response(self, data):
+        return self.delegate.get_paginated_response(data)
+
+    def get_paginated_response_schema(self, schema):
+        return self.delegate.get_paginated_response_schema(schema)
+
+    def to_html(self):
+        return self.delegate.to_html()
+
+    def get_results(self, data):
+        return self.delegate.get_results(data)
+
+    @property
+    def display_page_controls(self):
+        return self.delegate.display_page_controls
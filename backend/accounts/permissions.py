@@ -1,42 +1,53 @@
 from rest_framework import permissions
 
-from .models import Account
+from .ownership import owned_account_ids, owner_id_from_reference, owns_account_reference
+
+WRITE_ACTIONS = ('create', 'update', 'partial_update')
+# Bulk actions carry the written fields under a key of their own.
+BULK_WRITE_ACTIONS = {'bulk_update': 'changes'}
 
 
 class IsOwnerOrAdmin(permissions.BasePermission):
     """
     Custom permission to allow access only to the owner of an object or its parent object.
+
+    Ownership is resolved from the request-scoped set of owned account ids, so a request costs
+    at most one ownership query however many objects or payload items it checks.
     """
 
     def has_permission(self, request, view):
-        if (view.action == 'create' or view.action == 'update') and not request.user.is_staff and not request.user.is_superuser:
-
-            account_url = request.data.get('account')
-            account_owner = request.data.get('account_owner')
-            if account_owner:
-                return int(account_owner) == int(request.user.id)
-            elif not account_url:
-                return True
-            else:
-                # Extract the ID from the URL
-                account_id = account_url.rstrip('/').split('/')[-1]
-
-                try:
-                    account = Account.objects.get(id=account_id)
-                    return account.account_owner == request.user
-                except Account.DoesNotExist:
-                    return False
+        if view.action in WRITE_ACTIONS and not request.user.is_staff and not request.user.is_superuser:
+            # Bulk payloads are lists of items; every item must pass.
+            items = request.data if isinstance(request.data, list) else [request.data]
+            return all(self.may_write(request, item) for item in items)
+        if view.action in BULK_WRITE_ACTIONS and not request.user.is_staff and not request.user.is_superuser:
+            # The selected objects are narrowed to the user's by the queryset; only the fields written are checked.
+            changes = request.data.get(BULK_WRITE_ACTIONS[view.action]) if hasattr(request.data, 'get') else None
+            # Malformed payloads are left for the view to reject with a validation error.
+            return not hasattr(changes, 'get') or self.may_write(request, changes)
 
         return True
 
+    def may_write(self, request, item):
+        if not hasattr(item, 'get'):
+            return False
+
+        account_owner = item.get('account_owner')
+        account = item.get('account')
+        if account_owner:
+            return owner_id_from_reference(account_owner) == request.user.id
+        elif not account:
+            return True
+        return owns_account_reference(request, account)
+
     def has_object_permission(self, request, view, obj):
         # Allow access for admin users
         if request.user.is_staff or request.user.is_superuser:
             return True
         # Check ownership of the parent object (e.g., Project)
-        if hasattr(obj, 'account') and obj.account.account_owner == request.user:
+        if hasattr(obj, 'account_id') and obj.account_id in owned_account_ids(request):
             return True
         # Check ownership directly on the object
-        if hasattr(obj, 'account_owner') and obj.account_owner == request.user:
+        if hasattr(obj, 'account_owner_id') and obj.account_owner_id == request.user.id:
             return True
-        return False
\ No newline at end of file
+        return False
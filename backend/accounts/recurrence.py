@@ -0,0 +1,121 @@
+import calendar
+import datetime
+
+from django.db import transaction as db_transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import ledger, rollups, snapshots
+from .cache import invalidate_users
+from .models import Recurrence, Transaction
+
+# Template fields every generated occurrence copies.
+COPIED_FIELDS = ['vendor_id', 'description', 'amount', 'type', 'category_id', 'account_id']
+
+
+def add_months(date, months, day):
+    """`date` moved by `months`, on `day` or the last day of the month when it is shorter."""
+    month_index = date.year * 12 + date.month - 1 + months
+    year, month = divmod(month_index, 12)
+    return datetime.date(year, month + 1, min(day, calendar.monthrange(year, month + 1)[1]))
+
+
+def nth_occurrence(recurrence, n):
+    anchor = recurrence.anchor_date
+    if recurrence.frequency == Recurrence.Frequency.DAILY:
+        return anchor + datetime.timedelta(days=n * recurrence.interval)
+    if recurrence.frequency == Recurrence.Frequency.WEEKLY:
+        return anchor + datetime.timedelta(weeks=n * recurrence.interval)
+    months = 12 if recurrence.frequency == Recurrence.Frequency.YEARLY else 1
+    # Always count from the anchor so a month-end anchor keeps landing on month ends.
+    return add_months(anchor, n * recurrence.interval * months, anchor.day)
+
+
+def occurrence_dates(recurrence, after, through):
+    """
+    Occurrence dates after `after` up to and including `through` (and the schedule's end date).
+    The anchor itself belongs to the template transaction and is never generated.
+    """
+    if recurrence.end_date is not None:
+        through = min(through, recurrence.end_date)
+    # Jump close to `after` instead of walking every period since the anchor.
+    elapsed = (after - recurrence.anchor_date).days
+    days_per_period = {
+        Recurrence.Frequency.DAILY: 1, Recurrence.Frequency.WEEKLY: 7,
+        Recurrence.Frequency.MONTHLY: 31, Recurrence.Frequency.YEARLY: 366,
+    }[recurrence.frequency] * recurrence.interval
+    n = max(1, elapsed // days_per_period)
+    date = nth_occurrence(recurrence, n)
+    while date <= through:
+        if date > after:
+            yield date
+        n += 1
+        date = nth_occurrence(recurrence, n)
+
+
+def build_occurrence(recurrence, date):
+    template = recurrence.transaction
+    return Transaction(
+        date=date, occurrence_date=date, series=recurrence, recurring=True,
+        **{field: getattr(template, field) for field in COPIED_FIELDS}
+    )
+
+
+def due_schedules(through):
+    return (
+        Recurrence.objects.select_related('transaction', 'transaction__account')
+        .filter(anchor_date__lt=through)
+        .filter(Q(materialized_through__isnull=True) | Q(materialized_through__lt=through))
+        .exclude(end_date__lte=F('materialized_through'))
+        .order_by('id')
+    )
+
+
+def materialize(through=None, batch_size=1000):
+    """
+    Generate every occurrence due up to `through` (today by default) for all schedules, catching up
+    any missed periods in one pass. Returns the number of transactions created.
+
+    Occurrences that already exist are skipped, so the job can be rerun safely. Rows are inserted in
+    bulk and balances and rollups are updated once per batch rather than once per row. Schedules are
+    read a batch at a time, paging by id, so memory stays bounded however many are due.
+    """
+    through = through or timezone.localdate()
+    created = 0
+    last_pk = 0
+    while True:
+        schedules = list(due_schedules(through).filter(pk__gt=last_pk)[:batch_size])
+        if not schedules:
+            return created
+        created += materialize_batch(schedules, through, batch_size)
+        last_pk = schedules[-1].pk
+
+
+def materialize_batch(schedules, through, batch_size):
+    with db_transaction.atomic():
+        starts = {recurrence.pk: recurrence.materialized_through or recurrence.anchor_date for recurrence in schedules}
+        # Occurrences already in the window (e.g. from an interrupted run) are skipped, never duplicated.
+        existing = set(
+            Transaction.objects.filter(
+                series__in=schedules, occurrence_date__gt=min(starts.values()), occurrence_date__lte=through
+            ).values_list('series_id', 'occurrence_date')
+        )
+        occurrences = [
+            build_occurrence(recurrence, date)
+            for recurrence in schedules
+            for date in occurrence_dates(recurrence, starts[recurrence.pk], through)
+            if (recurrence.pk, date) not in existing
+        ]
+        occurrences = Transaction.objects.bulk_create(occurrences, batch_size=batch_size)
+
+        ledger.record_bulk_create(occurrences)
+        owners = {recurrence.transaction.account_id: recurrence.transaction.account.account_owner_id
+                  for recurrence in schedules}
+        rollups.record_bulk_create(occurrences, owners)
+        invalidate_users(owners.values())
+        if occurrences:
+            snapshots.refresh(owners.values(), snapshots.earliest(occurrence.date for occurrence in occurrences))
+        Recurrence.objects.filter(pk__in=[recurrence.pk for recurrence in schedules]).update(
+            materialized_through=through, last_updated=timezone.now()
+        )
+    return len(occurrences)
@@ -0,0 +1,177 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction as db_transaction
+from django.db.models import Count, DecimalField, F, Q, Sum
+from django.db.models.functions import Coalesce, TruncMonth
+
+from .ledger import as_decimal
+from .models import Account, MonthlyRollup, Transaction
+
+ROLLUP_FIELDS = ('account_id', 'category_id', 'vendor_id', 'date', 'amount', 'type')
+ZERO = Decimal('0.00')
+
+
+def rollup_key(values):
+    """
+    The (account, category, vendor, month) bucket of a transaction, or None for undated transactions.
+    """
+    if values['date'] is None:
+        return None
+    return values['account_id'], values['category_id'], values['vendor_id'], values['date'].replace(day=1)
+
+
+def contribution(values, sign=1, count=1):
+    """
+    The (inc_total, dec_total, inc_count, dec_count) a transaction adds to its bucket, or `count`
+    transactions of the same type totalling `values['amount']`.
+    """
+    amount = as_decimal(values['amount']) * sign
+    if values['type'] == Transaction.TransactionType.INCREASE:
+        return amount, ZERO, sign * count, 0
+    return ZERO, amount, 0, sign * count
+
+
+def instance_values(instance):
+    return {field: getattr(instance, field) for field in ROLLUP_FIELDS}
+
+
+def collect(changes, values, sign, count=1):
+    key = rollup_key(values)
+    if key is not None:
+        changes[key] = [a + b for a, b in zip(changes[key], contribution(values, sign, count))]
+
+
+def new_changes():
+    return defaultdict(lambda: [ZERO, ZERO, 0, 0])
+
+
+def apply_changes(changes, owners=None):
+    """
+    Add the collected deltas to their rollup rows, creating rows for buckets seen for the first time.
+    `owners` maps account ids to owner ids the caller already knows.
+    """
+    owners = dict(owners or {})
+    for (account_id, category_id, vendor_id, month), (inc_total, dec_total, inc_count, dec_count) in changes.items():
+        if not (inc_total or dec_total or inc_count or dec_count):
+            continue
+        key = {'account_id': account_id, 'category_id': category_id, 'vendor_id': vendor_id, 'month': month}
+        deltas = {
+            'inc_total': F('inc_total') + inc_total,
+            'dec_total': F('dec_total') + dec_total,
+            'inc_count': F('inc_count') + inc_count,
+            'dec_count': F('dec_count') + dec_count,
+        }
+        if MonthlyRollup.objects.filter(**key).update(**deltas):
+            continue
+
+        if account_id not in owners:
+            owners[account_id] = Account.objects.filter(pk=account_id).values_list('account_owner', flat=True).first()
+        try:
+            with db_transaction.atomic():
+                MonthlyRollup.objects.create(
+                    user_id=owners[account_id], inc_total=inc_total, dec_total=dec_total,
+                    inc_count=inc_count, dec_count=dec_count, **key
+                )
+        except IntegrityError:
+            # Another writer created the bucket first; add to it instead.
+            MonthlyRollup.objects.filter(**key).update(**deltas)
+
+
+def record_save(instance, original):
+    changes = new_changes()
+    if original is not None:
+        collect(changes, original, -1)
+    collect(changes, instance_values(instance), 1)
+    apply_changes(changes)
+
+
+def record_delete(instance, original):
+    changes = new_changes()
+    collect(changes, original, -1)
+    apply_changes(changes)
+
+
+def record_bulk_create(transactions, owners=None):
+    changes = new_changes()
+    for transaction in transactions:
+        collect(changes, instance_values(transaction), 1)
+    apply_changes(changes, owners)
+
+
+def record_bulk_change(before, after):
+    """
+    Apply a set-based update or delete given the transaction groups it changed, as before and after
+    it (nothing after a delete); see `bulk.transaction_groups`.
+    """
+    changes = new_changes()
+    for group in before:
+        collect(changes, group, -1, group['count'])
+    for group in after:
+        collect(changes, group, 1, group['count'])
+    apply_changes(changes)
+
+
+def rebuild(account_ids=None, batch_size=1000):
+    """
+    Recompute rollups from the transaction table in one aggregate pass, for every account or only some.
+    Returns the number of rollup rows written.
+    """
+    rollups = MonthlyRollup.objects.all()
+    transactions = Transaction.objects.filter(date__isnull=False)
+    if account_ids is not None:
+        rollups = rollups.filter(account_id__in=account_ids)
+        transactions = transactions.filter(account_id__in=account_ids)
+
+    is_inc = Q(type=Transaction.TransactionType.INCREASE)
+    money = DecimalField(max_digits=14, decimal_places=2)
+    rows = (
+        transactions.annotate(month=TruncMonth('date'))
+        .order_by()
+        .values('account_id', 'account__account_owner', 'category_id', 'vendor_id', 'month')
+        .annotate(
+            inc_total=Coalesce(Sum('amount', filter=is_inc, output_field=money), ZERO),
+            dec_total=Coalesce(Sum('amount', filter=~is_inc, output_field=money), ZERO),
+            inc_count=Count('id', filter=is_inc),
+            dec_count=Count('id', filter=~is_inc),
+        )
+    )
+
+    written = 0
+    with db_transaction.atomic():
+        rollups.delete()
+        batch = []
+        for row in rows.iterator(chunk_size=batch_size):
+            batch.append(MonthlyRollup(
+                user_id=row['account__account_owner'],
+                account_id=row['account_id'],
+                category_id=row['category_id'],
+                vendor_id=row['vendor_id'],
+                month=row['month'],
+                inc_total=row['inc_total'],
+                dec_total=row['dec_total'],
+                inc_count=row['inc_count'],
+                dec_count=row['dec_count'],
+            ))
+            if len(batch) >= batch_size:
+                written += len(MonthlyRollup.objects.bulk_create(batch))
+                batch = []
+        written += len(MonthlyRollup.objects.bulk_create(batch))
+    return written
+
+
+def summary(rollups, *group_by):
+    """
+    Aggregate rollup rows into totals grouped by the given fields, with the net amount alongside.
+    """
+    return (
+        rollups.order_by(*group_by)
+        .values(*group_by)
+        .annotate(
+            income=Sum('inc_total'),
+            spending=Sum('dec_total'),
+            income_count=Sum('inc_count'),
+            spending_count=Sum('dec_count'),
+        )
+        .annotate(net=F('income') - F('spending'))
+    )
@@ -0,0 +1,204 @@
+import threading
+from collections import OrderedDict, defaultdict, deque
+
+from django.db import transaction as db_transaction
+from django.db.models import Count, Max, Subquery
+from django.utils import timezone
+
+from . import rollups
+from .cache import invalidate_users
+from .models import DeletionMark, Rule, Transaction
+
+# Compiled matchers kept per process; the least recently used are dropped beyond this many users.
+MAX_CACHED_MATCHERS = 1000
+
+
+class RuleMatcher:
+    """
+    A user's rules compiled into one Aho-Corasick automaton over their lowercased patterns, so a
+    description is matched against every rule in a single pass over its characters, however many
+    rules there are.
+
+    The automaton is stored as a full transition table (every state has the transitions of its
+    failure states folded in), so the scan is one dict lookup per character. "Starts with" rules
+    are found by following the plain trie from the root along the description instead.
+    """
+
+    def __init__(self, rules):
+        # Conditions and assignments by rule position, in the order rules are tried.
+        self.rules = [
+            (rule.account_id, rule.min_amount, rule.max_amount, rule.vendor_id, rule.category_id)
+            for rule in rules
+        ]
+        self.unconditional = []
+        trie = [{}]
+        contains = [[]]
+        starts_with = [[]]
+        for position, rule in enumerate(rules):
+            if not rule.pattern:
+                self.unconditional.append(position)
+                continue
+            state = 0
+            for character in rule.pattern.lower():
+                if character not in trie[state]:
+                    trie.append({})
+                    contains.append([])
+                    starts_with.append([])
+                    trie[state][character] = len(trie) - 1
+                state = trie[state][character]
+            if rule.match_type == Rule.MatchType.STARTS_WITH:
+                starts_with[state].append(position)
+            else:
+                contains[state].append(position)
+
+        # Breadth first, so every state's failure state is complete before the state itself.
+        transitions = [dict(trie[0])]
+        transitions.extend({} for _ in trie[1:])
+        queue = deque((child, 0) for child in trie[0].values())
+        while queue:
+            state, failure = queue.popleft()
+            transitions[state] = {**transitions[failure], **trie[state]}
+            contains[state] = contains[state] + contains[failure]
+            for character, child in trie[state].items():
+                queue.append((child, transitions[failure].get(character, 0)))
+        self.trie = trie
+        self.transitions = transitions
+        self.contains = contains
+        self.starts_with = starts_with
+
+    def candidates(self, description):
+        """Positions of the rules whose pattern condition the description meets, unordered."""
+        text = description.lower()
+        transitions, contains = self.transitions, self.contains
+        found = list(self.unconditional)
+        state = 0
+        for character in text:
+            state = transitions[state].get(character, 0)
+            if contains[state]:
+                found.extend(contains[state])
+        state = 0
+        for character in text:
+            state = self.trie[state].get(character)
+            if state is None:
+                break
+            found.extend(self.starts_with[state])
+        return found
+
+    def match(self, description, amount, account_id):
+        """
+        The `(vendor id, category id)` the rules assign to a transaction; either is None when
+        no matching rule assigns it.
+        """
+        vendor_id = category_id = None
+        for position in sorted(set(self.candidates(description or ''))):
+            rule_account_id, min_amount, max_amount, rule_vendor_id, rule_category_id = self.rules[position]
+            if rule_account_id is not None and rule_account_id != account_id:
+                continue
+            if min_amount is not None and amount < min_amount or max_amount is not None and amount > max_amount:
+                continue
+            vendor_id = vendor_id or rule_vendor_id
+            category_id = category_id or rule_category_id
+            if vendor_id and category_id:
+                break
+        return vendor_id, category_id
+
+
+cached_matchers = OrderedDict()
+cached_matchers_lock = threading.Lock()
+
+
+def rules_state(user_id):
+    """
+    `(count, MAX(last_updated), latest deletion)` of the user's rules, read in one query: it
+    changes whenever a rule is added, edited or deleted, in this process or any other.
+    """
+    marks = DeletionMark.objects.filter(model=Rule._meta.label_lower, user=user_id)
+    state = Rule.objects.filter(user=user_id).aggregate(
+        count=Count('pk'),
+        updated=Max('last_updated'),
+        deleted=Max(Subquery(marks.values('deleted_at')[:1])),
+    )
+    return state['count'], state['updated'], state['deleted']
+
+
+def matcher_for(user_id):
+    """
+    The user's compiled rules, recompiled only when `rules_state` shows they changed.
+    """
+    state = rules_state(user_id)
+    with cached_matchers_lock:
+        cached = cached_matchers.get(user_id)
+        if cached is not None and cached[0] == state:
+            cached_matchers.move_to_end(user_id)
+            return cached[1]
+
+    matcher = RuleMatcher(list(Rule.objects.filter(user=user_id).order_by('priority', 'id')))
+    with cached_matchers_lock:
+        cached_matchers[user_id] = (state, matcher)
+        cached_matchers.move_to_end(user_id)
+        while len(cached_matchers) > MAX_CACHED_MATCHERS:
+            cached_matchers.popitem(last=False)
+    return matcher
+
+
+def fill_missing(validated_data):
+    """
+    Fill in the vendor and category a new transaction was created without, as validated by its
+    serializer, from the rules of its account's owner. Values the client chose are kept.
+    """
+    if validated_data.get('vendor') and validated_data.get('category'):
+        return
+    account = validated_data['account']
+    if account.account_owner_id is None:
+        return
+    vendor_id, category_id = matcher_for(account.account_owner_id).match(
+        validated_data.get('description'), validated_data.get('amount', 0), account.id
+    )
+    for field, value in (('vendor', vendor_id), ('category', category_id)):
+        if value is not None and not validated_data.get(field):
+            validated_data.pop(field, None)
+            validated_data[field + '_id'] = value
+
+
+def reapply_rules(user_id, batch_size=1000):
+    """
+    Run the user's rules over all their transactions, assigning the vendor and category of the
+    matching rules; fields no rule assigns are left as they are. Transactions getting the same
+    changes are written with one UPDATE per `batch_size` ids, and the rollups of the changed
+    accounts are rebuilt once afterwards rather than adjusted bucket by bucket. Vendors and
+    categories do not move balances, so the ledger and snapshots are untouched.
+    Returns the number of transactions changed.
+    """
+    matcher = matcher_for(user_id)
+    if not matcher.rules:
+        return 0
+    changes = defaultdict(list)
+    account_ids = set()
+    rows = (
+        Transaction.objects.filter(account__account_owner=user_id)
+        .values_list('id', 'description', 'amount', 'account_id', 'vendor_id', 'category_id')
+    )
+    for pk, description, amount, account_id, vendor_id, category_id in rows.iterator(chunk_size=batch_size):
+        new_vendor_id, new_category_id = matcher.match(description, amount, account_id)
+        change = []
+        if new_vendor_id is not None and new_vendor_id != vendor_id:
+            change.append(('vendor_id', new_vendor_id))
+        if new_category_id is not None and new_category_id != category_id:
+            change.append(('category_id', new_category_id))
+        if change:
+            changes[tuple(change)].append(pk)
+            account_ids.add(account_id)
+    if not changes:
+        return 0
+
+    updated = 0
+    now = timezone.now()
+    with db_transaction.atomic():
+        for change, ids in changes.items():
+            for index in range(0, len(ids), batch_size):
+                updated += Transaction.objects.filter(pk__in=ids[index:index + batch_size]).update(
+                    **dict(change), last_updated=now
+                )
+        rollups.rebuild(account_ids)
+        invalidate_users([user_id])
+    return updated
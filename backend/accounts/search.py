@@ -0,0 +1,154 @@
+import re
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import F, Lookup, Q
+
+from .models import Transaction, TransactionSearch, Vendor
+
+SEARCH_TABLE = TransactionSearch._meta.db_table
+TRANSACTIONS = Transaction._meta.db_table
+VENDORS = Vendor._meta.db_table
+
+# An FTS5 table keyed by the transaction id. `account` holds the account id as a token so a
+# user's search can be narrowed to their accounts inside the index; bm25 gives it no weight.
+CREATE_TABLE = [
+    "CREATE VIRTUAL TABLE {search} USING fts5(description, vendor, account, prefix='2 3')",
+    "INSERT INTO {search}({search}, rank) VALUES ('rank', 'bm25(10.0, 5.0, 0.0)')",
+]
+# Triggers rather than model signals, so bulk_create, queryset updates and cascades stay in sync too.
+CREATE_TRIGGERS = [
+    """CREATE TRIGGER IF NOT EXISTS {search}_insert AFTER INSERT ON {transactions} BEGIN
+        INSERT INTO {search}(rowid, description, vendor, account)
+        VALUES (new.id, new.description, (SELECT name FROM {vendors} WHERE id = new.vendor_id), new.account_id);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS {search}_update AFTER UPDATE OF description, vendor_id, account_id
+        ON {transactions} BEGIN
+        UPDATE {search} SET description = new.description, account = new.account_id,
+            vendor = (SELECT name FROM {vendors} WHERE id = new.vendor_id)
+        WHERE rowid = new.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS {search}_delete AFTER DELETE ON {transactions} BEGIN
+        DELETE FROM {search} WHERE rowid = old.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS {search}_vendor_rename AFTER UPDATE OF name ON {vendors} BEGIN
+        UPDATE {search} SET vendor = new.name
+        WHERE rowid IN (SELECT id FROM {transactions} WHERE vendor_id = new.id);
+    END""",
+]
+TRIGGERS = ['insert', 'update', 'delete', 'vendor_rename']
+POPULATE = """
+    INSERT INTO {search}(rowid, description, vendor, account)
+    SELECT t.id, t.description, v.name, t.account_id
+    FROM {transactions} t LEFT JOIN {vendors} v ON v.id = t.vendor_id
+"""
+
+
+# Whether each database's SQLite library was built with FTS5, probed once per process.
+fts5_support = {}
+
+
+def is_supported(connection):
+    if connection.vendor != 'sqlite':
+        return False
+    if connection.alias not in fts5_support:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+            fts5_support[connection.alias] = bool(cursor.fetchone()[0])
+    return fts5_support[connection.alias]
+
+
+class Match(Lookup):
+    """`document__match=expression`: the rows of an FTS5 table matching a full-text query."""
+    lookup_name = 'match'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return '%s MATCH %s' % (lhs, rhs), [*lhs_params, *rhs_params]
+
+
+TransactionSearch._meta.get_field('document').register_lookup(Match)
+
+
+def install(using=DEFAULT_DB_ALIAS, **kwargs):
+    """
+    Create the search index and its triggers if they are missing, filling a new index from the
+    existing transactions. Connected to `post_migrate`, since migrations cannot carry the virtual table.
+    """
+    connection = connections[using]
+    if not is_supported(connection):
+        return
+    with connection.cursor() as cursor:
+        if SEARCH_TABLE not in connection.introspection.table_names(cursor):
+            for statement in CREATE_TABLE:
+                cursor.execute(format_sql(statement))
+            cursor.execute(format_sql(POPULATE))
+        for statement in CREATE_TRIGGERS:
+            cursor.execute(format_sql(statement))
+
+
+def drop_triggers(using=DEFAULT_DB_ALIAS, **kwargs):
+    """
+    Drop the triggers keeping the index in sync. Connected to `pre_migrate`: SQLite rebuilds a
+    table to alter it, and the rename at the end fails while triggers refer to the table being
+    replaced. `install` puts them back once migrations are done.
+    """
+    connection = connections[using]
+    if not is_supported(connection):
+        return
+    with connection.cursor() as cursor:
+        for name in TRIGGERS:
+            cursor.execute(format_sql("DROP TRIGGER IF EXISTS {search}_%s" % name))
+
+
+def rebuild(using=DEFAULT_DB_ALIAS):
+    """
+    Refill the search index from the transaction table. Returns the number of indexed transactions.
+    """
+    connection = connections[using]
+    install(using)
+    with connection.cursor() as cursor:
+        cursor.execute(format_sql("DELETE FROM {search}"))
+        cursor.execute(format_sql(POPULATE))
+        cursor.execute(format_sql("INSERT INTO {search}({search}) VALUES ('optimize')"))
+        cursor.execute(format_sql("SELECT count(*) FROM {search}"))
+        return cursor.fetchone()[0]
+
+
+def search_terms(query):
+    return re.findall(r'\w+', query)
+
+
+def match_expression(terms, account_ids=None):
+    """
+    An FTS5 query requiring every term as a prefix, optionally restricted to some accounts.
+    Terms are quoted, so user input can never be read as FTS5 syntax.
+    """
+    expression = ' AND '.join('"%s"*' % term.replace('"', '""') for term in terms)
+    if account_ids is not None:
+        accounts = ' OR '.join(str(int(account_id)) for account_id in sorted(account_ids)) or '0'
+        expression = 'account:(%s) AND %s' % (accounts, expression)
+    return expression
+
+
+def search_transactions(queryset, query, account_ids=None):
+    """
+    Narrow a transaction queryset to rows matching every term of `query`, best matches first.
+
+    `account_ids` restricts the index lookup itself, which keeps searches over a few accounts fast
+    no matter how many transactions other users have. Databases without FTS5 fall back to substring matching.
+    """
+    terms = search_terms(query)
+    if not is_supported(connections[queryset.db]):
+        for term in terms:
+            queryset = queryset.filter(Q(description__icontains=term) | Q(vendor__name__icontains=term))
+        return queryset.order_by('-date', '-id')
+
+    # A join on the index rowid, so MATCH and the rank are evaluated once per query rather than per row.
+    return queryset.filter(search_entry__document__match=match_expression(terms, account_ids)).annotate(
+        search_rank=F('search_entry__rank'),
+    ).order_by('search_rank', '-date', '-id')
+
+
+def format_sql(statement):
+    return statement.format(search=SEARCH_TABLE, transactions=TRANSACTIONS, vendors=VENDORS)
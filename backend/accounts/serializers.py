@@ -1,7 +1,11 @@
 from django.contrib.auth.models import Group
+from django.db import IntegrityError, transaction
 from rest_framework import serializers
 
-from .models import Category, User, Vendor, Account, Transaction
+from .models import Category, User, Vendor, Account, MonthlyRollup, NetWorthSnapshot, Recurrence, Rule, Transaction, \
+    normalize_vendor_name
+from .ownership import owned_account_ids
+from .rules import fill_missing
 
 
 class UserSerializer(serializers.HyperlinkedModelSerializer):
@@ -23,7 +27,25 @@ class CategorySerializer(serializers.HyperlinkedModelSerializer):
 class VendorSerializer(serializers.HyperlinkedModelSerializer):
     class Meta:
         model = Vendor
-        fields = ['id', 'url', 'name', 'created', 'last_updated']
+        fields = ['id', 'url', 'name', 'normalized_name', 'created', 'last_updated']
+        read_only_fields = ['normalized_name']
+
+    def validate_name(self, value):
+        # Creating an existing vendor returns it (see VendorViewSet.create); renaming one onto another is an error.
+        if self.instance is not None:
+            others = Vendor.objects.exclude(pk=self.instance.pk)
+            if others.filter(normalized_name=normalize_vendor_name(value)).exists():
+                raise serializers.ValidationError(Vendor.DUPLICATE_NAME)
+        return value
+
+    def update(self, instance, validated_data):
+        # The check above can lose a race with a concurrent rename onto the same name; the unique
+        # column then rejects the write, which is the same validation error.
+        try:
+            with transaction.atomic():
+                return super().update(instance, validated_data)
+        except IntegrityError:
+            raise serializers.ValidationError({'name': [Vendor.DUPLICATE_NAME]})
 
 class AccountSerializer(serializers.HyperlinkedModelSerializer):
     account_owner = serializers.PrimaryKeyRelatedField(queryset=User.objects.all())
@@ -42,6 +64,16 @@ class AccountSerializer(serializers.HyperlinkedModelSerializer):
             'created',
             'last_updated'
         ]
+        read_only_fields = ['latest_transaction_id']
+
+    def update(self, instance, validated_data):
+        # After creation the balance belongs to the ledger; only write the fields the client changed
+        # so a concurrent balance update is never overwritten with a stale value.
+        validated_data.pop('current_balance', None)
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        instance.save(update_fields=[*validated_data, 'last_updated'])
+        return instance
 
 class TransactionSerializer(serializers.HyperlinkedModelSerializer):
     class Meta:
@@ -58,6 +90,139 @@ class TransactionSerializer(serializers.HyperlinkedModelSerializer):
             'account',
             'paid_off',
             'recurring',
+            'series',
+            'occurrence_date',
+            'created',
+            'last_updated'
+        ]
+        read_only_fields = ['series', 'occurrence_date']
+
+    def create(self, validated_data):
+        fill_missing(validated_data)
+        return super().create(validated_data)
+
+class RecurrenceSerializer(serializers.HyperlinkedModelSerializer):
+    class Meta:
+        model = Recurrence
+        fields = [
+            'id',
+            'url',
+            'transaction',
+            'frequency',
+            'interval',
+            'anchor_date',
+            'end_date',
+            'materialized_through',
             'created',
             'last_updated'
-        ]
\ No newline at end of file
+        ]
+        read_only_fields = ['materialized_through']
+        extra_kwargs = {'anchor_date': {'required': False}, 'interval': {'min_value': 1}}
+
+    def validate_transaction(self, value):
+        request = self.context['request']
+        if not (request.user.is_staff or request.user.is_superuser) and value.account_id not in owned_account_ids(request):
+            raise serializers.ValidationError("You do not own this transaction.")
+        return value
+
+    def validate(self, attrs):
+        transaction = attrs.get('transaction') or getattr(self.instance, 'transaction', None)
+        anchor_date = attrs.get('anchor_date') or getattr(self.instance, 'anchor_date', None) or transaction.date
+        if anchor_date is None:
+            raise serializers.ValidationError({'anchor_date': ["Required when the transaction has no date."]})
+        end_date = attrs.get('end_date', getattr(self.instance, 'end_date', None))
+        if end_date is not None and end_date < anchor_date:
+            raise serializers.ValidationError({'end_date': ["Must not be before the anchor date."]})
+        attrs['anchor_date'] = anchor_date
+        return attrs
+
+    def create(self, validated_data):
+        # The template covers the anchor occurrence; materializing starts after it.
+        validated_data['materialized_through'] = validated_data['anchor_date']
+        recurrence = super().create(validated_data)
+        template = recurrence.transaction
+        if not template.recurring:
+            template.recurring = True
+            template.save(update_fields=['recurring', 'last_updated'])
+        return recurrence
+
+class RuleSerializer(serializers.HyperlinkedModelSerializer):
+    user = serializers.HiddenField(default=serializers.CurrentUserDefault())
+
+    class Meta:
+        model = Rule
+        fields = [
+            'id',
+            'url',
+            'user',
+            'priority',
+            'match_type',
+            'pattern',
+            'account',
+            'min_amount',
+            'max_amount',
+            'vendor',
+            'category',
+            'created',
+            'last_updated'
+        ]
+
+    def validate_account(self, value):
+        request = self.context['request']
+        if value is not None and value.account_owner_id != request.user.id:
+            raise serializers.ValidationError("You do not own this account.")
+        return value
+
+    def validate(self, attrs):
+        def current(field):
+            return attrs.get(field, getattr(self.instance, field, None))
+
+        if current('vendor') is None and current('category') is None:
+            raise serializers.ValidationError("A rule must assign a vendor or a category.")
+        min_amount, max_amount = current('min_amount'), current('max_amount')
+        if min_amount is not None and max_amount is not None and max_amount < min_amount:
+            raise serializers.ValidationError({'max_amount': ["Must not be less than the minimum amount."]})
+        return attrs
+
+class MonthlyRollupSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = MonthlyRollup
+        fields = [
+            'id',
+            'account',
+            'category',
+            'vendor',
+            'month',
+            'inc_total',
+            'dec_total',
+            'inc_count',
+            'dec_count'
+        ]
+
+class NetWorthSnapshotSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = NetWorthSnapshot
+        fields = [
+            'id',
+            'date',
+            'account_type',
+            'mortgage',
+            'total'
+        ]
+
+
+class BalancePointSerializer(serializers.Serializer):
+    """One point of an account's balance series."""
+    date = serializers.DateField()
+    balance = serializers.DecimalField(max_digits=14, decimal_places=2)
+
+
+class NetWorthPointSerializer(serializers.Serializer):
+    """One day of the net worth trend: the total of each account type and of mortgages."""
+    date = serializers.DateField()
+
+    def get_fields(self):
+        fields = super().get_fields()
+        for key in [*(type.name.lower() for type in Account.AccountType), 'mortgage']:
+            fields[key] = serializers.DecimalField(max_digits=14, decimal_places=2)
+        return fields
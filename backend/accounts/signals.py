@@ -0,0 +1,172 @@
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import ledger, rollups, snapshots
+from .cache import invalidate_accounts, invalidate_all, invalidate_users
+from .conditional import account_owner_id, record_deletion
+from .models import Account, Category, MonthlyRollup, Recurrence, Rule, Transaction, User, Vendor
+
+# Stored values the ledger and rollups need to undo a transaction's previous state.
+TRACKED_FIELDS = rollups.ROLLUP_FIELDS
+
+
+@receiver(pre_save, sender=Transaction)
+def capture_transaction_state(sender, instance, raw=False, **kwargs):
+    """
+    Stash the stored values of an existing transaction before it is overwritten.
+    """
+    if raw:
+        return
+    instance._original_values = None if instance._state.adding else ledger.original_values(instance, TRACKED_FIELDS)
+
+
+@receiver(post_save, sender=Transaction)
+def apply_transaction_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    original = None if created else instance._original_values
+    ledger.record_save(instance, original)
+    rollups.record_save(instance, original)
+    snapshots.record_save(instance, original)
+    invalidate_accounts({instance.account_id} | ({original['account_id']} if original else set()))
+
+
+def deleted_along_with(origin, *models):
+    """
+    Whether a cascaded delete started from an instance of one of these models, or from a queryset
+    of them (`QuerySet.delete()`, as the admin's "delete selected" action uses).
+    """
+    if isinstance(origin, QuerySet):
+        return issubclass(origin.model, models)
+    return isinstance(origin, models)
+
+
+@receiver(pre_delete, sender=Transaction)
+def capture_deleted_transaction_state(sender, instance, origin=None, **kwargs):
+    # Transactions removed because their account is being deleted have no balance or rollups left to maintain.
+    if deleted_along_with(origin, Account):
+        instance._original_values = None
+        return
+    instance._original_values = ledger.original_values(instance, TRACKED_FIELDS)
+
+
+@receiver(post_delete, sender=Transaction)
+def apply_transaction_delete(sender, instance, origin=None, **kwargs):
+    if instance._original_values is None:
+        return
+    ledger.record_delete(instance, instance._original_values)
+    rollups.record_delete(instance, instance._original_values)
+    snapshots.record_delete(instance, instance._original_values)
+    owner_id = account_owner_id(instance._original_values['account_id'])
+    record_deletion(Transaction, owner_id)
+    invalidate_users([owner_id])
+
+
+# Fields of an account that place its balance in a user's net worth snapshots.
+GROUP_FIELDS = ('account_owner_id', 'account_type', 'mortgage')
+SNAPSHOT_FIELDS = (*GROUP_FIELDS, 'opening_balance')
+
+
+# Connected before invalidate_account_responses, which moves the stored values on to the new ones.
+@receiver(post_save, sender=Account)
+def refresh_account_snapshots(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    loaded = getattr(instance, '_loaded_values', None)
+    if created:
+        snapshots.record_account_create(instance)
+    elif loaded is None:
+        snapshots.refresh([instance.account_owner_id])
+    elif any(loaded.get(field) != getattr(instance, field) for field in GROUP_FIELDS):
+        # A move to another group is rare; rebuild the owners' history rather than shift it.
+        snapshots.refresh([loaded.get('account_owner_id'), instance.account_owner_id])
+    elif loaded.get('opening_balance') != instance.opening_balance:
+        if loaded.get('opening_balance') is None or instance.opening_balance is None:
+            snapshots.refresh([instance.account_owner_id])
+        else:
+            delta = ledger.as_decimal(instance.opening_balance) - loaded['opening_balance']
+            snapshots.record_opening_change(instance, delta)
+
+
+@receiver(post_save, sender=Account)
+def invalidate_account_responses(sender, instance, raw=False, **kwargs):
+    # Both the new and, when the owner changed, the previous owner's responses include this account.
+    previous_owner_id = getattr(instance, '_loaded_values', {}).get('account_owner_id')
+    invalidate_users([instance.account_owner_id, previous_owner_id])
+    if hasattr(instance, '_loaded_values'):
+        # So saving the instance again applies only what changed since.
+        instance._loaded_values.update({field: getattr(instance, field) for field in SNAPSHOT_FIELDS})
+
+
+@receiver(pre_delete, sender=Account)
+def remove_account_snapshots(sender, instance, **kwargs):
+    # Before the delete, while its transactions are still there to subtract.
+    snapshots.record_account_delete(instance.pk)
+
+
+@receiver(post_delete, sender=Account)
+def mark_account_deletion(sender, instance, **kwargs):
+    record_deletion(Account, instance.account_owner_id)
+    invalidate_users([instance.account_owner_id])
+    snapshots.drop_empty_group(instance.account_owner_id, instance.account_type, instance.mortgage)
+
+
+@receiver(post_delete, sender=Recurrence)
+def mark_recurrence_deletion(sender, instance, origin=None, **kwargs):
+    # Schedules deleted along with their transaction or account are covered by that deletion's mark.
+    if deleted_along_with(origin, Transaction, Account):
+        return
+    owner_id = Account.objects.filter(transaction=instance.transaction_id).values_list('account_owner', flat=True).first()
+    record_deletion(Recurrence, owner_id)
+
+
+@receiver(post_delete, sender=Rule)
+def mark_rule_deletion(sender, instance, origin=None, **kwargs):
+    # Tells compiled rule sets to recompile; a deleted user's rules have nobody left to compile for.
+    if deleted_along_with(origin, User):
+        return
+    record_deletion(Rule, instance.user_id)
+
+
+@receiver(post_save, sender=Account)
+def move_rollups_with_owner(sender, instance, created, raw=False, **kwargs):
+    if raw or created:
+        return
+    MonthlyRollup.objects.filter(account=instance).exclude(user_id=instance.account_owner_id).update(
+        user_id=instance.account_owner_id
+    )
+
+
+@receiver(pre_delete, sender=Category)
+@receiver(pre_delete, sender=Vendor)
+def capture_rollup_accounts(sender, instance, **kwargs):
+    field = 'category' if sender is Category else 'vendor'
+    instance._rollup_accounts = list(
+        MonthlyRollup.objects.filter(**{field: instance}).values_list('account', flat=True).distinct()
+    )
+
+
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=Vendor)
+def rebuild_rollups_without(sender, instance, **kwargs):
+    """
+    Deleting a category or vendor un-assigns it from transactions; fold their totals into the unassigned buckets.
+    """
+    if instance._rollup_accounts:
+        rollups.rebuild(instance._rollup_accounts)
+
+
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=Vendor)
+def mark_shared_deletion(sender, instance, **kwargs):
+    # Shared by every user, so the mark has no owner and invalidates everyone's validators.
+    record_deletion(sender)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Vendor)
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=Vendor)
+def invalidate_shared_responses(sender, instance, **kwargs):
+    invalidate_all()
@@ -0,0 +1,288 @@
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction as db_transaction
+from django.db.models import Case, F, Max, Min, OuterRef, Q, Subquery, Sum, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .ledger import ZERO, as_decimal, signed_amount, signed_amount_expression
+from .models import Account, NetWorthSnapshot, Transaction
+
+ONE_DAY = timedelta(days=1)
+# Users recomputed per pass, bounding memory and the size of the id lists in queries.
+USERS_PER_PASS = 500
+
+
+def account_groups(user_ids=None):
+    """
+    Every owned account's `(user, account type, mortgage)` group and opening balance, by account id.
+    Accounts created before opening balances were recorded start from their current balance less
+    the ledger, as `ledger.reconcile` assumes.
+    """
+    accounts = Account.objects.filter(account_owner__isnull=False)
+    if user_ids is not None:
+        accounts = accounts.filter(account_owner__in=user_ids)
+    groups, openings, legacy = {}, {}, []
+    for account in accounts.values(
+        'id', 'account_owner', 'account_type', 'mortgage', 'opening_balance', 'current_balance'
+    ):
+        groups[account['id']] = (account['account_owner'], account['account_type'], account['mortgage'])
+        openings[account['id']] = account['opening_balance']
+        if account['opening_balance'] is None:
+            legacy.append(account['id'])
+            openings[account['id']] = account['current_balance']
+    if legacy:
+        for row in (
+            Transaction.objects.filter(account_id__in=legacy).order_by().values('account_id')
+            .annotate(total=Sum(signed_amount_expression()))
+        ):
+            openings[row['account_id']] -= as_decimal(row['total'])
+    return groups, openings
+
+
+def compute(user_ids, start, end):
+    """
+    Yield unsaved snapshots for every day from `start` (with None, each user's first transaction)
+    through `end`, for every group of these users (every user with accounts with None).
+
+    One aggregate query sums signed amounts per account and day over the covering
+    `(account, date, type, amount)` index; transactions before `start`, and undated ones, are
+    summed into the opening carry. Days without transactions repeat the previous day's totals.
+    """
+    groups, openings = account_groups(user_ids)
+    running = defaultdict(Decimal)
+    for account_id, (user_id, account_type, mortgage) in groups.items():
+        running[user_id, account_type, mortgage] += openings[account_id]
+
+    day = F('date') if start is None else Case(When(date__lt=start, then=None), default=F('date'))
+    nets = defaultdict(lambda: defaultdict(Decimal))
+    first_days = {}
+    transactions = Transaction.objects.filter(account__account_owner__isnull=False)
+    if user_ids is not None:
+        transactions = transactions.filter(account__account_owner__in=user_ids)
+    for row in (
+        transactions.exclude(date__gt=end)
+        .order_by().values('account_id', day=day).annotate(net=Sum(signed_amount_expression()))
+    ):
+        group = groups[row['account_id']]
+        if row['day'] is None:
+            running[group] += as_decimal(row['net'])
+        else:
+            nets[group][row['day']] += as_decimal(row['net'])
+            first_days[group[0]] = min(row['day'], first_days.get(group[0], row['day']))
+
+    for (user_id, account_type, mortgage), total in sorted(running.items()):
+        group_nets = nets[user_id, account_type, mortgage]
+        date = start or first_days.get(user_id, end)
+        while date <= end:
+            total += group_nets.get(date, ZERO)
+            yield NetWorthSnapshot(user_id=user_id, date=date, account_type=account_type, mortgage=mortgage, total=total)
+            date += ONE_DAY
+
+
+def rebuild(user_ids=None, start=None, end=None, batch_size=1000):
+    """
+    Recompute the snapshots of these users (every user by default) from `start` through `end`
+    (today by default), replacing the stored ones from `start` on. Returns the number written.
+    """
+    end = end or timezone.localdate()
+    if user_ids is not None and len(user_ids) > USERS_PER_PASS:
+        user_ids = sorted(user_ids)
+        return sum(
+            rebuild(user_ids[index:index + USERS_PER_PASS], start, end, batch_size)
+            for index in range(0, len(user_ids), USERS_PER_PASS)
+        )
+    snapshots = NetWorthSnapshot.objects.all()
+    if user_ids is not None:
+        snapshots = snapshots.filter(user_id__in=user_ids)
+    if start is not None:
+        snapshots = snapshots.filter(date__gte=start)
+
+    written = 0
+    with db_transaction.atomic():
+        snapshots.delete()
+        batch = []
+        for snapshot in compute(user_ids, start, end):
+            batch.append(snapshot)
+            if len(batch) >= batch_size:
+                written += len(NetWorthSnapshot.objects.bulk_create(batch))
+                batch = []
+        written += len(NetWorthSnapshot.objects.bulk_create(batch))
+    return written
+
+
+def fill(end=None, batch_size=1000):
+    """
+    Extend every user's snapshots through `end` (today by default), backfilling users without
+    any from their first transaction. Users are processed together per starting day, so a daily
+    run is one pass for everyone. Returns the number of snapshots written.
+    """
+    end = end or timezone.localdate()
+    latest = dict(NetWorthSnapshot.objects.values('user').annotate(latest=Max('date')).values_list('user', 'latest'))
+    owners = set(Account.objects.filter(account_owner__isnull=False).values_list('account_owner', flat=True))
+
+    starts = defaultdict(list)
+    for user_id in owners:
+        if user_id not in latest:
+            starts[None].append(user_id)
+        elif latest[user_id] < end:
+            starts[latest[user_id] + ONE_DAY].append(user_id)
+    return sum(rebuild(sorted(user_ids), start, end, batch_size) for start, user_ids in starts.items())
+
+
+def refresh(user_ids, since=None):
+    """
+    Recompute the stored snapshots of these users from `since` (from the start with None), after
+    changes not tracked row by row: bulk writes and accounts moving between groups. Users without
+    snapshots are left to the next `fill`.
+    """
+    user_ids = {user_id for user_id in user_ids if user_id is not None}
+    if not user_ids:
+        return
+    latest = (
+        NetWorthSnapshot.objects.filter(user__in=user_ids).values('user').annotate(latest=Max('date'))
+        .values_list('user', 'latest')
+    )
+    ends = defaultdict(list)
+    for user_id, end in latest:
+        ends[end].append(user_id)
+    for end, ids in ends.items():
+        rebuild(ids, since, end)
+
+
+def earliest(dates):
+    """The first of these transaction dates to refresh from; None, for everything, if any is undated."""
+    dates = list(dates)
+    return None if None in dates else min(dates, default=None)
+
+
+def record_save(instance, original):
+    changes = defaultdict(Decimal)
+    if original is not None:
+        changes[original['account_id'], original['date']] -= signed_amount(original['type'], original['amount'])
+    changes[instance.account_id, instance.date] += signed_amount(instance.type, as_decimal(instance.amount))
+    apply_changes(changes)
+
+
+def record_delete(instance, original):
+    changes = {(original['account_id'], original['date']): -signed_amount(original['type'], original['amount'])}
+    apply_changes(changes)
+
+
+def apply_changes(changes):
+    """
+    Add signed amounts, keyed by `(account id, transaction date)`, to the snapshots of that
+    account's group from the transaction date on: one update each, matching nothing when the
+    transaction is dated after the latest snapshot.
+    """
+    changes = {key: delta for key, delta in changes.items() if delta}
+    if not changes:
+        return
+    groups = {
+        account['id']: account
+        for account in Account.objects.filter(pk__in={account_id for account_id, _ in changes})
+        .values('id', 'account_owner', 'account_type', 'mortgage')
+    }
+    for (account_id, date), delta in changes.items():
+        account = groups.get(account_id)
+        if account is None or account['account_owner'] is None:
+            continue
+        snapshots = NetWorthSnapshot.objects.filter(
+            user=account['account_owner'], account_type=account['account_type'], mortgage=account['mortgage']
+        )
+        if date is not None:
+            snapshots = snapshots.filter(date__gte=date)
+        snapshots.update(total=F('total') + delta)
+
+
+def group_snapshots(user_id, account_type, mortgage):
+    return NetWorthSnapshot.objects.filter(user=user_id, account_type=account_type, mortgage=mortgage)
+
+
+def record_account_create(account):
+    """
+    Add a new account's opening balance to its group's snapshots with one update or, when its
+    owner has snapshots but none of this group, insert the group for each of the owner's days.
+    """
+    if account.account_owner_id is None:
+        return
+    opening = as_decimal(account.opening_balance)
+    if group_snapshots(account.account_owner_id, account.account_type, account.mortgage).update(
+        total=F('total') + opening
+    ):
+        return
+    days = NetWorthSnapshot.objects.filter(user=account.account_owner_id).aggregate(first=Min('date'), last=Max('date'))
+    if days['first'] is None:
+        return
+    NetWorthSnapshot.objects.bulk_create(
+        NetWorthSnapshot(
+            user_id=account.account_owner_id, date=days['first'] + offset * ONE_DAY,
+            account_type=account.account_type, mortgage=account.mortgage, total=opening,
+        )
+        for offset in range((days['last'] - days['first']).days + 1)
+    )
+
+
+def record_opening_change(account, delta):
+    """Shift every snapshot of the account's group by the change in its opening balance, in one update."""
+    if account.account_owner_id is not None and delta:
+        group_snapshots(account.account_owner_id, account.account_type, account.mortgage).update(
+            total=F('total') + delta
+        )
+
+
+def record_account_delete(account_id):
+    """
+    Take an account about to be deleted, with its transactions, out of its group's snapshots:
+    its opening balance and, per day, its transactions dated up to that day, in one update.
+    """
+    account = Account.objects.filter(pk=account_id).values('account_owner').first()
+    if account is None or account['account_owner'] is None:
+        return
+    groups, openings = account_groups([account['account_owner']])
+    dated_through = (
+        Transaction.objects.filter(Q(date__lte=OuterRef('date')) | Q(date__isnull=True), account_id=account_id)
+        .order_by().values('account_id').annotate(total=Sum(signed_amount_expression())).values('total')
+    )
+    group_snapshots(*groups[account_id]).update(
+        total=F('total') - openings[account_id] - Coalesce(Subquery(dated_through), ZERO)
+    )
+
+
+def drop_empty_group(user_id, account_type, mortgage):
+    """
+    Once a group's last account is deleted, delete its snapshots too, as a rebuild would. Checked
+    after the delete, since accounts deleted together all still exist before it.
+    """
+    if user_id is None:
+        return
+    if not Account.objects.filter(account_owner=user_id, account_type=account_type, mortgage=mortgage).exists():
+        group_snapshots(user_id, account_type, mortgage).delete()
+
+
+def current_totals(user, today=None):
+    """
+    The user's totals per `(account type, mortgage)` as of today: the latest snapshot plus the
+    transactions dated since it, in two queries. Returns `(snapshot date, totals)`, or
+    `(None, {})` when the user has no snapshots yet.
+    """
+    today = today or timezone.localdate()
+    snapshots = NetWorthSnapshot.objects.filter(user=user, date__lte=today)
+    latest = snapshots.order_by('-date').values('date')[:1]
+    totals, date = {}, None
+    for snapshot in snapshots.filter(date=latest).values('date', 'account_type', 'mortgage', 'total'):
+        date = snapshot['date']
+        totals[snapshot['account_type'], snapshot['mortgage']] = snapshot['total']
+    if date is None or date == today:
+        return date, totals
+
+    for row in (
+        Transaction.objects.filter(account__account_owner=user, date__gt=date, date__lte=today)
+        .order_by().values('account__account_type', 'account__mortgage')
+        .annotate(net=Sum(signed_amount_expression()))
+    ):
+        key = row['account__account_type'], row['account__mortgage']
+        totals[key] = totals.get(key, ZERO) + as_decimal(row['net'])
+    return date, totals
@@ -0,0 +1,122 @@
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import permissions, relations, serializers
+
+from .flat import FlatPlan
+
+FIELDS_PARAM = 'fields'
+EXCLUDE_PARAM = 'exclude'
+
+
+def parse_field_names(value):
+    return {name.strip() for name in value.split(',') if name.strip()}
+
+
+class ColumnPlan:
+    """
+    What a queryset must load for a set of serializer fields: the model columns, for `only()`,
+    the foreign keys whose related rows are read, for `select_related()`, and the many-valued
+    relations, for `prefetch_related()`.
+
+    Related fields rendered as a pk or a pk-based hyperlink need only the foreign key column, so
+    they add no join. `complete` is False when a field reads something other than model fields
+    (a method, a property, the whole instance), in which case no column may be left out.
+    """
+
+    def __init__(self, model, fields):
+        self.columns = set()
+        self.joins = set()
+        self.prefetches = set()
+        self.complete = True
+        for field in fields:
+            if isinstance(field, relations.HyperlinkedIdentityField):
+                continue
+            if field.source == '*':
+                self.complete = False
+                continue
+            self.add(model, field)
+
+    def add(self, model, field):
+        name, *path = field.source_attrs
+        try:
+            model_field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            self.complete = False
+            return
+        if model_field.many_to_many or model_field.one_to_many:
+            self.prefetches.add(name)
+        elif model_field.is_relation and (path or not self.reads_pk_only(field)):
+            # A dotted source or a nested representation reads the related row itself.
+            self.joins.add(name)
+            self.columns.add('__'.join([name, *path]) if path else name)
+        else:
+            self.columns.add(name)
+
+    @staticmethod
+    def reads_pk_only(field):
+        return isinstance(field, relations.RelatedField) and field.use_pk_only_optimization()
+
+    def apply(self, queryset, required=()):
+        if self.complete:
+            queryset = queryset.only(*self.columns, *required)
+        if self.joins:
+            queryset = queryset.select_related(*self.joins)
+        if self.prefetches:
+            queryset = queryset.prefetch_related(*self.prefetches)
+        return queryset
+
+
+class SparseFieldsMixin:
+    """
+    Let read requests choose the fields they get: `?fields=id,date,amount` keeps only those and
+    `?exclude=created,last_updated` drops those. The serializer is trimmed to the chosen fields
+    and the queryset loads only the columns they read, joining related rows only for chosen
+    fields that read them. Unknown names are rejected with a 400. Writes always use every field.
+    """
+    # Columns the view reads from its objects whatever the fields, such as the ones ownership
+    # checks, pagination or the conditional GET validators use.
+    required_columns = ()
+
+    def sparse_fields(self):
+        """The names of the fields chosen by the request, or None when it chose none."""
+        if not hasattr(self, '_sparse_fields'):
+            self._sparse_fields = None
+            params = self.request.query_params
+            if self.request.method in permissions.SAFE_METHODS and (FIELDS_PARAM in params or EXCLUDE_PARAM in params):
+                self._sparse_fields = self.choose_fields(params)
+        return self._sparse_fields
+
+    def choose_fields(self, params):
+        serializer = self.get_serializer_class()(context=self.get_serializer_context())
+        readable = [name for name, field in serializer.fields.items() if not field.write_only]
+        chosen = set(readable)
+        for param in (FIELDS_PARAM, EXCLUDE_PARAM):
+            if param not in params:
+                continue
+            names = parse_field_names(params[param])
+            unknown = sorted(names - set(readable))
+            if unknown:
+                raise serializers.ValidationError({param: ['Unknown fields: %s.' % ', '.join(unknown)]})
+            chosen = chosen & names if param == FIELDS_PARAM else chosen - names
+        return chosen
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        chosen = self.sparse_fields()
+        if chosen is not None:
+            fields = getattr(serializer, 'child', serializer).fields
+            for name in [name for name, field in fields.items() if name not in chosen and not field.write_only]:
+                del fields[name]
+        return serializer
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.sparse_fields() is None:
+            return queryset
+        fields = [field for field in self.get_serializer().fields.values() if not field.write_only]
+        return ColumnPlan(queryset.model, fields).apply(queryset, self.required_columns)
+
+    def get_flat_plan(self):
+        # Trimmed plans depend on the request, so unlike full ones they are not kept.
+        if self.sparse_fields() is None:
+            return super().get_flat_plan()
+        return FlatPlan(self.get_serializer())
@@ -1,8 +1,51 @@
-from rest_framework.test import APITestCase, APIClient
-from rest_framework import status
-from .models import User, Category, Vendor, Account, Transaction
+import csv
+import datetime
+import io
+import json
+import os
+import tempfile
+from decimal import Decimal
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connection, connections, router
+from django.db.models import F
+from django.template.loader import render_to_string
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.contrib.auth.models import Group
+from guardian.shortcuts import assign_perm
+from rest_framework.parsers import JSONParser
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory, APITestCase, APIClient
+from rest_framework import serializers, status
+from .access import GuardianAccessBackend, OwnerAccessBackend, accessible_accounts
+from . import search
+from .cache import LRUCache
+from .dashboard import RECENT_TRANSACTION_LIMIT, build_dashboard
+from .database import REPLICA_DB_ALIAS, track_writes
+from .importers import TransactionImporter, parse_csv
+from .ledger import reconcile
+from .metrics import Histogram, registry
+from .models import User, Category, Vendor, Account, DeletionMark, MonthlyRollup, NetWorthSnapshot, Recurrence, Rule, \
+    Transaction, normalize_vendor_name
+from .pagination import KeysetPagination
+from .permissions import IsOwnerOrAdmin
+from .recurrence import materialize, occurrence_dates
+from .rules import RuleMatcher, matcher_for
+from .serializers import VendorSerializer
+from .sparse import ColumnPlan
+from .vendors import fold_duplicates
+from .views import TransactionViewSet
 from django.urls import reverse
 
+# Accounts and the recent transaction window; totals are summed from the loaded accounts.
+DASHBOARD_QUERY_COUNT = 2
+
 class UserTests(APITestCase):
 
     def setUp(self):
@@ -496,3 +539,2060 @@ class TransactionTests(APITestCase):
         self.client.post(self.url, new_transaction_data, format='json')
         unauthorized_response = self.client.get(self.url)
         self.assertEqual(status.HTTP_403_FORBIDDEN, unauthorized_response.status_code)
+
+
+class DashboardTests(TestCase):
+
+    def setUp(self):
+        """Set up accounts of every type with more transactions than the dashboard window."""
+        self.user = User.objects.create_user(username='testuser', password='password123')
+        self.vendor = Vendor.objects.create(name='test-vendor')
+        self.category = Category.objects.create(name='test-category')
+        self.accounts = {}
+        for account_type in Account.AccountType:
+            self.accounts[account_type] = Account.objects.create(
+                name='test-account-' + account_type.label,
+                account_owner=self.user,
+                current_balance=10.00,
+                account_type=account_type,
+            )
+        self.mortgage = Account.objects.create(
+            name='test-mortgage',
+            account_owner=self.user,
+            current_balance=1000.00,
+            account_type=Account.AccountType.DEBT,
+            mortgage=True,
+        )
+
+    def add_transactions(self, count):
+        for account in self.accounts.values():
+            Transaction.objects.bulk_create(
+                Transaction(
+                    vendor=self.vendor,
+                    category=self.category,
+                    description='item ' + str(i),
+                    date=datetime.date(2024, 1, 1) + datetime.timedelta(days=i),
+                    amount=1,
+                    type=Transaction.TransactionType.DECREASE,
+                    account=account,
+                )
+                for i in range(count)
+            )
+
+    def render_dashboard(self):
+        context = build_dashboard(accessible_accounts(self.user))
+        request = RequestFactory().get('/')
+        request.user = self.user
+        render_to_string('accounts/index.html', context, request=request)
+        return context
+
+    def test_dashboard_totals(self):
+        """Test per-type totals exclude mortgage accounts and default to zero."""
+        Account.objects.create(name='second-cash', account_owner=self.user, current_balance=5.50, account_type='C')
+        context = self.render_dashboard()
+        self.assertEqual(Decimal('15.50'), context['total_cash'])
+        self.assertEqual(Decimal('10.00'), context['total_debt'])
+        self.assertEqual([self.mortgage], context['mortgage'])
+        self.assertEqual(2, len(context['cash_accounts']))
+
+    def test_dashboard_recent_transactions_window(self):
+        """Test each account only carries its newest transactions, newest first."""
+        self.add_transactions(RECENT_TRANSACTION_LIMIT + 5)
+        context = self.render_dashboard()
+        recent = context['cash_accounts'][0].recent_transactions
+        self.assertEqual(RECENT_TRANSACTION_LIMIT, len(recent))
+        self.assertEqual(sorted(recent, key=lambda t: t.date, reverse=True), recent)
+        self.assertEqual(
+            Transaction.objects.filter(account=self.accounts['C']).order_by('-date').first(),
+            recent[0]
+        )
+
+    def test_dashboard_query_count_is_constant(self):
+        """Test the dashboard runs the same fixed number of queries however much data exists."""
+        self.add_transactions(3)
+        with self.assertNumQueries(DASHBOARD_QUERY_COUNT):
+            self.render_dashboard()
+
+        self.add_transactions(50)
+        with self.assertNumQueries(DASHBOARD_QUERY_COUNT):
+            self.render_dashboard()
+
+
+class TransactionCursorPaginationTests(APITestCase):
+
+    def setUp(self):
+        """Set up an account with many transactions sharing dates."""
+        self.user = User.objects.create_user(username='testuser', password='password123')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.account = Account.objects.create(
+            name='test-account', account_owner=self.user, current_balance=0, account_type='C'
+        )
+        Transaction.objects.bulk_create(
+            Transaction(
+                description='item ' + str(i),
+                date=None if i < 2 else datetime.date(2024, 1, 1 + i % 4),
+                amount=1,
+                type='DEC',
+                account=self.account,
+            )
+            for i in range(25)
+        )
+        self.expected = list(
+            Transaction.objects.order_by(F('date').asc(nulls_first=True), 'id').values_list('id', flat=True)
+        )
+        self.url = reverse('transaction-list')
+
+    def test_walk_pages_forward_and_back(self):
+        """Test cursor pages cover every row exactly once in (date, id) order in both directions."""
+        seen = []
+        pages = []
+        url = self.url + '?pagination=cursor&page_size=7'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(status.HTTP_200_OK, response.status_code)
+            self.assertNotIn('count', response.data)
+            pages.append([row['id'] for row in response.data['results']])
+            seen.extend(pages[-1])
+            url = response.data['next']
+        self.assertEqual(self.expected, seen)
+
+        url = response.data['previous']
+        for page in reversed(pages[:-1]):
+            response = self.client.get(url)
+            self.assertEqual(page, [row['id'] for row in response.data['results']])
+            url = response.data['previous']
+        self.assertIsNone(url)
+
+    def test_cursor_page_skips_count_query(self):
+        """Test a cursor page runs a single query with no COUNT(*)."""
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.url + '?pagination=cursor&page_size=5')
+        # The only count is the conditional GET validator, read together with MAX(last_updated).
+        counts = [query['sql'] for query in queries.captured_queries if 'COUNT(' in query['sql']]
+        self.assertEqual(1, len(counts))
+        self.assertIn('MAX("accounts_transaction"."last_updated")', counts[0])
+
+    def test_invalid_cursor(self):
+        """Test a malformed cursor is rejected."""
+        response = self.client.get(self.url + '?pagination=cursor&cursor=garbage')
+        self.assertEqual(status.HTTP_404_NOT_FOUND, response.status_code)
+
+    def test_page_size_is_capped(self):
+        """Test clients cannot request pages above the maximum size."""
+        response = self.client.get(self.url + '?pagination=cursor&page_size=100000')
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(25, len(response.data['results']))
+        self.assertIsNone(response.data['next'])
+
+    def test_keyset_uses_composite_index(self):
+        """Test a deep page of one account is served from the (account, date, id) index."""
+        position = Transaction.objects.get(id=self.expected[10])
+        queryset = Transaction.objects.filter(account=self.account).filter(
+            KeysetPagination().get_position_filter((position.date, position.id), False)
+        ).order_by(*KeysetPagination().get_ordering(False))
+        with connection.cursor() as cursor:
+            sql, params = queryset.query.sql_with_params()
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            plan = ' '.join(str(row[-1]) for row in cursor.fetchall())
+        self.assertIn('transaction_account_date_id', plan)
+
+
+class TransactionImportTests(APITestCase):
+
+    def setUp(self):
+        """Set up an owned account and another user's account."""
+        self.user = User.objects.create_user(username='testuser', password='password123')
+        self.user2 = User.objects.create_user(username='testuser2', password='password123')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.account = Account.objects.create(
+            name='test-account', account_owner=self.user, current_balance=0, account_type='C'
+        )
+        self.account2 = Account.objects.create(
+            name='other-account', account_owner=self.user2, current_balance=0, account_type='C'
+        )
+        self.vendor = Vendor.objects.create(name='Grocer')
+        self.url = reverse('transaction-import-file')
+
+    def upload(self, name, content, **data):
+        upload = SimpleUploadedFile(name, content.encode('utf-8'))
+        return self.client.post(self.url, {'file': upload, **data}, format='multipart')
+
+    def test_import_csv(self):
+        """Test CSV rows are inserted, reusing existing vendors and creating new categories once."""
+        content = (
+            'date,description,amount,type,vendor,category,account\n'
+            '2024-01-02,weekly shop,12.50,DEC,Grocer,Food,%(a)s\n'
+            '2024-01-03,salary,1000,INC,,Income,%(a)s\n'
+            '2024-01-04,snacks,-3.25,,Grocer,Food,%(a)s\n'
+        ) % {'a': self.account.id}
+        response = self.upload('statement.csv', content)
+        self.assertEqual(status.HTTP_201_CREATED, response.status_code)
+        self.assertEqual(3, response.data['created'])
+        self.assertEqual([], response.data['errors'])
+        self.assertEqual(1, Vendor.objects.filter(name='Grocer').count())
+        self.assertEqual(1, Category.objects.filter(name='Food').count())
+        snacks = Transaction.objects.get(description='snacks')
+        self.assertEqual(Decimal('3.25'), snacks.amount)
+        self.assertEqual('DEC', snacks.type)
+        self.assertEqual(self.vendor, snacks.vendor)
+
+    def test_import_reports_row_errors(self):
+        """Test invalid rows and rows for other users' accounts are reported and skipped."""
+        content = (
+            'date,description,amount,account\n'
+            '2024-01-02,ok,1.00,%(a)s\n'
+            'not-a-date,bad date,1.00,%(a)s\n'
+            '2024-01-02,bad amount,abc,%(a)s\n'
+            '2024-01-02,not mine,1.00,%(b)s\n'
+        ) % {'a': self.account.id, 'b': self.account2.id}
+        response = self.upload('statement.csv', content)
+        self.assertEqual(status.HTTP_201_CREATED, response.status_code)
+        self.assertEqual(1, response.data['created'])
+        self.assertEqual([2, 3, 4], [error['row'] for error in response.data['errors']])
+        self.assertIn('account', response.data['errors'][2]['errors'])
+        self.assertEqual(0, Transaction.objects.filter(account=self.account2).count())
+
+    def test_import_ofx(self):
+        """Test OFX statement transactions are imported into the requested account."""
+        content = (
+            'OFXHEADER:100\n<OFX><BANKMSGSRSV1><STMTTRNRS><STMTRS><BANKTRANLIST>\n'
+            '<STMTTRN>\n<TRNTYPE>DEBIT\n<DTPOSTED>20240105120000\n<TRNAMT>-42.10\n'
+            '<FITID>1\n<NAME>Grocer\n<MEMO>Card purchase\n</STMTTRN>\n'
+            '<STMTTRN>\n<TRNTYPE>CREDIT\n<DTPOSTED>20240106\n<TRNAMT>100.00\n'
+            '<FITID>2\n<NAME>Employer\n</STMTTRN>\n'
+            '</BANKTRANLIST></STMTRS></STMTTRNRS></BANKMSGSRSV1></OFX>\n'
+        )
+        response = self.upload('statement.ofx', content, account=self.account.id)
+        self.assertEqual(status.HTTP_201_CREATED, response.status_code)
+        self.assertEqual(2, response.data['created'])
+        purchase = Transaction.objects.get(description='Card purchase')
+        self.assertEqual(datetime.date(2024, 1, 5), purchase.date)
+        self.assertEqual('DEC', purchase.type)
+        self.assertEqual(self.vendor, purchase.vendor)
+        self.assertEqual('INC', Transaction.objects.get(description='Employer').type)
+
+    def test_import_checks_each_account_once(self):
+        """Test ownership and vendor lookups run once per import, not once per row."""
+        rows = ''.join('2024-01-02,item %d,1.00,Grocer,%s\n' % (i, self.account.id) for i in range(200))
+        importer = TransactionImporter(self.user, batch_size=500)
+        with CaptureQueriesContext(connection) as queries:
+            importer.run(parse_csv(io.StringIO('date,description,amount,vendor,account\n' + rows)))
+        selects = [query['sql'] for query in queries.captured_queries if query['sql'].startswith('SELECT')]
+        self.assertEqual(1, len([sql for sql in selects if 'FROM "accounts_account"' in sql]))
+        self.assertEqual(1, len([sql for sql in selects if 'FROM "accounts_vendor"' in sql]))
+        self.assertEqual(200, Transaction.objects.filter(account=self.account).count())
+
+    def test_import_rejects_unreadable_files(self):
+        """Test a file that is not UTF-8 text, or not valid CSV, is rejected as a whole with a 400."""
+        rows = ''.join('2024-01-02,item %d,1.00,%s\n' % (i, self.account.id) for i in range(1000))
+        content = ('date,description,amount,account\n' + rows).encode('utf-8') + b'2024-01-03,caf\xe9,1.00,1\n'
+        response = self.client.post(self.url, {'file': SimpleUploadedFile('statement.csv', content)}, format='multipart')
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+        self.assertEqual(['The file is not UTF-8 encoded text.'], response.data['file'])
+        self.assertFalse(Transaction.objects.filter(account=self.account).exists())
+
+        field = 'x' * (csv.field_size_limit() + 1)
+        response = self.upload('statement.csv', 'date,description,amount,account\n2024-01-02,%s,1.00,%s\n' % (field, self.account.id))
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+        self.assertTrue(response.data['file'][0].startswith('The file is not valid CSV'))
+
+    def test_import_without_file(self):
+        """Test the endpoint requires a file."""
+        response = self.client.post(self.url, {}, format='multipart')
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+
+    def test_import_command(self):
+        """Test the management command imports a file from disk."""
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as stream:
+            stream.write('date,description,amount\n2024-01-02,from disk,5\n')
+        self.addCleanup(os.remove, stream.name)
+        out = io.StringIO()
+        call_command('import_transactions', stream.name, user='testuser', account=str(self.account.id), stdout=out)
+        self.assertIn('Imported 1 transactions', out.getvalue())
+        self.assertTrue(Transaction.objects.filter(description='from disk', account=self.account).exists())
+
+
+class LedgerTests(APITestCase):
+
+    def setUp(self):
+        """Set up two owned accounts with opening balances."""
+        self.user = User.objects.create_user(username='testuser', password='password123')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.cash = self.client.post(reverse('account-list'), {
+            'name': 'cash', 'account_owner': self.user.id, 'current_balance': 100.00, 'account_type': 'C',
+        }, format='json').data
+        self.savings = self.client.post(reverse('account-list'), {
+            'name': 'savings', 'account_owner': self.user.id, 'current_balance': 0, 'account_type': 'S',
+        }, format='json').data
+        self.url = reverse('transaction-list')
+
+    def balance(self, account):
+        return Account.objects.get(id=account['id']).current_balance
+
+    def create(self, amount, type, account):
+        return self.client.post(self.url, {
+            'description': 'item', 'amount': amount, 'type': type, 'account': account['url'],
+        }, format='json').data
+
+    def test_create_updates_balance_and_latest(self):
+        """Test creating transactions applies signed deltas and records the latest id."""
+        self.create(20.25, 'DEC', self.cash)
+        transaction = self.create(5, 'INC', self.cash)
+        account = Account.objects.get(id=self.cash['id'])
+        self.assertEqual(Decimal('84.75'), account.current_balance)
+        self.assertEqual(transaction['id'], account.latest_transaction_id)
+
+    def test_edit_applies_difference(self):
+        """Test editing the amount and type applies only the difference."""
+        transaction = self.create(10, 'DEC', self.cash)
+        url = reverse('transaction-detail', args=[transaction['id']])
+        self.client.patch(url, {'amount': 15, 'type': 'INC'}, format='json')
+        self.assertEqual(Decimal('115.00'), self.balance(self.cash))
+
+    def test_overlapping_edits_apply_the_stored_amount(self):
+        """Test edits and deletes made from stale copies of a transaction reverse what is stored, not what they loaded."""
+        transaction = self.create(10, 'DEC', self.cash)
+        first = Transaction.objects.get(id=transaction['id'])
+        second = Transaction.objects.get(id=transaction['id'])
+        first.amount = 30
+        first.save()
+        second.amount = 50
+        second.save()
+        self.assertEqual(Decimal('50.00'), self.balance(self.cash))
+        first.delete()
+        self.assertEqual(Decimal('100.00'), self.balance(self.cash))
+
+    def test_move_between_accounts(self):
+        """Test moving a transaction reverses it on the old account and applies it on the new one."""
+        first = self.create(10, 'DEC', self.cash)
+        moved = self.create(30, 'INC', self.cash)
+        url = reverse('transaction-detail', args=[moved['id']])
+        response = self.client.patch(url, {'account': self.savings['url']}, format='json')
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(Decimal('90.00'), self.balance(self.cash))
+        self.assertEqual(Decimal('30.00'), self.balance(self.savings))
+        self.assertEqual(first['id'], Account.objects.get(id=self.cash['id']).latest_transaction_id)
+        self.assertEqual(moved['id'], Account.objects.get(id=self.savings['id']).latest_transaction_id)
+
+    def test_delete_reverses_transaction(self):
+        """Test deleting a transaction reverses it and re-points the latest id."""
+        first = self.create(10, 'DEC', self.cash)
+        second = self.create(5, 'DEC', self.cash)
+        self.client.delete(reverse('transaction-detail', args=[second['id']]))
+        account = Account.objects.get(id=self.cash['id'])
+        self.assertEqual(Decimal('90.00'), account.current_balance)
+        self.assertEqual(first['id'], account.latest_transaction_id)
+
+    def test_balance_is_not_client_writable_after_create(self):
+        """Test clients cannot overwrite a ledger-maintained balance."""
+        self.create(10, 'DEC', self.cash)
+        self.client.patch(self.cash['url'], {'current_balance': 1000, 'name': 'renamed'}, format='json')
+        account = Account.objects.get(id=self.cash['id'])
+        self.assertEqual('renamed', account.name)
+        self.assertEqual(Decimal('90.00'), account.current_balance)
+
+    def test_import_updates_balance(self):
+        """Test bulk imports update balances once per account."""
+        importer = TransactionImporter(self.user, default_account=self.cash['id'])
+        importer.run(parse_csv(io.StringIO('date,description,amount\n2024-01-01,a,-10\n2024-01-02,b,2.50\n')))
+        account = Account.objects.get(id=self.cash['id'])
+        self.assertEqual(Decimal('92.50'), account.current_balance)
+        self.assertEqual(Transaction.objects.latest('id').id, account.latest_transaction_id)
+
+    def test_reconcile_reports_and_fixes_drift(self):
+        """Test the reconcile command reports drifted balances and corrects them with --fix."""
+        self.create(10, 'DEC', self.cash)
+        Account.objects.filter(id=self.cash['id']).update(current_balance=5)
+        out = io.StringIO()
+        call_command('reconcile_balances', stdout=out)
+        self.assertIn('Account %d (cash): stored 5.00, ledger 90.00' % self.cash['id'], out.getvalue())
+        self.assertEqual(Decimal('5.00'), self.balance(self.cash))
+
+        call_command('reconcile_balances', '--fix', stdout=io.StringIO())
+        self.assertEqual(Decimal('90.00'), self.balance(self.cash))
+        self.assertEqual([], reconcile())
+
+
+class MonthlyRollupTests(APITestCase):
+
+    def setUp(self):
+        """Set up an account with transactions across two months."""
+        self.user = User.objects.create_user(username='testuser', password='password123')
+        self.user2 = User.objects.create_user(username='testuser2', password='password123')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.account = Account.objects.create(
+            name='test-account', account_owner=self.user, current_balance=0, account_type='C'
+        )
+        self.food = Category.objects.create(name='Food')
+        self.rent = Category.objects.create(name='Rent')
+        self.grocer = Vendor.objects.create(name='Grocer')
+        self.groceries = self.add(datetime.date(2024, 1, 5), 20, 'DEC', self.food, self.grocer)
+        self.add(datetime.date(2024, 1, 20), 30, 'DEC', self.food, self.grocer)
+        self.add(datetime.date(2024, 1, 31), 1000, 'DEC', self.rent)
+        self.add(datetime.date(2024, 2, 1), 2500, 'INC')
+        self.add(datetime.date(2024, 2, 3), 15, 'DEC', self.food, self.grocer)
+
+    def add(self, date, amount, type, category=None, vendor=None):
+        return Transaction.objects.create(
+            description='item', date=date, amount=amount, type=type,
+            category=category, vendor=vendor, account=self.account,
+        )
+
+    def rollup_values(self):
+        return sorted(MonthlyRollup.objects.values_list(
+            'account', 'category', 'vendor', 'month', 'inc_total', 'dec_total', 'inc_count', 'dec_count'
+        ), key=str)
+
+    def test_incremental_rollups_match_rebuild(self):
+        """Test incrementally maintained rollups equal a full rebuild after creates, edits and deletes."""
+        self.groceries.category = self.rent
+        self.groceries.date = datetime.date(2024, 2, 10)
+        self.groceries.save()
+        self.add(datetime.date(2024, 3, 1), 5, 'DEC', self.food).delete()
+        Transaction.objects.get(amount=2500).delete()
+
+        incremental = self.rollup_values()
+        call_command('rebuild_rollups', stdout=io.StringIO())
+        self.assertEqual(self.rollup_values(), [row for row in incremental if row[6] or row[7]])
+
+    def test_rollup_bucket_totals(self):
+        """Test rollups group by account, category, vendor and month."""
+        rollup = MonthlyRollup.objects.get(category=self.food, month=datetime.date(2024, 1, 1))
+        self.assertEqual(self.user, rollup.user)
+        self.assertEqual(Decimal('50.00'), rollup.dec_total)
+        self.assertEqual(2, rollup.dec_count)
+
+    def test_deleting_category_folds_rollups(self):
+        """Test deleting a category moves its totals to the uncategorised bucket."""
+        self.rent.delete()
+        rollup = MonthlyRollup.objects.get(category=None, vendor=None, month=datetime.date(2024, 1, 1))
+        self.assertEqual(Decimal('1000.00'), rollup.dec_total)
+
+    def test_deleting_accounts_in_bulk(self):
+        """Test deleting accounts through a queryset leaves nothing behind pointing at them."""
+        Account.objects.filter(pk=self.account.pk).delete()
+        self.assertFalse(MonthlyRollup.objects.exists())
+        connection.check_constraints()
+
+    def test_monthly_summary(self):
+        """Test month-over-month totals are read from the rollups."""
+        response = self.client.get(reverse('monthlyrollup-monthly'))
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual([datetime.date(2024, 1, 1), datetime.date(2024, 2, 1)],
+                         [row['month'] for row in response.data])
+        self.assertEqual(Decimal('1050.00'), response.data[0]['spending'])
+        self.assertEqual(Decimal('2485.00'), response.data[1]['net'])
+
+    def test_category_summary_filters(self):
+        """Test the category breakdown honours the month range and only shows the user's data."""
+        Account.objects.create(name='other', account_owner=self.user2, current_balance=0, account_type='C')
+        response = self.client.get(reverse('monthlyrollup-categories') + '?start=2024-01&end=2024-01')
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        totals = {row['category__name']: row['spending'] for row in response.data}
+        self.assertEqual({'Food': Decimal('50.00'), 'Rent': Decimal('1000.00')}, totals)
+
+        self.client.force_authenticate(user=self.user2)
+        self.assertEqual([], self.client.get(reverse('monthlyrollup-categories')).data)
+
+    def test_summary_invalid_month(self):
+        """Test malformed months are rejected."""
+        response = self.client.get(reverse('monthlyrollup-monthly') + '?start=January')
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+
+    def test_summary_invalid_account(self):
+        """Test an account that is not an id is rejected instead of reaching the query."""
+        response = self.client.get(reverse('monthlyrollup-monthly') + '?account=abc')
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+        self.assertIn('account', response.data)
+        response = self.client.get(reverse('monthlyrollup-monthly') + '?account=%d' % self.account.id)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+
+
+class OwnershipTests(APITestCase):
+
+    def setUp(self):
+        """Set up accounts for two users and a transaction in each."""
+        self.user = User.objects.create_user(username='testuser', password='password123')
+        self.user2 = User.objects.create_user(username='testuser2', password='password123')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.account = Account.objects.create(name='mine', account_owner=self.user, account_type='C')
+        self.account2 = Account.objects.create(name='theirs', account_owner=self.user2, account_type='C')
+        self.transaction = Transaction.objects.create(
+            description='item', amount=1, type='DEC', account=self.account
+        )
+        self.transaction2 = Transaction.objects.create(
+            description='item', amount=1, type='DEC', account=self.account2
+        )
+
+    def check_permission(self, action, data):
+        request = Request(APIRequestFactory().post('/', data, format='json'), parsers=[JSONParser()])
+        request.user = self.user
+        view = TransactionViewSet(action=action, request=request)
+        return IsOwnerOrAdmin().has_permission(request, view)
+
+    def test_retrieve_uses_one_ownership_query(self):
+        """Test get_queryset and has_object_permission share a single ownership query."""
+        url = reverse('transaction-detail', args=[self.transaction.id])
+        # Ownership, the object and the deletion marks behind its validators.
+        with self.assertNumQueries(3):
+            response = self.client.get(url)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+
+    def test_retrieve_other_users_transaction(self):
+        """Test transactions in other users' accounts are not visible."""
+        response = self.client.get(reverse('transaction-detail', args=[self.transaction2.id]))
+        self.assertEqual(status.HTTP_404_NOT_FOUND, response.status_code)
+
+    def test_bulk_payload_checks_every_item_with_one_query(self):
+        """Test list payloads are rejected if any item targets a foreign account."""
+        mine = {'account': 'http://testserver/accounts/%d/' % self.account.id}
+        theirs = {'account': {'id': self.account2.id}}
+        with self.assertNumQueries(1):
+            self.assertTrue(self.check_permission('create', [mine, mine, {'account': {'id': self.account.id}}]))
+        self.assertFalse(self.check_permission('create', [mine, theirs]))
+        self.assertFalse(self.check_permission('create', ['not-an-object']))
+
+    def test_partial_update_to_foreign_account(self):
+        """Test PATCH cannot move a transaction into another user's account."""
+        url = reverse('transaction-detail', args=[self.transaction.id])
+        response = self.client.patch(url, {'account': 'somehost.com/%d/' % self.account2.id}, format='json')
+        self.assertEqual(status.HTTP_403_FORBIDDEN, response.status_code)
+
+    def test_invalid_account_owner(self):
+        """Test a malformed account owner is rejected instead of erroring."""
+        response = self.client.post(reverse('account-list'), {
+            'name': 'bad', 'account_owner': 'abc', 'current_balance': 0, 'account_type': 'C',
+        }, format='json')
+        self.assertEqual(status.HTTP_403_FORBIDDEN, response.status_code)
+
+
+class AccountAccessTests(TestCase):
+
+    def setUp(self):
+        """Set up owned, shared and private accounts."""
+        self.user = User.objects.create_user(username='testuser', password='password123')
+        self.user2 = User.objects.create_user(username='testuser2', password='password123')
+        self.owned = Account.objects.create(name='owned', account_owner=self.user, account_type='C')
+        self.shared = Account.objects.create(name='shared', account_owner=self.user2, account_type='C')
+        self.group_shared = Account.objects.create(name='group-shared', account_owner=self.user2, account_type='S')
+        self.private = Account.objects.create(name='private', account_owner=self.user2, account_type='C')
+        assign_perm('view_account', self.user, self.shared)
+        group = Group.objects.create(name='family')
+        group.user_set.add(self.user)
+        assign_perm('view_account', group, self.group_shared)
+
+    def test_owner_backend(self):
+        """Test owners see their accounts without object permissions, plus accounts shared with them."""
+        accounts = set(OwnerAccessBackend().accounts_for(self.user))
+        self.assertEqual({self.owned, self.shared, self.group_shared}, accounts)
+
+    def test_owner_backend_matches_guardian_for_shared_accounts(self):
+        """Test both backends agree once owners hold object permissions on their accounts."""
+        assign_perm('view_account', self.user, self.owned)
+        self.assertEqual(
+            set(GuardianAccessBackend().accounts_for(self.user)),
+            set(OwnerAccessBackend().accounts_for(self.user)),
+        )
+
+    def test_owner_backend_single_query(self):
+        """Test owned and shared accounts are resolved in one query."""
+        with self.assertNumQueries(1):
+            list(accessible_accounts(self.user))
+
+
+class FlatFormatTests(APITestCase):
+
+    def setUp(self):
+        """Set up an account with a few transactions."""
+        self.user = User.objects.create_user(username='testuser', password='password123')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.vendor = Vendor.objects.create(name='Grocer')
+        self.account = Account.objects.create(
+            name='test-account', account_owner=self.user, current_balance=10, account_type='C'
+        )
+        for i in range(3):
+            Transaction.objects.create(
+                description='item %d' % i, date=datetime.date(2024, 1, 1 + i), amount='12.50', type='DEC',
+                vendor=self.vendor, account=self.account,
+            )
+        self.url = reverse('transaction-list')
+
+    def test_flat_list_matches_hyperlinked_values(self):
+        """Test flat rows carry the same values with foreign keys as ids and no url."""
+        hyperlinked = self.client.get(self.url).data['results']
+        response = self.client.get(self.url + '?format=flat')
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        flat = response.json()['results']
+        self.assertEqual(len(hyperlinked), len(flat))
+        for full, compact in zip(hyperlinked, flat):
+            self.assertNotIn('url', compact)
+            self.assertEqual(self.vendor.id, compact['vendor'])
+            self.assertEqual(self.account.id, compact['account'])
+            self.assertIsNone(compact['category'])
+            for key in ('id', 'date', 'description', 'amount', 'type', 'paid_off', 'created', 'last_updated'):
+                self.assertEqual(full[key], compact[key])
+
+    def test_flat_list_skips_model_instances(self):
+        """Test a flat page runs no per-row queries."""
+        # Ownership, conditional GET validators, page count and the page itself.
+        with self.assertNumQueries(4):
+            self.client.get(self.url + '?format=flat')
+
+    def test_flat_with_cursor_pagination(self):
+        """Test flat rows work with keyset pagination."""
+        response = self.client.get(self.url + '?format=flat&pagination=cursor&page_size=2')
+        self.assertEqual(2, len(response.json()['results']))
+        response = self.client.get(response.json()['next'])
+        self.assertEqual(['item 2'], [row['description'] for row in response.json()['results']])
+
+    def test_flat_detail_via_accept_header(self):
+        """Test the flat profile can be requested through the Accept header."""
+        response = self.client.get(
+            reverse('account-detail', args=[self.account.id]), HTTP_ACCEPT='application/vnd.budget.flat+json'
+        )
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual({'id': self.account.id, 'account_owner': self.user.id, 'current_balance': '-27.50'},
+                         {key: response.json()[key] for key in ('id', 'account_owner', 'current_balance')})
+
+
+class SeedAndBenchmarkTests(TestCase):
+    def test_seed_data_is_consistent(self):
+        """Test the seeded dataset has every account type and reconciled balances and rollups."""
+        call_command('seed_data', users=2, accounts_per_type=1, transactions=200, vendors=5, months=3,
+                     stdout=io.StringIO())
+        self.assertEqual(2, User.objects.filter(username__startswith='seed-user-').count())
+        self.assertEqual(2 * len(Account.AccountType), Account.objects.count())
+        self.assertEqual(200, Transaction.objects.filter(recurring=False).count())
+        self.assertTrue(Transaction.objects.filter(recurring=True).exists())
+        self.assertEqual([], reconcile())
+        for account in Account.objects.all():
+            self.assertEqual(
+                Transaction.objects.filter(account=account).count(),
+                sum(r.inc_count + r.dec_count for r in MonthlyRollup.objects.filter(account=account)),
+            )
+
+    @override_settings(ALLOWED_HOSTS=['localhost'])
+    def test_bench_endpoints_writes_results(self):
+        """Test the benchmark covers every endpoint and writes comparable JSON."""
+        call_command('seed_data', users=1, accounts_per_type=1, transactions=50, vendors=5, months=2,
+                     stdout=io.StringIO())
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'results.json')
+            call_command('bench_endpoints', repeat=2, warmup=1, output=output, compare=output, stdout=io.StringIO())
+            with open(output) as stream:
+                report = json.load(stream)
+        self.assertEqual(
+            {'transactions', 'transactions-cursor', 'transactions-flat', 'accounts', 'vendors', 'category',
+             'dashboard'},
+            set(report['results']),
+        )
+        for result in report['results'].values():
+            self.assertEqual({'p50_ms', 'p95_ms', 'queries', 'peak_kib'}, set(result))
+            self.assertGreater(result['queries'], 0)
+
+
+class RequestMetricsTests(APITestCase):
+    def setUp(self):
+        registry.reset()
+        self.user = User.objects.create_user(username='metrics-user', password='password')
+        self.account = Account.objects.create(name='Checking', account_owner=self.user, account_type='C')
+        self.client.force_authenticate(user=self.user)
+
+    def test_histogram_buckets_are_cumulative(self):
+        """Test observations land in every bucket at or above them."""
+        histogram = Histogram((1, 5, 10))
+        for value in (0, 3, 7, 50):
+            histogram.observe(value)
+        self.assertEqual([('1', 1), ('5', 2), ('10', 3), ('+Inf', 4)], list(histogram.samples()))
+        self.assertEqual(60, histogram.sum)
+
+    def test_requests_are_recorded_per_action(self):
+        """Test list and retrieve are labelled by viewset and action, with their query counts."""
+        self.client.get(reverse('transaction-list'))
+        self.client.get(reverse('transaction-list'))
+        self.client.get(reverse('account-detail', args=[self.account.id]))
+        queries = registry.histograms['budget_request_queries']
+        self.assertEqual(2, queries['TransactionViewSet.list'].count)
+        self.assertEqual(1, queries['AccountViewSet.retrieve'].count)
+        self.assertGreater(queries['TransactionViewSet.list'].sum, 0)
+        self.assertGreater(registry.histograms['budget_request_render_seconds']['TransactionViewSet.list'].sum, 0)
+
+    def test_metrics_endpoint(self):
+        """Test /metrics exposes the histograms in the Prometheus text format."""
+        self.client.get(reverse('vendor-list'))
+        self.client.force_login(User.objects.create_user(username='metrics-staff', is_staff=True))
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        body = response.content.decode()
+        self.assertIn('# TYPE budget_request_duration_seconds histogram', body)
+        self.assertIn('budget_request_queries_bucket{view="VendorViewSet.list",le="+Inf"} 1', body)
+        self.assertIn('budget_request_queries_count{view="VendorViewSet.list"} 1', body)
+
+    def test_metrics_endpoint_requires_staff_or_token(self):
+        """Test anonymous and non-staff requests are refused, and a scraper needs the configured token."""
+        self.assertEqual(status.HTTP_403_FORBIDDEN, self.client.get(reverse('metrics')).status_code)
+        self.client.force_login(self.user)
+        self.assertEqual(status.HTTP_403_FORBIDDEN, self.client.get(reverse('metrics')).status_code)
+        self.client.logout()
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer ')
+        self.assertEqual(status.HTTP_403_FORBIDDEN, response.status_code)
+        with override_settings(METRICS_TOKEN='scrape-secret'):
+            response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer wrong')
+            self.assertEqual(status.HTTP_403_FORBIDDEN, response.status_code)
+            response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer scrape-secret')
+            self.assertEqual(status.HTTP_200_OK, response.status_code)
+
+    @override_settings(METRICS_SERVER_TIMING=True)
+    def test_server_timing_header(self):
+        """Test Server-Timing reports SQL, render and total durations when enabled."""
+        response = self.client.get(reverse('transaction-list'))
+        self.assertRegex(response['Server-Timing'], r'^sql;dur=[\d.]+;desc="\d+ queries", render;dur=[\d.]+, total;dur=[\d.]+$')
+
+
+class TransactionFilterTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='filter-user', password='password')
+        self.client.force_authenticate(user=self.user)
+        self.checking = Account.objects.create(name='Checking', account_owner=self.user, account_type='C')
+        self.card = Account.objects.create(name='Card', account_owner=self.user, account_type='D')
+        self.groceries = Category.objects.create(name='Groceries')
+        self.grocer = Vendor.objects.create(name='Grocer')
+        other = User.objects.create_user(username='filter-other')
+        self.other_account = Account.objects.create(name='Other', account_owner=other, account_type='C')
+        rows = [
+            ('rent', datetime.date(2024, 1, 1), '1200.00', 'DEC', self.checking, None, None, True, True),
+            ('food', datetime.date(2024, 1, 15), '45.10', 'DEC', self.card, self.groceries, self.grocer, False, False),
+            ('pay', datetime.date(2024, 2, 1), '2500.00', 'INC', self.checking, None, None, True, True),
+            ('snack', datetime.date(2024, 2, 20), '4.50', 'DEC', self.card, self.groceries, self.grocer, True, False),
+            ('theirs', datetime.date(2024, 1, 15), '45.10', 'DEC', self.other_account, self.groceries, self.grocer,
+             False, False),
+        ]
+        Transaction.objects.bulk_create(
+            Transaction(description=description, date=date, amount=Decimal(amount), type=type, account=account,
+                        category=category, vendor=vendor, paid_off=paid_off, recurring=recurring)
+            for description, date, amount, type, account, category, vendor, paid_off, recurring in rows
+        )
+        self.url = reverse('transaction-list')
+
+    def descriptions(self, query):
+        response = self.client.get(self.url + '?' + query)
+        self.assertEqual(status.HTTP_200_OK, response.status_code, response.content)
+        return [row['description'] for row in response.json()['results']]
+
+    def test_filters(self):
+        """Test each filter narrows the list to the caller's matching transactions."""
+        self.assertEqual(['food', 'pay'], self.descriptions('start=2024-01-02&end=2024-02-01'))
+        self.assertEqual(['rent', 'pay'], self.descriptions('account=%d' % self.checking.id))
+        self.assertEqual(['rent', 'food', 'pay', 'snack'],
+                         self.descriptions('account=%d,%d' % (self.checking.id, self.card.id)))
+        self.assertEqual(['food', 'snack'], self.descriptions('category=%d' % self.groceries.id))
+        self.assertEqual(['food', 'snack'], self.descriptions('vendor=%d' % self.grocer.id))
+        self.assertEqual(['pay'], self.descriptions('type=INC'))
+        self.assertEqual(['food'], self.descriptions('paid_off=false'))
+        self.assertEqual(['rent', 'pay'], self.descriptions('recurring=true'))
+        self.assertEqual(['rent', 'food'], self.descriptions('min_amount=10&max_amount=1200'))
+        self.assertEqual(['snack'], self.descriptions('vendor=%d&paid_off=true' % self.grocer.id))
+
+    def test_filters_combine_with_cursor_pagination(self):
+        """Test keyset pages walk only the filtered rows."""
+        response = self.client.get(self.url + '?pagination=cursor&page_size=1&category=%d' % self.groceries.id)
+        self.assertEqual(['food'], [row['description'] for row in response.json()['results']])
+        response = self.client.get(response.json()['next'])
+        self.assertEqual(['snack'], [row['description'] for row in response.json()['results']])
+        self.assertIsNone(response.json()['next'])
+
+    def test_invalid_filters(self):
+        """Test malformed filter values are rejected with a 400 naming the parameter."""
+        for query, param in [('start=2024-13-01', 'start'), ('account=abc', 'account'), ('type=X', 'type'),
+                             ('paid_off=maybe', 'paid_off'), ('min_amount=NaN', 'min_amount')]:
+            response = self.client.get(self.url + '?' + query)
+            self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code, query)
+            self.assertIn(param, response.json())
+
+    def test_filters_use_indexes(self):
+        """Test no common filter makes SQLite scan the transaction table."""
+        queries = [
+            'start=2024-01-01&end=2024-02-01', 'account=1', 'category=1', 'vendor=1,2', 'type=DEC',
+            'paid_off=true', 'recurring=false', 'min_amount=5&max_amount=10', 'category=1&start=2024-01-01',
+            'vendor=1&type=DEC&paid_off=false',
+        ]
+        staff = User.objects.create_user(username='filter-staff', is_staff=True)
+        for user, query in [(self.user, query) for query in queries] + [
+            (staff, 'start=2024-01-01'), (staff, 'category=1'), (staff, 'vendor=1'),
+        ]:
+            request = Request(APIRequestFactory().get(self.url + '?' + query))
+            request.user = user
+            view = TransactionViewSet(request=request, format_kwarg=None, action='list')
+            plan = view.filter_queryset(view.get_queryset()).explain()
+            table_access = [line for line in plan.splitlines() if 'accounts_transaction' in line]
+            self.assertTrue(table_access, plan)
+            for line in table_access:
+                self.assertIn('SEARCH accounts_transaction USING', line, '%s %s' % (user.username, query))
+
+
+class TransactionSearchTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='search-user', password='password')
+        self.client.force_authenticate(user=self.user)
+        self.checking = Account.objects.create(name='Checking', account_owner=self.user, account_type='C')
+        self.card = Account.objects.create(name='Card', account_owner=self.user, account_type='D')
+        self.roasters = Vendor.objects.create(name='Blue Bottle Roasters')
+        other = User.objects.create_user(username='search-other')
+        other_account = Account.objects.create(name='Other', account_owner=other, account_type='C')
+        self.make('coffee beans', datetime.date(2024, 1, 5), self.checking, self.roasters)
+        self.make('morning coffee', datetime.date(2024, 2, 5), self.card)
+        self.make('groceries', datetime.date(2024, 2, 6), self.card, self.roasters)
+        self.make('coffee coffee', datetime.date(2024, 2, 7), other_account)
+        self.url = reverse('transaction-search')
+
+    def make(self, description, date, account, vendor=None):
+        return Transaction.objects.create(description=description, date=date, amount=1, type='DEC',
+                                          account=account, vendor=vendor)
+
+    def descriptions(self, query):
+        response = self.client.get(self.url + '?' + query)
+        self.assertEqual(status.HTTP_200_OK, response.status_code, response.content)
+        return [row['description'] for row in response.json()['results']]
+
+    def test_search_is_ranked_and_scoped(self):
+        """Test matches come from the user's accounts only, description hits ranking above vendor-only hits."""
+        self.assertEqual(['coffee beans', 'morning coffee'], sorted(self.descriptions('q=coffee')))
+        self.make('bottle opener', datetime.date(2023, 1, 1), self.checking)
+        # Ties in rank fall back to newest first.
+        self.assertEqual(['bottle opener', 'groceries', 'coffee beans'], self.descriptions('q=bottle'))
+        self.assertEqual(['coffee beans'], self.descriptions('q=coff+blue'))
+
+    def test_search_accepts_list_filters(self):
+        """Test date and account filters narrow search results."""
+        self.assertEqual(['morning coffee'], self.descriptions('q=coffee&start=2024-02-01'))
+        self.assertEqual(['coffee beans'], self.descriptions('q=coffee&account=%d' % self.checking.id))
+
+    def test_index_follows_changes(self):
+        """Test edits, vendor renames, bulk inserts and deletes are reflected in the index."""
+        transaction = Transaction.objects.get(description='groceries')
+        transaction.description = 'espresso'
+        transaction.save()
+        self.assertEqual(['espresso'], self.descriptions('q=espresso'))
+        self.roasters.name = 'Corner Cafe'
+        self.roasters.save()
+        self.assertEqual([], self.descriptions('q=bottle'))
+        self.assertEqual(['coffee beans', 'espresso'], sorted(self.descriptions('q=cafe')))
+        Transaction.objects.bulk_create([Transaction(description='espresso beans', amount=1, type='DEC',
+                                                     account=self.card)])
+        self.assertEqual(2, len(self.descriptions('q=espresso')))
+        Transaction.objects.filter(description='espresso').delete()
+        self.assertEqual(['espresso beans'], self.descriptions('q=espresso'))
+
+    def test_search_syntax_is_not_interpreted(self):
+        """Test FTS5 operators in the query are treated as plain words."""
+        self.assertEqual([], self.descriptions('q=coffee+OR+NOT+"*'))
+        response = self.client.get(self.url + '?q=%22%2A')
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+        self.assertIn('q', response.json())
+
+    def test_rebuild_command(self):
+        """Test the index can be rebuilt from the transaction table."""
+        out = io.StringIO()
+        call_command('rebuild_search_index', stdout=out)
+        self.assertIn('Indexed 4 transactions.', out.getvalue())
+        self.assertEqual(['coffee beans', 'morning coffee'], sorted(self.descriptions('q=coffee')))
+
+    def test_sqlite_without_fts5(self):
+        """Test SQLite builds without FTS5 are detected and fall back to substring matching."""
+        with connection.cursor() as cursor:
+            options = [row[0] for row in cursor.execute('PRAGMA compile_options').fetchall()]
+        search.fts5_support.clear()
+        self.assertEqual('ENABLE_FTS5' in options, search.is_supported(connection))
+
+        with mock.patch.dict(search.fts5_support, {alias: False for alias in connections}):
+            self.assertEqual(['morning coffee', 'coffee beans'], self.descriptions('q=coffee'))
+            with self.assertRaises(CommandError):
+                call_command('rebuild_search_index')
+
+    def test_triggers_are_dropped_around_migrations(self):
+        """Test migrations run without the index triggers, which SQLite table rebuilds trip over."""
+        def triggers():
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT count(*) FROM sqlite_master WHERE type = 'trigger' AND tbl_name IN (%s, %s)",
+                               [Transaction._meta.db_table, Vendor._meta.db_table])
+                return cursor.fetchone()[0]
+
+        self.assertEqual(len(search.TRIGGERS), triggers())
+        search.drop_triggers()
+        self.assertEqual(0, triggers())
+        search.install()
+        self.assertEqual(len(search.TRIGGERS), triggers())
+        self.make('espresso', datetime.date(2024, 3, 1), self.card)
+        self.assertEqual(['espresso'], self.descriptions('q=espresso'))
+
+
+class RecurrenceTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='recurring-user', password='password')
+        self.client.force_authenticate(user=self.user)
+        self.account = Account.objects.create(name='Checking', account_owner=self.user, account_type='C',
+                                              current_balance=1000)
+        self.rent = Transaction.objects.create(description='Rent', date=datetime.date(2024, 1, 31), amount=500,
+                                               type='DEC', account=self.account, recurring=True)
+
+    def schedule(self, **kwargs):
+        return Recurrence.objects.create(
+            transaction=self.rent, anchor_date=self.rent.date, materialized_through=self.rent.date, **kwargs
+        )
+
+    def test_occurrence_dates(self):
+        """Test month-end anchors clamp per month and the end date bounds the series."""
+        recurrence = Recurrence(transaction=self.rent, anchor_date=datetime.date(2024, 1, 31),
+                                end_date=datetime.date(2024, 5, 1))
+        self.assertEqual(
+            [datetime.date(2024, 2, 29), datetime.date(2024, 3, 31), datetime.date(2024, 4, 30)],
+            list(occurrence_dates(recurrence, recurrence.anchor_date, datetime.date(2024, 12, 31))),
+        )
+        recurrence = Recurrence(transaction=self.rent, anchor_date=datetime.date(2024, 1, 1),
+                                frequency=Recurrence.Frequency.WEEKLY, interval=2)
+        self.assertEqual(
+            [datetime.date(2024, 3, 11), datetime.date(2024, 3, 25)],
+            list(occurrence_dates(recurrence, datetime.date(2024, 3, 1), datetime.date(2024, 4, 1))),
+        )
+
+    def test_materialize_catches_up_in_bulk(self):
+        """Test missed periods are generated in one pass with one balance update per account."""
+        recurrence = self.schedule()
+        with CaptureQueriesContext(connection) as queries:
+            created = materialize(datetime.date(2024, 6, 30))
+        self.assertEqual(5, created)
+        self.assertEqual(
+            [datetime.date(2024, 2, 29), datetime.date(2024, 3, 31), datetime.date(2024, 4, 30),
+             datetime.date(2024, 5, 31), datetime.date(2024, 6, 30)],
+            list(recurrence.occurrences.order_by('date').values_list('date', flat=True)),
+        )
+        balance_updates = [q for q in queries.captured_queries
+                           if q['sql'].startswith('UPDATE "accounts_account"')]
+        self.assertEqual(1, len(balance_updates))
+        self.account.refresh_from_db()
+        self.assertEqual(Decimal('-2000.00'), self.account.current_balance)
+        self.assertEqual([], reconcile())
+        self.assertEqual(Decimal('500.00'), MonthlyRollup.objects.get(month=datetime.date(2024, 6, 1)).dec_total)
+
+    def test_materialize_is_idempotent(self):
+        """Test rerunning, or running after an interrupted run, never duplicates an occurrence."""
+        recurrence = self.schedule()
+        self.assertEqual(2, materialize(datetime.date(2024, 3, 31)))
+        self.assertEqual(0, materialize(datetime.date(2024, 3, 31)))
+        # Simulate a run that inserted April but died before recording its progress.
+        Transaction.objects.create(description='Rent', date=datetime.date(2024, 4, 30), amount=500, type='DEC',
+                                   account=self.account, series=recurrence, occurrence_date=datetime.date(2024, 4, 30))
+        self.assertEqual(1, materialize(datetime.date(2024, 5, 31)))
+        self.assertEqual(4, recurrence.occurrences.count())
+        self.assertEqual([], reconcile())
+
+    def test_materialize_pages_through_schedules(self):
+        """Test schedules are read a batch at a time and every one of them is materialized."""
+        for day in (1, 2, 3):
+            template = Transaction.objects.create(description='Gym', date=datetime.date(2024, 1, day), amount=10,
+                                                  type='DEC', account=self.account, recurring=True)
+            Recurrence.objects.create(transaction=template, anchor_date=template.date,
+                                      materialized_through=template.date)
+        self.schedule()
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(4 * 2, materialize(datetime.date(2024, 3, 31), batch_size=3))
+        pages = [q['sql'] for q in queries.captured_queries if q['sql'].startswith('SELECT "accounts_recurrence"')]
+        self.assertEqual(3, len(pages))
+        self.assertTrue(all('LIMIT 3' in sql for sql in pages))
+
+    def test_materialize_command_respects_end_date(self):
+        """Test the command stops each series at its end date."""
+        self.schedule(end_date=datetime.date(2024, 3, 15))
+        out = io.StringIO()
+        call_command('materialize_recurring', through='2024-12-31', stdout=out)
+        self.assertIn('Created 1 recurring transactions.', out.getvalue())
+        call_command('materialize_recurring', through='2025-12-31', stdout=out)
+        self.assertEqual(2, Transaction.objects.count())
+
+    def test_create_schedule_via_api(self):
+        """Test a schedule defaults its anchor to the template's date and only for owned transactions."""
+        url = reverse('recurrence-list')
+        transaction_url = reverse('transaction-detail', args=[self.rent.id])
+        response = self.client.post(url, {'transaction': transaction_url, 'frequency': 'M'}, format='json')
+        self.assertEqual(status.HTTP_201_CREATED, response.status_code, response.content)
+        self.assertEqual('2024-01-31', response.json()['anchor_date'])
+        self.assertEqual('2024-01-31', response.json()['materialized_through'])
+
+        other = User.objects.create_user(username='recurring-other')
+        other_account = Account.objects.create(name='Other', account_owner=other, account_type='C')
+        theirs = Transaction.objects.create(description='x', date=datetime.date(2024, 1, 1), amount=1,
+                                            type='DEC', account=other_account)
+        response = self.client.post(url, {'transaction': reverse('transaction-detail', args=[theirs.id])},
+                                    format='json')
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+        self.assertEqual(1, len(self.client.get(url).json()['results']))
+
+
+@override_settings(RESPONSE_CACHE=None)
+class ConditionalGetTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='etag-user', password='password')
+        self.client.force_authenticate(user=self.user)
+        self.account = Account.objects.create(name='Checking', account_owner=self.user, account_type='C')
+        self.vendor = Vendor.objects.create(name='Grocer')
+        self.transactions = [
+            Transaction.objects.create(description='item %d' % i, date=datetime.date(2024, 1, 1 + i), amount=1,
+                                       type='DEC', account=self.account, vendor=self.vendor)
+            for i in range(3)
+        ]
+        self.url = reverse('transaction-list')
+
+    def test_not_modified_skips_list_query(self):
+        """Test a matching If-None-Match gets a 304 from the validator query alone."""
+        response = self.client.get(self.url)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        etag = response['ETag']
+        self.assertIn('Last-Modified', response)
+        # Ownership and the validator aggregate; no count or page query.
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(status.HTTP_304_NOT_MODIFIED, response.status_code)
+        self.assertEqual(etag, response['ETag'])
+
+        response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(status.HTTP_304_NOT_MODIFIED, response.status_code)
+
+    def test_writes_and_deletions_change_the_etag(self):
+        """Test creating, editing and deleting transactions, and deleting a vendor, invalidate the validator."""
+        etags = [self.client.get(self.url)['ETag']]
+        Transaction.objects.create(description='new', amount=1, type='DEC', account=self.account)
+        etags.append(self.client.get(self.url)['ETag'])
+        self.transactions[0].amount = 2
+        self.transactions[0].save()
+        etags.append(self.client.get(self.url)['ETag'])
+        self.transactions[1].delete()
+        etags.append(self.client.get(self.url)['ETag'])
+        self.vendor.delete()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etags[-1])
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        etags.append(response['ETag'])
+        self.assertEqual(len(etags), len(set(etags)))
+
+    def test_etag_varies_by_query_format_and_user(self):
+        """Test validators are specific to the query string, the representation and the user."""
+        etags = {
+            self.client.get(self.url)['ETag'],
+            self.client.get(self.url + '?type=DEC')['ETag'],
+            self.client.get(self.url + '?format=flat')['ETag'],
+        }
+        other = User.objects.create_user(username='etag-other')
+        self.client.force_authenticate(user=other)
+        etags.add(self.client.get(self.url)['ETag'])
+        self.assertEqual(4, len(etags))
+
+    def test_deletion_by_other_user_keeps_validator(self):
+        """Test deletions in another user's accounts do not invalidate this user's lists."""
+        etag = self.client.get(self.url)['ETag']
+        other = User.objects.create_user(username='etag-other')
+        other_account = Account.objects.create(name='Other', account_owner=other, account_type='C')
+        Transaction.objects.create(description='theirs', amount=1, type='DEC', account=other_account).delete()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(status.HTTP_304_NOT_MODIFIED, response.status_code)
+
+    def test_detail_not_modified(self):
+        """Test detail views are validated from the object's last_updated."""
+        url = reverse('account-detail', args=[self.account.id])
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(status.HTTP_304_NOT_MODIFIED, response.status_code)
+        Transaction.objects.create(description='new', amount=5, type='INC', account=self.account)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual('2.00', response.json()['current_balance'])
+
+    def test_detail_changes_when_related_row_is_deleted(self):
+        """Test deleting a vendor, which nulls the foreign key without touching last_updated, invalidates the detail."""
+        url = reverse('transaction-detail', args=[self.transactions[0].id])
+        response = self.client.get(url)
+        etag = response['ETag']
+        # Ownership, the object and the deletion marks of its related models.
+        with self.assertNumQueries(3):
+            self.assertEqual(status.HTTP_304_NOT_MODIFIED, self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code)
+        self.vendor.delete()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertIsNone(response.json()['vendor'])
+        self.assertNotEqual(etag, response['ETag'])
+
+
+class ResponseCacheTests(APITestCase):
+    def setUp(self):
+        registry.reset()
+        self.user = User.objects.create_user(username='cache-user', password='password')
+        self.client.force_authenticate(user=self.user)
+        self.account = Account.objects.create(name='Checking', account_owner=self.user, account_type='C')
+        self.vendor = Vendor.objects.create(name='Grocer')
+        Transaction.objects.create(description='first', date=datetime.date(2024, 1, 1), amount=1, type='DEC',
+                                   account=self.account, vendor=self.vendor)
+        self.url = reverse('transaction-list')
+
+    def test_repeat_reads_are_served_from_cache(self):
+        """Test a repeated list or detail read runs no queries and is counted as a hit."""
+        detail = reverse('account-detail', args=[self.account.id])
+        first = [self.client.get(self.url), self.client.get(detail)]
+        with self.assertNumQueries(0):
+            second = [self.client.get(self.url), self.client.get(detail)]
+        for before, after in zip(first, second):
+            self.assertEqual(before.content, after.content)
+            self.assertEqual(before['ETag'], after['ETag'])
+        self.assertEqual(2, registry.counters['budget_response_cache_hits_total'])
+        self.assertEqual(2, registry.counters['budget_response_cache_misses_total'])
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=first[0]['ETag'])
+        self.assertEqual(status.HTTP_304_NOT_MODIFIED, response.status_code)
+
+    def test_writes_invalidate_the_owner(self):
+        """Test transaction and account writes bump the owner's version, other users' writes do not."""
+        self.client.get(self.url)
+        other = User.objects.create_user(username='cache-other')
+        Account.objects.create(name='Theirs', account_owner=other, account_type='C')
+        with self.assertNumQueries(0):
+            self.client.get(self.url)
+
+        # Versions move when the write commits.
+        with self.captureOnCommitCallbacks(execute=True):
+            Transaction.objects.create(description='second', amount=1, type='DEC', account=self.account)
+        response = self.client.get(self.url)
+        self.assertEqual(['first', 'second'], sorted(row['description'] for row in response.json()['results']))
+        with self.captureOnCommitCallbacks(execute=True):
+            Transaction.objects.get(description='second').delete()
+        self.assertEqual(1, self.client.get(self.url).json()['count'])
+
+    def test_versions_move_on_commit(self):
+        """Test a read made while a write is uncommitted is not cached under the version the write moves to."""
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            Transaction.objects.create(description='second', amount=1, type='DEC', account=self.account)
+            # Until the commit, readers keep the old version, and what they cache stays under it.
+            with self.assertNumQueries(0):
+                self.assertEqual(1, self.client.get(self.url).json()['count'])
+            self.client.get(self.url + '?type=DEC')
+        misses = registry.counters['budget_response_cache_misses_total']
+        self.client.get(self.url + '?type=DEC')
+        self.assertEqual(misses + 1, registry.counters['budget_response_cache_misses_total'])
+        self.assertEqual(2, self.client.get(self.url).json()['count'])
+
+    def test_owner_change_invalidates_previous_owner(self):
+        """Test moving an account to another user drops it from the previous owner's cached lists."""
+        url = reverse('account-list')
+        self.assertEqual(1, self.client.get(url).json()['count'])
+        account = Account.objects.get(pk=self.account.pk)
+        account.account_owner = User.objects.create_user(username='cache-new-owner')
+        with self.captureOnCommitCallbacks(execute=True):
+            account.save()
+        self.assertEqual(0, self.client.get(url).json()['count'])
+
+    def test_shared_changes_invalidate_everyone(self):
+        """Test deleting a vendor refreshes transaction lists that linked to it."""
+        self.assertIsNotNone(self.client.get(self.url).json()['results'][0]['vendor'])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.vendor.delete()
+        self.assertIsNone(self.client.get(self.url).json()['results'][0]['vendor'])
+
+    def test_lru_evicts_least_recently_used(self):
+        """Test the LRU backend evicts exactly the entry used longest ago."""
+        cache = LRUCache('test-lru', {'OPTIONS': {'MAX_ENTRIES': 2}})
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual({'a': 1, 'c': 3}, cache.get_many(['a', 'b', 'c']))
+
+    def test_file_based_backend(self):
+        """Test the layer works unchanged on Django's file-based cache."""
+        with tempfile.TemporaryDirectory() as directory:
+            caches_setting = {
+                'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+                'responses': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': directory},
+            }
+            with override_settings(CACHES=caches_setting):
+                first = self.client.get(self.url)
+                with self.assertNumQueries(0):
+                    self.assertEqual(first.content, self.client.get(self.url).content)
+                with self.captureOnCommitCallbacks(execute=True):
+                    Transaction.objects.create(description='second', amount=1, type='DEC', account=self.account)
+                self.assertEqual(2, self.client.get(self.url).json()['count'])
+
+
+@override_settings(ALLOWED_HOSTS=['testserver'], RESPONSE_CACHE=None)
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        registry.reset()
+        self.user = User.objects.create_user(username='async-user', password='password')
+        self.other = User.objects.create_user(username='async-other', password='password')
+        self.account = Account.objects.create(name='Checking', account_owner=self.user, account_type='C')
+        self.theirs = Account.objects.create(name='Theirs', account_owner=self.other, account_type='C')
+        vendor = Vendor.objects.create(name='Grocer')
+        Transaction.objects.bulk_create(
+            Transaction(description='item %d' % i, date=datetime.date(2024, 1, 1) + datetime.timedelta(days=i % 7),
+                        amount=i + 1, type='DEC', account=self.account, vendor=vendor)
+            for i in range(15)
+        )
+        self.their_transaction = Transaction.objects.create(description='theirs', amount=1, type='DEC',
+                                                            account=self.theirs)
+        self.client.force_login(self.user)
+
+    async def test_list_matches_sync_endpoint(self):
+        """Test the async list returns the router list's pages, filters, cursors and flat format."""
+        await self.async_client.aforce_login(self.user)
+        for query in ['', '?page=2', '?min_amount=10', '?format=flat', '?pagination=cursor&page_size=4']:
+            expected = (await sync_to_async(self.client.get)(reverse('transaction-list') + query)).json()
+            response = await self.async_client.get(reverse('async-transaction-list') + query)
+            self.assertEqual(status.HTTP_200_OK, response.status_code)
+            self.assertEqual(expected['results'], response.json()['results'])
+            self.assertEqual(expected.get('count'), response.json().get('count'))
+        cursor = response.json()['next']
+        self.assertIn(reverse('async-transaction-list'), cursor)
+        self.assertEqual(4, len((await self.async_client.get(cursor)).json()['results']))
+
+    async def test_detail_keeps_ownership_rules(self):
+        """Test the async detail serves owned rows, hides other users' rows and requires authentication."""
+        transaction = await Transaction.objects.filter(account=self.account).afirst()
+        url = reverse('async-transaction-detail', args=[transaction.pk])
+        self.assertEqual(status.HTTP_403_FORBIDDEN, (await self.async_client.get(url)).status_code)
+
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(url)
+        self.assertEqual(transaction.description, response.json()['description'])
+        hidden = reverse('async-transaction-detail', args=[self.their_transaction.pk])
+        self.assertEqual(status.HTTP_404_NOT_FOUND, (await self.async_client.get(hidden)).status_code)
+        self.assertEqual(status.HTTP_400_BAD_REQUEST,
+                         (await self.async_client.get(reverse('async-transaction-list') + '?start=x')).status_code)
+
+        staff = await User.objects.acreate(username='async-staff', is_staff=True)
+        await self.async_client.aforce_login(staff)
+        self.assertEqual(status.HTTP_200_OK, (await self.async_client.get(hidden)).status_code)
+
+    async def test_dashboard(self):
+        """Test the async dashboard renders what the sync dashboard does with the same queries."""
+        url = reverse('async-dashboard')
+        self.assertEqual(302, (await self.async_client.get(url)).status_code)
+        await sync_to_async(assign_perm)('accounts.view_account', self.user)
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(url)
+        self.assertContains(response, 'Account Checking')
+        self.assertNotContains(response, 'Theirs')
+        self.assertEqual('item 13', response.context['cash_accounts'][0].recent_transactions[0].description)
+
+        expected = await sync_to_async(self.client.get)(reverse('dashboard'))
+        self.assertEqual(expected.content, response.content)
+        queries = registry.histograms['budget_request_queries']
+        self.assertGreaterEqual(queries['dashboard'].sum, DASHBOARD_QUERY_COUNT)
+        self.assertEqual(queries['index'].sum, queries['dashboard'].sum)
+
+
+class TransactionExportTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='export-user', password='password')
+        self.client.force_authenticate(user=self.user)
+        self.checking = Account.objects.create(name='Checking', account_owner=self.user, account_type='C')
+        self.card = Account.objects.create(name='Card', account_owner=self.user, account_type='D')
+        grocer = Vendor.objects.create(name='Grocer')
+        groceries = Category.objects.create(name='Groceries')
+        other = Account.objects.create(name='Other', account_owner=User.objects.create_user(username='export-other'),
+                                       account_type='C')
+        Transaction.objects.bulk_create([
+            Transaction(description='pay', date=datetime.date(2024, 2, 1), amount=Decimal('2500.00'), type='INC',
+                        account=self.checking, recurring=True),
+            Transaction(description='food, "fresh"', date=datetime.date(2024, 1, 15), amount=Decimal('45.10'),
+                        type='DEC', account=self.card, vendor=grocer, category=groceries, paid_off=True),
+            Transaction(description='rent', date=datetime.date(2024, 1, 1), amount=Decimal('1200.00'), type='DEC',
+                        account=self.checking),
+            Transaction(description='theirs', date=datetime.date(2024, 1, 10), amount=1, type='DEC', account=other),
+        ])
+        self.url = reverse('transaction-export')
+
+    def content(self, response):
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_csv_export_can_be_imported_again(self):
+        """Test the CSV lists the user's transactions by account, oldest first, in the import format."""
+        with self.assertNumQueries(2):
+            content = self.content(self.client.get(self.url))
+        rows = list(parse_csv(io.StringIO(content)))
+        self.assertEqual(['rent', 'pay', 'food, "fresh"'], [row['description'] for row in rows])
+        self.assertEqual({'id': rows[2]['id'], 'date': '2024-01-15', 'description': 'food, "fresh"',
+                          'amount': '45.10', 'type': 'DEC', 'vendor': 'Grocer', 'category': 'Groceries',
+                          'account': str(self.card.id), 'paid_off': 'true', 'recurring': 'false'}, rows[2])
+
+        importer = TransactionImporter(self.user)
+        importer.run(rows)
+        self.assertEqual(3, importer.report()['created'])
+        self.assertEqual(2, Transaction.objects.filter(description='food, "fresh"', vendor__name='Grocer').count())
+
+    def test_ndjson_export_with_filters(self):
+        """Test NDJSON is selected with ?format=ndjson and honours the list filters."""
+        response = self.client.get(self.url, {'format': 'ndjson', 'account': self.checking.id, 'start': '2024-01-02'})
+        self.assertEqual('application/x-ndjson', response['Content-Type'])
+        self.assertIn('transactions.ndjson', response['Content-Disposition'])
+        lines = [json.loads(line) for line in self.content(response).splitlines()]
+        self.assertEqual([{'description': 'pay', 'amount': '2500.00', 'date': '2024-02-01', 'vendor': None,
+                           'recurring': True}],
+                         [{key: line[key] for key in ('description', 'amount', 'date', 'vendor', 'recurring')}
+                          for line in lines])
+
+    def test_export_errors(self):
+        """Test bad filters are rejected before streaming and anonymous users are refused."""
+        response = self.client.get(self.url, {'start': 'yesterday'})
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+        self.assertIn('Date has wrong format', response.content.decode())
+        self.client.force_authenticate(user=None)
+        self.assertEqual(status.HTTP_403_FORBIDDEN, self.client.get(self.url).status_code)
+
+
+class DatabaseRouterTests(TestCase):
+    def read_alias(self):
+        # Tests run inside a transaction on the primary, where every read stays on the primary.
+        with mock.patch.object(connections[DEFAULT_DB_ALIAS], 'in_atomic_block', False):
+            return Vendor.objects.all().db
+
+    def test_reads_go_to_replica_and_writes_to_primary(self):
+        """Test reads use the replica alias except inside a transaction on the primary."""
+        self.assertEqual(REPLICA_DB_ALIAS, self.read_alias())
+        self.assertEqual(DEFAULT_DB_ALIAS, Vendor.objects.all().db)
+        self.assertEqual(DEFAULT_DB_ALIAS, router.db_for_write(Vendor))
+        self.assertFalse(router.allow_migrate(REPLICA_DB_ALIAS, 'accounts'))
+        self.assertTrue(router.allow_relation(Vendor(), Category()))
+
+    def test_read_your_writes(self):
+        """Test a tracked block reads from the primary after its first write, and only when enabled."""
+        with track_writes():
+            self.assertEqual(REPLICA_DB_ALIAS, self.read_alias())
+            Vendor.objects.create(name='written')
+            self.assertEqual(DEFAULT_DB_ALIAS, self.read_alias())
+            with override_settings(READ_YOUR_WRITES=False):
+                self.assertEqual(REPLICA_DB_ALIAS, self.read_alias())
+        self.assertEqual(REPLICA_DB_ALIAS, self.read_alias())
+
+    def test_pragmas_applied_to_new_connections(self):
+        """Test the SQLITE_PRAGMAS setting is applied when a connection opens."""
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA cache_size')
+            self.assertEqual(settings.SQLITE_PRAGMAS['cache_size'], cursor.fetchone()[0])
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(1, cursor.fetchone()[0])
+
+
+class BulkTransactionTests(APITestCase):
+
+    def setUp(self):
+        """Set up two owned accounts, another user's account and transactions across two months."""
+        self.user = User.objects.create_user(username='testuser', password='password123')
+        self.user2 = User.objects.create_user(username='testuser2', password='password123')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.cash = Account.objects.create(name='cash', account_owner=self.user, current_balance=100, account_type='C')
+        self.card = Account.objects.create(name='card', account_owner=self.user, current_balance=0, account_type='D')
+        self.theirs = Account.objects.create(name='theirs', account_owner=self.user2, account_type='C')
+        self.food = Category.objects.create(name='Food')
+        self.rent = Category.objects.create(name='Rent')
+        self.grocer = Vendor.objects.create(name='Grocer')
+        self.first = self.add(datetime.date(2024, 1, 5), 20, 'DEC', self.card, self.food)
+        self.second = self.add(datetime.date(2024, 1, 20), 30, 'DEC', self.card, self.food)
+        self.third = self.add(datetime.date(2024, 2, 1), 50, 'INC', self.cash)
+        self.foreign = self.add(datetime.date(2024, 1, 5), 5, 'DEC', self.theirs)
+        self.url = reverse('transaction-list')
+
+    def add(self, date, amount, type, account, category=None):
+        return Transaction.objects.create(
+            description='item', date=date, amount=amount, type=type, account=account,
+            category=category, vendor=self.grocer,
+        )
+
+    def rollup_values(self):
+        return sorted(
+            (row for row in MonthlyRollup.objects.values_list(
+                'account', 'category', 'vendor', 'month', 'inc_total', 'dec_total', 'inc_count', 'dec_count'
+            ) if row[6] or row[7]),
+            key=str,
+        )
+
+    def assert_consistent(self):
+        incremental = self.rollup_values()
+        call_command('rebuild_rollups', stdout=io.StringIO())
+        self.assertEqual(self.rollup_values(), incremental)
+        self.assertEqual([], reconcile())
+
+    def test_update_by_ids_with_one_statement(self):
+        """Test a bulk update writes the selected transactions with one UPDATE and bumps last_updated."""
+        before = Transaction.objects.get(id=self.first.id).last_updated
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.url + 'bulk-update/', {
+                'ids': [self.first.id, self.second.id, self.foreign.id],
+                'changes': {'category': reverse('category-detail', args=[self.rent.id]), 'paid_off': True},
+            }, format='json')
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual({'updated': 2}, response.data)
+        updates = [query['sql'] for query in queries if query['sql'].startswith('UPDATE "accounts_transaction"')]
+        self.assertEqual(1, len(updates))
+        self.assertEqual(
+            {(self.rent.id, True)},
+            set(Transaction.objects.filter(account=self.card).values_list('category', 'paid_off')),
+        )
+        self.assertGreater(Transaction.objects.get(id=self.first.id).last_updated, before)
+        self.assertFalse(Transaction.objects.get(id=self.foreign.id).paid_off)
+        self.assert_consistent()
+
+    def test_update_amount_and_account_keeps_balances(self):
+        """Test changing amounts, types and accounts in bulk keeps balances, latest ids and rollups."""
+        response = self.client.post(self.url + 'bulk-update/?account=%d' % self.card.id, {
+            'changes': {
+                'amount': '12.50', 'type': 'INC', 'date': '2024-03-09',
+                'account': reverse('account-detail', args=[self.cash.id]),
+            },
+        }, format='json')
+        self.assertEqual({'updated': 2}, response.data)
+        cash = Account.objects.get(id=self.cash.id)
+        card = Account.objects.get(id=self.card.id)
+        self.assertEqual(Decimal('175.00'), cash.current_balance)
+        self.assertEqual(Decimal('0.00'), card.current_balance)
+        self.assertEqual(self.third.id, cash.latest_transaction_id)
+        self.assertIsNone(card.latest_transaction_id)
+        self.assert_consistent()
+
+    def test_delete_by_filter(self):
+        """Test a bulk delete removes the filtered transactions, their schedules and their ledger effects."""
+        Recurrence.objects.create(transaction=self.second, anchor_date=self.second.date)
+        response = self.client.post(self.url + 'bulk-delete/?category=%d' % self.food.id, format='json')
+        self.assertEqual({'deleted': 2}, response.data)
+        self.assertFalse(Transaction.objects.filter(account=self.card).exists())
+        self.assertFalse(Recurrence.objects.exists())
+        self.assertTrue(Transaction.objects.filter(id=self.foreign.id).exists())
+        card = Account.objects.get(id=self.card.id)
+        self.assertEqual(Decimal('0.00'), card.current_balance)
+        self.assertIsNone(card.latest_transaction_id)
+        self.assertTrue(DeletionMark.objects.filter(model='accounts.transaction', user=self.user).exists())
+        self.assert_consistent()
+
+    def test_rejects_foreign_account_and_bad_selections(self):
+        """Test bulk actions refuse other users' accounts, unfiltered selections and unknown fields."""
+        theirs = reverse('account-detail', args=[self.theirs.id])
+        response = self.client.post(self.url + 'bulk-update/', {
+            'ids': [self.first.id], 'changes': {'account': theirs},
+        }, format='json')
+        self.assertEqual(status.HTTP_403_FORBIDDEN, response.status_code)
+
+        response = self.client.post(self.url + 'bulk-delete/', {}, format='json')
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+        self.assertIn('ids', response.data)
+
+        response = self.client.post(self.url + 'bulk-update/', {
+            'ids': [self.first.id], 'changes': {'series': 1},
+        }, format='json')
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+        self.assertEqual(['Cannot change: series.'], response.data['changes'])
+
+        response = self.client.post(self.url + 'bulk-update/', {
+            'ids': [self.first.id], 'changes': {'amount': 'lots'},
+        }, format='json')
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+        self.assertIn('amount', response.data['changes'])
+        self.assertEqual(3, Transaction.objects.filter(account__account_owner=self.user).count())
+
+
+class BalanceSeriesTests(APITestCase):
+
+    def setUp(self):
+        """Set up an account with an opening balance and transactions over three months."""
+        self.user = User.objects.create_user(username='testuser', password='password123')
+        self.user2 = User.objects.create_user(username='testuser2', password='password123')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.account = Account.objects.create(
+            name='cash', account_owner=self.user, current_balance=100, account_type='C'
+        )
+        for date, amount, type in [
+            ('2024-01-05', 20, 'DEC'), ('2024-01-05', 5, 'INC'), ('2024-01-20', 30, 'DEC'),
+            ('2024-02-01', 200, 'INC'), ('2024-03-15', 15, 'DEC'), (None, 10, 'DEC'),
+        ]:
+            Transaction.objects.create(
+                description='item', date=date and datetime.date.fromisoformat(date), amount=amount, type=type,
+                account=self.account,
+            )
+        self.url = reverse('account-balance', args=[self.account.id])
+
+    def series(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        return [(point['date'], point['balance']) for point in response.json()['series']]
+
+    def test_daily_series(self):
+        """Test the daily series is the running balance, counting undated transactions from the start."""
+        # The account, then the whole series.
+        with self.assertNumQueries(2):
+            self.client.get(self.url)
+        # Money is rendered as fixed-point strings, as the model serializers render it.
+        self.assertEqual([
+            ('2024-01-05', '75.00'), ('2024-01-20', '45.00'), ('2024-02-01', '245.00'), ('2024-03-15', '230.00'),
+        ], self.series())
+        self.assertEqual(Decimal('230.00'), Account.objects.get(id=self.account.id).current_balance)
+
+    def test_weekly_and_monthly_series(self):
+        """Test coarser intervals report the balance at the end of each period, labelled by its start."""
+        self.assertEqual([
+            ('2024-01-01', '75.00'), ('2024-01-15', '45.00'), ('2024-01-29', '245.00'), ('2024-03-11', '230.00'),
+        ], self.series(interval='week'))
+        self.assertEqual([
+            ('2024-01-01', '45.00'), ('2024-02-01', '245.00'), ('2024-03-01', '230.00'),
+        ], self.series(interval='month'))
+
+    def test_range_and_downsampling(self):
+        """Test a range carries earlier transactions in, and points keep every n-th exact balance."""
+        self.assertEqual([('2024-01-20', '45.00'), ('2024-02-01', '245.00')],
+                         self.series(start='2024-01-06', end='2024-02-29'))
+        self.assertEqual([('2024-01-20', '45.00'), ('2024-03-15', '230.00')], self.series(points=2))
+
+    def test_invalid_parameters_and_other_users(self):
+        """Test bad parameters are rejected and other users' accounts are not found."""
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, self.client.get(self.url, {'interval': 'hour'}).status_code)
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, self.client.get(self.url, {'points': '0'}).status_code)
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, self.client.get(self.url, {'start': 'soon'}).status_code)
+        self.client.force_authenticate(user=self.user2)
+        self.assertEqual(status.HTTP_404_NOT_FOUND, self.client.get(self.url).status_code)
+
+
+class NetWorthSnapshotTests(APITestCase):
+
+    def setUp(self):
+        """Set up cash, savings and mortgage accounts with transactions over a few days."""
+        self.user = User.objects.create_user(username='testuser', password='password123')
+        self.user2 = User.objects.create_user(username='testuser2', password='password123')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.cash = Account.objects.create(name='cash', account_owner=self.user, current_balance=100, account_type='C')
+        self.savings = Account.objects.create(
+            name='savings', account_owner=self.user, current_balance=50, account_type='S'
+        )
+        self.mortgage = Account.objects.create(
+            name='mortgage', account_owner=self.user, current_balance=1000, account_type='D', mortgage=True
+        )
+        self.day = datetime.date(2024, 1, 1)
+        self.add(self.cash, 0, 20, 'DEC')
+        self.add(self.savings, 2, 30, 'INC')
+        self.add(self.mortgage, 2, 100, 'DEC')
+
+    def add(self, account, day, amount, type):
+        return Transaction.objects.create(
+            description='item', date=self.day + datetime.timedelta(days=day), amount=amount, type=type, account=account
+        )
+
+    def fill(self, days):
+        call_command('snapshot_net_worth', '--through', str(self.day + datetime.timedelta(days=days)),
+                     stdout=io.StringIO())
+
+    def totals(self, day):
+        return {
+            (snapshot.account_type, snapshot.mortgage): snapshot.total
+            for snapshot in NetWorthSnapshot.objects.filter(user=self.user, date=self.day + datetime.timedelta(days=day))
+        }
+
+    def stored(self):
+        return sorted(NetWorthSnapshot.objects.values_list('user', 'date', 'account_type', 'mortgage', 'total'))
+
+    def assert_matches_rebuild(self):
+        stored = self.stored()
+        call_command('snapshot_net_worth', '--rebuild', '--through', str(max(row[1] for row in stored)),
+                     stdout=io.StringIO())
+        self.assertEqual(self.stored(), stored)
+
+    def test_fill_backfills_daily_totals(self):
+        """Test the command backfills one row per day and group from the first transaction, mortgages apart."""
+        self.fill(3)
+        self.assertEqual(4 * 3, NetWorthSnapshot.objects.count())
+        self.assertEqual({('C', False): Decimal('80.00'), ('S', False): Decimal('50.00'),
+                          ('D', True): Decimal('1000.00')}, self.totals(1))
+        self.assertEqual({('C', False): Decimal('80.00'), ('S', False): Decimal('80.00'),
+                          ('D', True): Decimal('900.00')}, self.totals(3))
+
+        self.fill(4)
+        self.assertEqual(5 * 3, NetWorthSnapshot.objects.count())
+        self.assertEqual(self.totals(3), self.totals(4))
+
+    def test_writes_keep_snapshots_current(self):
+        """Test backdated creates, edits and deletes, bulk writes and account changes update stored history."""
+        self.fill(3)
+        transaction = self.add(self.cash, 1, 5, 'INC')
+        self.assertEqual(Decimal('80.00'), self.totals(0)[('C', False)])
+        self.assertEqual(Decimal('85.00'), self.totals(3)[('C', False)])
+        transaction.amount = 7
+        transaction.account = self.savings
+        transaction.save()
+        self.assert_matches_rebuild()
+        transaction.delete()
+        self.assert_matches_rebuild()
+
+        self.client.post(reverse('transaction-list') + 'bulk-update/', {
+            'ids': [self.cash.transaction_set.get().id], 'changes': {'amount': '25.00'},
+        }, format='json')
+        self.assertEqual(Decimal('75.00'), self.totals(3)[('C', False)])
+        self.assert_matches_rebuild()
+
+        self.savings.account_type = 'A'
+        self.savings.save()
+        self.assertEqual(Decimal('80.00'), self.totals(3)[('A', False)])
+        self.assert_matches_rebuild()
+
+    def test_account_changes_update_snapshots_in_place(self):
+        """Test creating, deleting and rebalancing accounts shifts stored history without rewriting it."""
+        self.fill(3)
+        ids = set(NetWorthSnapshot.objects.values_list('id', flat=True))
+        wallet = Account.objects.create(name='wallet', account_owner=self.user, current_balance=40, account_type='C')
+        self.add(wallet, 1, 15, 'DEC')
+        self.assertEqual(Decimal('120.00'), self.totals(0)[('C', False)])
+        cash = Account.objects.get(id=self.cash.id)
+        cash.opening_balance = 150
+        cash.save()
+        cash.save()
+        self.assertEqual(Decimal('155.00'), self.totals(3)[('C', False)])
+        self.assertEqual(ids, set(NetWorthSnapshot.objects.values_list('id', flat=True)))
+        self.assert_matches_rebuild()
+
+        wallet.delete()
+        self.assertEqual(Decimal('130.00'), self.totals(3)[('C', False)])
+        Account.objects.create(name='house', account_owner=self.user, current_balance=300, account_type='A')
+        self.assertEqual(Decimal('300.00'), self.totals(0)[('A', False)])
+        self.assert_matches_rebuild()
+        self.savings.delete()
+        self.assertNotIn(('S', False), self.totals(3))
+        self.assert_matches_rebuild()
+
+    def test_deleting_accounts_in_bulk(self):
+        """Test a queryset delete takes accounts and their transactions, undated ones too, out of history once."""
+        self.fill(3)
+        wallet = Account.objects.create(name='wallet', account_owner=self.user, current_balance=40, account_type='C')
+        self.add(wallet, 1, 15, 'DEC')
+        Transaction.objects.create(description='undated', amount=5, type='DEC', account=wallet)
+        Transaction.objects.create(description='undated', amount=5, type='DEC', account=self.cash)
+        spare = Account.objects.create(name='spare', account_owner=self.user, current_balance=10, account_type='S')
+        Account.objects.filter(pk__in=[wallet.pk, self.savings.pk, spare.pk]).delete()
+        self.assertEqual(Decimal('75.00'), self.totals(3)[('C', False)])
+        self.assertNotIn(('S', False), self.totals(3))
+        self.assert_matches_rebuild()
+
+        Account.objects.filter(mortgage=True).delete()
+        self.assertEqual({('C', False)}, set(self.totals(3)))
+        self.assert_matches_rebuild()
+
+    def test_dashboard_totals_and_trend(self):
+        """Test the trend pivots snapshots per day and ends with today's snapshot plus later transactions."""
+        yesterday = timezone.localdate() - datetime.timedelta(days=1)
+        self.day = yesterday - datetime.timedelta(days=3)
+        Transaction.objects.filter(account__account_owner=self.user).update(date=self.day)
+        call_command('snapshot_net_worth', '--rebuild', '--through', str(yesterday), stdout=io.StringIO())
+        self.add(self.cash, 4, 10, 'DEC')
+
+        response = self.client.get(reverse('networthsnapshot-trend'))
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual([str(self.day + datetime.timedelta(days=day)) for day in range(5)],
+                         [point['date'] for point in response.json()])
+        self.assertEqual({'date': str(timezone.localdate()), 'cash': '70.00', 'savings': '80.00',
+                          'asset': '0.00', 'debt': '0.00', 'mortgage': '900.00'}, response.json()[-1])
+
+        response = self.client.get(reverse('networthsnapshot-trend'), {'points': 2, 'end': str(yesterday)})
+        self.assertEqual([str(self.day + datetime.timedelta(days=1)), str(yesterday)],
+                         [point['date'] for point in response.json()])
+
+        self.client.force_authenticate(user=self.user2)
+        self.assertEqual([], self.client.get(reverse('networthsnapshot-trend')).data)
+
+
+class AdminChangelistTests(TestCase):
+
+    def setUp(self):
+        """Set up a superuser and transactions across two years."""
+        self.admin = User.objects.create_superuser(username='admin', password='password123')
+        self.client.force_login(self.admin)
+        self.account = Account.objects.create(name='cash', account_owner=self.admin, account_type='C')
+        vendor = Vendor.objects.create(name='grocer')
+        category = Category.objects.create(name='food')
+        for day in ['2024-03-05', '2024-03-09', '2025-07-01']:
+            Transaction.objects.create(
+                account=self.account, vendor=vendor, category=category, description='weekly shop',
+                amount=10, type='DEC', date=datetime.date.fromisoformat(day),
+            )
+        Transaction.objects.create(account=self.account, description='no vendor', amount=1, type='INC')
+
+    def test_delete_selected_accounts(self):
+        """Test the admin's bulk delete removes accounts along with their transactions."""
+        response = self.client.post(reverse('admin:accounts_account_changelist'), {
+            'action': 'delete_selected', '_selected_action': [self.account.pk], 'post': 'yes',
+        })
+        self.assertEqual(302, response.status_code)
+        self.assertFalse(Transaction.objects.exists())
+        self.assertFalse(MonthlyRollup.objects.exists())
+        connection.check_constraints()
+
+    def test_changelist_queries_do_not_grow_with_rows(self):
+        """Test the FK columns are joined into the page query and the date hierarchy lists years."""
+        url = reverse('admin:accounts_transaction_changelist')
+        with CaptureQueriesContext(connection) as few:
+            response = self.client.get(url)
+        self.assertEqual(200, response.status_code)
+        self.assertContains(response, '?date__year=2024')
+        self.assertContains(response, '?date__year=2025')
+
+        for i in range(20):
+            Transaction.objects.create(account=self.account, vendor=Vendor.objects.create(name='another %d' % i),
+                                       description='more', amount=1, type='DEC')
+        with CaptureQueriesContext(connection) as many:
+            self.client.get(url)
+        self.assertEqual(len(few), len(many))
+
+        response = self.client.get(url, {'date__year': '2024', 'date__month': '3'})
+        self.assertEqual(2, response.context['cl'].result_count)
+        self.assertEqual(['2024-03-05', '2024-03-09'],
+                         [str(day) for day in response.context['cl'].queryset.dates('date', 'day')])
+        self.assertEqual(200, self.client.get(reverse('admin:accounts_transaction_change',
+                                                      args=[Transaction.objects.get(vendor=None).id])).status_code)
+
+    def test_estimated_count(self):
+        """Test unfiltered changelists count from the table statistics and filtered ones up to a limit."""
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+            cursor.execute("UPDATE sqlite_stat1 SET stat = '5000000 1' WHERE tbl = 'accounts_transaction'")
+        url = reverse('admin:accounts_transaction_changelist')
+        with mock.patch('accounts.admin.EstimatedCountPaginator.count_limit', 2):
+            self.assertEqual(5000000, self.client.get(url).context['cl'].result_count)
+            self.assertEqual(3, self.client.get(url, {'type__exact': 'DEC'}).context['cl'].result_count)
+        # Below the limit the exact count is cheap and stale statistics are not trusted.
+        with connection.cursor() as cursor:
+            cursor.execute("UPDATE sqlite_stat1 SET stat = '3 1' WHERE tbl = 'accounts_transaction'")
+        self.assertEqual(4, self.client.get(url).context['cl'].result_count)
+
+    def test_autocomplete(self):
+        """Test the FK widgets search through the related admins."""
+        response = self.client.get(reverse('admin:autocomplete'), {
+            'term': 'groc', 'app_label': 'accounts', 'model_name': 'transaction', 'field_name': 'vendor',
+        })
+        self.assertEqual(['grocer'], [result['text'] for result in response.json()['results']])
+
+
+class RuleTests(APITestCase):
+
+    def setUp(self):
+        """Set up two accounts, vendors, categories and rules for one user."""
+        self.user = User.objects.create_user(username='testuser', password='password123')
+        self.user2 = User.objects.create_user(username='testuser2', password='password123')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.cash = Account.objects.create(name='cash', account_owner=self.user, account_type='C')
+        self.card = Account.objects.create(name='card', account_owner=self.user, account_type='D')
+        self.amazon = Vendor.objects.create(name='Amazon')
+        self.grocer = Vendor.objects.create(name='Grocer')
+        self.shopping = Category.objects.create(name='Shopping')
+        self.food = Category.objects.create(name='Food')
+        self.big = Category.objects.create(name='Big purchases')
+        Rule.objects.create(user=self.user, pattern='AMZN', vendor=self.amazon, category=self.shopping, priority=5)
+        Rule.objects.create(user=self.user, pattern='amazon', vendor=self.amazon, category=self.shopping, priority=5)
+        Rule.objects.create(user=self.user, pattern='', min_amount=500, category=self.big, priority=1)
+        Rule.objects.create(user=self.user, pattern='pos ', match_type='S', account=self.card,
+                            vendor=self.grocer, category=self.food, priority=9)
+
+    def test_deleting_users_in_bulk(self):
+        """Test deleting users through a queryset records no rule deletion for them."""
+        User.objects.filter(pk=self.user.pk).delete()
+        self.assertFalse(DeletionMark.objects.filter(model=Rule._meta.label_lower).exists())
+        connection.check_constraints()
+
+    def test_matcher(self):
+        """Test substring, prefix, amount and account conditions and the order rules are tried in."""
+        matcher = matcher_for(self.user.id)
+        self.assertEqual((self.amazon.id, self.shopping.id), matcher.match('Mktp AMZN.com/bill', Decimal(20), self.cash.id))
+        self.assertEqual((self.amazon.id, self.big.id), matcher.match('amazon', Decimal(800), self.cash.id))
+        self.assertEqual((self.grocer.id, self.food.id), matcher.match('POS grocer', Decimal(20), self.card.id))
+        self.assertEqual((None, None), matcher.match('POS grocer', Decimal(20), self.cash.id))
+        self.assertEqual((None, None), matcher.match('grocer POS 1', Decimal(20), self.card.id))
+
+        # Overlapping patterns, found through the failure links; candidates are positions in the rule list.
+        matcher = RuleMatcher([Rule(pattern=pattern) for pattern in ['he', 'she', 'hers', 'is']])
+        self.assertEqual([0, 1, 2], sorted(matcher.candidates('ushers')))
+        self.assertEqual([3], matcher.candidates('this'))
+
+    def test_compiled_rules_are_cached_until_they_change(self):
+        """Test rules compile once and recompile after an edit or a deletion."""
+        matcher = matcher_for(self.user.id)
+        with self.assertNumQueries(1):
+            self.assertIs(matcher, matcher_for(self.user.id))
+        rule = Rule.objects.get(pattern='AMZN')
+        rule.pattern = 'AMZX'
+        rule.save()
+        self.assertEqual((None, None), matcher_for(self.user.id).match('amzn', Decimal(1), self.cash.id))
+        Rule.objects.get(pattern='amazon').delete()
+        self.assertEqual((None, None), matcher_for(self.user.id).match('amazon', Decimal(1), self.cash.id))
+
+    def test_applied_on_create_and_import(self):
+        """Test rules fill in what a new or imported transaction lacks and keep what it has."""
+        response = self.client.post(reverse('transaction-list'), {
+            'description': 'AMZN Mktp', 'amount': '12.00', 'type': 'DEC', 'date': '2024-01-02',
+            'account': reverse('account-detail', args=[self.cash.id]),
+            'category': reverse('category-detail', args=[self.food.id]),
+        }, format='json')
+        self.assertEqual(status.HTTP_201_CREATED, response.status_code)
+        transaction = Transaction.objects.get(pk=response.data['id'])
+        self.assertEqual((self.amazon, self.food), (transaction.vendor, transaction.category))
+
+        content = (
+            'date,description,amount,type,vendor,account\n'
+            '2024-01-03,amazon.com order,600,DEC,,%(a)s\n'
+            '2024-01-04,POS corner shop,3,DEC,Kiosk,%(b)s\n'
+        ) % {'a': self.cash.id, 'b': self.card.id}
+        upload = SimpleUploadedFile('statement.csv', content.encode('utf-8'))
+        response = self.client.post(reverse('transaction-import-file'), {'file': upload}, format='multipart')
+        self.assertEqual(2, response.data['created'])
+        order = Transaction.objects.get(description='amazon.com order')
+        self.assertEqual((self.amazon, self.big), (order.vendor, order.category))
+        shop = Transaction.objects.get(description='POS corner shop')
+        self.assertEqual(('Kiosk', self.food), (shop.vendor.name, shop.category))
+
+    def test_rules_api_and_reapply(self):
+        """Test users manage only their own rules and reapplying them updates rollups as well."""
+        for description in ['AMZN 1', 'AMZN 2', 'rent']:
+            Transaction.objects.create(account=self.cash, description=description, amount=10, type='DEC',
+                                       date=datetime.date(2024, 1, 2))
+        response = self.client.post(reverse('rule-list'), {
+            'pattern': 'rent', 'category': reverse('category-detail', args=[self.food.id]),
+        }, format='json')
+        self.assertEqual(status.HTTP_201_CREATED, response.status_code)
+        response = self.client.post(reverse('rule-list'), {'pattern': 'rent'}, format='json')
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+        other = Account.objects.create(name='other', account_owner=self.user2, account_type='C')
+        response = self.client.post(reverse('rule-list'), {
+            'pattern': 'x', 'account': reverse('account-detail', args=[other.id]),
+            'category': reverse('category-detail', args=[self.food.id]),
+        }, format='json')
+        self.assertIn('account', response.data)
+        self.client.force_authenticate(user=self.user2)
+        self.assertEqual(0, self.client.get(reverse('rule-list')).data['count'])
+        self.assertEqual({'updated': 0}, self.client.post(reverse('rule-reapply')).data)
+
+        self.client.force_authenticate(user=self.user)
+        self.assertEqual({'updated': 3}, self.client.post(reverse('rule-reapply')).data)
+        self.assertEqual(2, Transaction.objects.filter(vendor=self.amazon, category=self.shopping).count())
+        self.assertEqual(Decimal('20.00'), MonthlyRollup.objects.get(category=self.shopping).dec_total)
+        self.assertEqual({'updated': 0}, self.client.post(reverse('rule-reapply')).data)
+
+
+class VendorNormalizationTests(APITestCase):
+
+    def setUp(self):
+        """Set up an account and two vendors."""
+        self.user = User.objects.create_user(username='testuser', password='password123')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.account = Account.objects.create(name='cash', account_owner=self.user, account_type='C')
+        self.amazon = Vendor.objects.create(name='Amazon')
+        self.grocer = Vendor.objects.create(name='Grocer')
+
+    def test_create_returns_existing_vendor(self):
+        """Test names differing in case, punctuation, accents or a web domain are one vendor."""
+        self.assertEqual('amazon', normalize_vendor_name('www.AMAZON.com '))
+        self.assertEqual('trader joes', normalize_vendor_name("Trader Joe’s"))
+        self.assertEqual('cafe de flore', normalize_vendor_name('Café-de-Flore'))
+        for name in ['AMAZON', 'Amazon.com']:
+            response = self.client.post(reverse('vendor-list'), {'name': name}, format='json')
+            self.assertEqual(status.HTTP_200_OK, response.status_code)
+            self.assertEqual(self.amazon.id, response.data['id'])
+        response = self.client.post(reverse('vendor-list'), {'name': 'AMZN Mktp'}, format='json')
+        self.assertEqual(status.HTTP_201_CREATED, response.status_code)
+        self.assertEqual('amzn mktp', response.data['normalized_name'])
+        self.assertEqual(3, Vendor.objects.count())
+
+    def test_rename_onto_existing_vendor_is_rejected(self):
+        """Test a rename keeps the normalized name in step and cannot duplicate another vendor."""
+        url = reverse('vendor-detail', args=[self.grocer.id])
+        response = self.client.put(url, {'name': 'AMAZON'}, format='json')
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+        self.assertIn('name', response.data)
+        response = self.client.put(url, {'name': 'GROCER & Co'}, format='json')
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.grocer.refresh_from_db()
+        self.assertEqual('grocer co', self.grocer.normalized_name)
+
+        # A concurrent rename that wins after the check is still reported as a 400.
+        with mock.patch.object(VendorSerializer, 'validate_name', lambda serializer, value: value):
+            response = self.client.put(url, {'name': 'Amazon.com'}, format='json')
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+        self.assertEqual([Vendor.DUPLICATE_NAME], response.data['name'])
+
+    def test_admin_reports_duplicate_names(self):
+        """Test adding or renaming a vendor onto an existing one in the admin is a form error."""
+        self.client.force_login(User.objects.create_superuser(username='admin', password='password123'))
+        created = {'created_0': '2024-01-01', 'created_1': '00:00:00'}
+        response = self.client.post(reverse('admin:accounts_vendor_add'), {'name': 'Amazon.com', **created})
+        self.assertEqual(200, response.status_code)
+        self.assertEqual([Vendor.DUPLICATE_NAME], response.context['adminform'].form.errors['name'])
+        url = reverse('admin:accounts_vendor_change', args=[self.grocer.id])
+        response = self.client.post(url, {'name': 'AMAZON', **created})
+        self.assertEqual([Vendor.DUPLICATE_NAME], response.context['adminform'].form.errors['name'])
+        response = self.client.post(url, {'name': 'Grocer Ltd', **created})
+        self.assertEqual(302, response.status_code)
+        self.assertEqual(2, Vendor.objects.count())
+
+    def test_import_matches_normalized_names(self):
+        """Test imported rows share vendors by normalized name, including new vendors."""
+        importer = TransactionImporter(self.user, default_account=self.account.id)
+        report = importer.run(parse_csv(io.StringIO(
+            'date,description,amount,vendor\n'
+            '2024-01-02,order,-5,AMAZON.COM\n'
+            '2024-01-03,order,-6,amazon\n'
+            '2024-01-04,coffee,-3,Corner Café\n'
+            '2024-01-05,coffee,-3,CORNER CAFE\n'
+        )))
+        self.assertEqual(4, report['created'])
+        self.assertEqual(2, Transaction.objects.filter(vendor=self.amazon).count())
+        self.assertEqual(3, Vendor.objects.count())
+        self.assertEqual(2, Transaction.objects.filter(vendor__name='Corner Café').count())
+
+    def test_merge_command(self):
+        """Test duplicates and aliases are folded with their transactions, rules and rollups."""
+        # Queryset updates skip save(), leaving a duplicate under a stale normalized name.
+        duplicate = Vendor.objects.create(name='Amazon shop')
+        Vendor.objects.filter(pk=duplicate.pk).update(name='amazon.com')
+        alias = Vendor.objects.create(name='AMZN Mktp')
+        for vendor in [self.amazon, duplicate, alias]:
+            Transaction.objects.create(account=self.account, vendor=vendor, description='order', amount=10,
+                                       type='DEC', date=datetime.date(2024, 1, 2))
+        rule = Rule.objects.create(user=self.user, pattern='amzn', vendor=alias)
+
+        out = io.StringIO()
+        call_command('merge_vendors', '--dry-run', stdout=out)
+        self.assertIn('Would fold 1 vendors.', out.getvalue())
+        self.assertTrue(Vendor.objects.filter(pk=duplicate.pk).exists())
+        call_command('merge_vendors', stdout=out)
+        self.assertIn('Folded 1 vendors, repointing 1 transactions.', out.getvalue())
+        call_command('merge_vendors', alias.id, '--into', self.amazon.id, stdout=out)
+
+        self.assertEqual({self.amazon.id, self.grocer.id}, set(Vendor.objects.values_list('id', flat=True)))
+        self.assertEqual(3, Transaction.objects.filter(vendor=self.amazon).count())
+        rule.refresh_from_db()
+        self.assertEqual(self.amazon.id, rule.vendor_id)
+        rollup = MonthlyRollup.objects.get(account=self.account)
+        self.assertEqual((self.amazon.id, Decimal('30.00'), 3), (rollup.vendor_id, rollup.dec_total, rollup.dec_count))
+
+    def test_fold_backfills_vendors_from_before_normalization(self):
+        """Test vendors migrated without a normalized name are folded and given one."""
+        legacy = Vendor.objects.create(name='legacy')
+        Vendor.objects.filter(pk=legacy.pk).update(name='AMAZON.COM', normalized_name=None)
+        Vendor.objects.filter(pk=self.grocer.pk).update(normalized_name=None)
+        Transaction.objects.create(account=self.account, vendor=legacy, description='order', amount=10, type='DEC')
+
+        out = io.StringIO()
+        call_command('merge_vendors', stdout=out)
+        self.assertIn('Folded 1 vendors, repointing 1 transactions.', out.getvalue())
+        self.assertEqual(
+            {self.amazon.id: 'amazon', self.grocer.id: 'grocer'},
+            dict(Vendor.objects.values_list('id', 'normalized_name')),
+        )
+        self.assertEqual(1, Transaction.objects.filter(vendor=self.amazon).count())
+
+    def test_fold_refreshes_stale_normalized_names(self):
+        """Test folding also stores the normalized names of renamed vendors without duplicates."""
+        Vendor.objects.filter(pk=self.amazon.pk).update(name='Grocery Outlet')
+        Vendor.objects.filter(pk=self.grocer.pk).update(name='Amazon')
+        self.assertEqual((0, 0), fold_duplicates())
+        self.assertEqual(
+            {self.amazon.id: 'grocery outlet', self.grocer.id: 'amazon'},
+            dict(Vendor.objects.values_list('id', 'normalized_name')),
+        )
+
+
+class SparseFieldsTests(APITestCase):
+
+    def setUp(self):
+        """Set up an account with a few transactions."""
+        self.user = User.objects.create_user(username='testuser', password='password123')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.vendor = Vendor.objects.create(name='Grocer')
+        self.account = Account.objects.create(name='cash', account_owner=self.user, account_type='C')
+        for i in range(3):
+            Transaction.objects.create(
+                description='item %d' % i, date=datetime.date(2024, 1, 1 + i), amount='12.50', type='DEC',
+                vendor=self.vendor, account=self.account,
+            )
+        self.url = reverse('transaction-list')
+
+    def page_query(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        return response, queries[-1]['sql']
+
+    def test_fields_trim_output_and_columns(self):
+        """Test the chosen fields are the only ones rendered and, with what the view needs, loaded."""
+        response, sql = self.page_query(self.url + '?fields=id,amount')
+        self.assertEqual([{'id', 'amount'}] * 3, [set(row) for row in response.data['results']])
+        self.assertNotIn('"description"', sql)
+        self.assertNotIn('"created"', sql)
+        self.assertIn('"account_id"', sql)
+
+        response, sql = self.page_query(self.url + '?exclude=created,last_updated,url&format=flat')
+        row = response.json()['results'][0]
+        self.assertEqual({'id', 'date', 'vendor', 'description', 'amount', 'type', 'category', 'account',
+                          'paid_off', 'recurring', 'series', 'occurrence_date'}, set(row))
+        self.assertNotIn('"created"', sql)
+
+        response = self.client.get(self.url + '?fields=id,colour&exclude=size')
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+        self.assertEqual(['Unknown fields: colour.'], response.data['fields'])
+
+    def test_sparse_detail_and_cursor_pages(self):
+        """Test a sparse object or cursor page reads nothing back for the view's own checks."""
+        transaction = Transaction.objects.get(description='item 0')
+        # Ownership, the object and the deletion marks; the permission check and validators find their columns loaded.
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('transaction-detail', args=[transaction.id]) + '?fields=amount')
+        self.assertEqual({'amount': '12.50'}, response.data)
+
+        response = self.client.get(self.url + '?pagination=cursor&page_size=2&fields=description')
+        response = self.client.get(response.data['next'])
+        self.assertEqual([{'description': 'item 2'}], response.data['results'])
+
+    def test_writes_ignore_field_choice(self):
+        """Test writes validate and answer with every field."""
+        response = self.client.post(reverse('vendor-list') + '?fields=name', {'name': 'Baker'}, format='json')
+        self.assertEqual(status.HTTP_201_CREATED, response.status_code)
+        self.assertIn('created', response.data)
+
+    def test_related_rows_joined_only_when_read(self):
+        """Test foreign keys rendered as links add no join and many-valued ones are prefetched."""
+        admin = User.objects.create_user(username='admin', password='password123', is_staff=True)
+        admin.groups.add(Group.objects.create(name='staff'))
+        self.user.groups.add(Group.objects.create(name='members'))
+        self.client.force_authenticate(user=admin)
+        # The count, the page and one query for the groups of every user on it.
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('user-list') + '?fields=username,groups')
+        self.assertEqual({'username', 'groups'}, set(response.data['results'][0]))
+
+        class VendorNameSerializer(serializers.ModelSerializer):
+            vendor_name = serializers.CharField(source='vendor.name')
+
+            class Meta:
+                model = Transaction
+                fields = ['id', 'vendor', 'vendor_name']
+
+        queryset = Transaction.objects.all()
+        fields = VendorNameSerializer().fields
+        plan = ColumnPlan(Transaction, [fields['id'], fields['vendor']])
+        self.assertEqual(({'id', 'vendor'}, set()), (plan.columns, plan.joins))
+        plan = ColumnPlan(Transaction, fields.values())
+        rows = list(plan.apply(queryset))
+        self.assertEqual(({'id', 'vendor', 'vendor__name'}, {'vendor'}), (plan.columns, plan.joins))
+        with self.assertNumQueries(0):
+            self.assertEqual(['Grocer'] * 3, [row['vendor_name'] for row in VendorNameSerializer(rows, many=True).data])
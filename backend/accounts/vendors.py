@@ -0,0 +1,111 @@
+from collections import defaultdict
+
+from django.db import transaction as db_transaction
+from django.db.models import Case, CharField, F, IntegerField, Value, When
+from django.db.models.functions import Cast, Concat
+from django.utils import timezone
+
+from . import rollups
+from .cache import invalidate_all
+from .models import MonthlyRollup, Rule, Transaction, Vendor, normalize_vendor_name
+
+# Folded vendors repointed per UPDATE, bounding the size of its CASE expression.
+MERGES_PER_UPDATE = 500
+
+
+def get_or_create_vendor(name):
+    """
+    The vendor `name` normalizes to, created with that name if there is none, and whether it was
+    created. Safe under concurrency: of two requests creating the same vendor, the unique
+    normalized name lets one insert succeed and the other then reads that row.
+    """
+    return Vendor.objects.get_or_create(normalized_name=normalize_vendor_name(name), defaults={'name': name})
+
+
+def vendor_ids(names):
+    """
+    Map names to the ids of their vendors, creating missing vendors with one bulk insert. Names
+    that normalize alike map to the same vendor; rows another writer inserts concurrently are
+    skipped by the insert and picked up by the read after it.
+    """
+    keys = {name: normalize_vendor_name(name) for name in names}
+    found = dict(Vendor.objects.filter(normalized_name__in=set(keys.values())).values_list('normalized_name', 'id'))
+    missing = {}
+    for name, key in keys.items():
+        if key not in found:
+            missing.setdefault(key, name)
+    if missing:
+        Vendor.objects.bulk_create(
+            [Vendor(name=name, normalized_name=key) for key, name in missing.items()], ignore_conflicts=True
+        )
+        found.update(Vendor.objects.filter(normalized_name__in=missing).values_list('normalized_name', 'id'))
+    return {name: found[key] for name, key in keys.items()}
+
+
+def merge_vendors(merges):
+    """
+    Fold vendors into others: `merges` maps the id of each vendor to remove to the id of the
+    vendor replacing it. Transactions and rules are repointed with one UPDATE per
+    `MERGES_PER_UPDATE` folded vendors, the rollups of the affected accounts are rebuilt once,
+    and the folded vendors are deleted. Returns the number of transactions repointed.
+    """
+    merges = {old: new for old, new in merges.items() if old != new}
+    if not merges:
+        return 0
+    if set(merges) & set(merges.values()):
+        raise ValueError("A vendor cannot be both folded and kept.")
+
+    repointed = 0
+    now = timezone.now()
+    with db_transaction.atomic():
+        account_ids = set(
+            MonthlyRollup.objects.filter(vendor_id__in=merges).values_list('account_id', flat=True).distinct()
+        )
+        folded = sorted(merges)
+        for index in range(0, len(folded), MERGES_PER_UPDATE):
+            chunk = folded[index:index + MERGES_PER_UPDATE]
+            vendor = Case(
+                *[When(vendor_id=old, then=Value(merges[old])) for old in chunk],
+                default=F('vendor_id'),
+                output_field=IntegerField(),
+            )
+            repointed += Transaction.objects.filter(vendor_id__in=chunk).update(vendor_id=vendor, last_updated=now)
+            Rule.objects.filter(vendor_id__in=chunk).update(vendor_id=vendor, last_updated=now)
+        if account_ids:
+            rollups.rebuild(account_ids)
+        Vendor.objects.filter(pk__in=merges).delete()
+    invalidate_all()
+    return repointed
+
+
+def duplicate_groups():
+    """
+    Vendors whose names normalize alike, as `{normalized name: [ids]}`, oldest first. Normally
+    every group has one vendor; duplicates come from rows written before normalization (whose
+    stored key is NULL) or with an older version of it, and from renames made with queryset updates.
+    """
+    groups = defaultdict(list)
+    for pk, name in Vendor.objects.order_by('id').values_list('id', 'name'):
+        groups[normalize_vendor_name(name)].append(pk)
+    return groups
+
+
+def fold_duplicates(groups=None):
+    """
+    Fold every group of `duplicate_groups` into its oldest vendor and store the current
+    normalized names, backfilling the ones still NULL. Returns `(vendors folded, transactions repointed)`.
+    """
+    groups = duplicate_groups() if groups is None else groups
+    merges = {pk: ids[0] for ids in groups.values() for pk in ids[1:]}
+    with db_transaction.atomic():
+        repointed = merge_vendors(merges)
+        stored = dict(Vendor.objects.values_list('id', 'normalized_name'))
+        stale = [Vendor(pk=ids[0], normalized_name=key) for key, ids in groups.items() if stored[ids[0]] != key]
+        if stale:
+            # Park the stale names on keys no name normalizes to ('#' is dropped), so the new
+            # names never collide with old ones not yet rewritten.
+            Vendor.objects.filter(pk__in=[vendor.pk for vendor in stale]).update(
+                normalized_name=Concat(Value('#'), Cast('id', CharField()))
+            )
+            Vendor.objects.bulk_update(stale, ['normalized_name'], batch_size=MERGES_PER_UPDATE)
+    return len(merges), repointed
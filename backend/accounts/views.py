@@ -1,42 +1,61 @@
+import datetime
+
 from django.contrib.auth.decorators import login_required, permission_required
 from django.contrib.auth.models import Group
-from django.db import models
+from django.http import HttpResponse, HttpResponseForbidden, StreamingHttpResponse
 from django.shortcuts import render
-from guardian.shortcuts import get_objects_for_user
-from rest_framework import permissions, viewsets
+from django.utils import timezone
+from rest_framework import permissions, serializers, status, viewsets
+from rest_framework.decorators import action
+from rest_framework.parsers import FormParser, MultiPartParser
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
 
-from .models import Account, Category, User, Vendor, Transaction
+from .access import accessible_accounts
+from .balances import INTERVALS, MAX_POINTS, balance_series
+from .bulk import MAX_IDS, UPDATABLE_FIELDS, delete_transactions, update_transactions
+from .cache import CachedResponseMixin
+from .conditional import ConditionalGetMixin
+from .dashboard import build_dashboard
+from .export import CSVRenderer, NDJSONRenderer, csv_stream, export_rows, ndjson_stream
+from .filters import TransactionFilter, is_filtered, parse_count_param, parse_date_param, parse_ids_param
+from .flat import FlatJSONRenderer, FlatSerializationMixin
+from .importers import FORMATS, UnreadableFile, detect_format, import_transactions, text_stream
+from .ledger import ZERO
+from .metrics import may_scrape, registry
+from .models import Account, Category, MonthlyRollup, NetWorthSnapshot, Recurrence, Rule, User, Vendor, Transaction
+from .ownership import owned_account_ids
+from .pagination import TransactionPagination
 from .permissions import IsOwnerOrAdmin
+from .rollups import summary
+from .rules import reapply_rules
+from .search import search_terms, search_transactions
+from .snapshots import current_totals
+from .sparse import SparseFieldsMixin
+from .vendors import get_or_create_vendor
 from .serializers import CategorySerializer, GroupSerializer, UserSerializer, VendorSerializer, AccountSerializer, \
-    TransactionSerializer
+    BalancePointSerializer, MonthlyRollupSerializer, NetWorthPointSerializer, NetWorthSnapshotSerializer, \
+    RecurrenceSerializer, RuleSerializer, TransactionSerializer
 
 
 @login_required
 @permission_required('accounts.view_account')
 def index(request):
-    accounts = get_objects_for_user(
-        user=request.user, 
-        perms='view_account', 
-        klass=Account, 
-        accept_global_perms=False
-    )
-    
-    context = {"mortgage": accounts.filter(mortgage=True)}
-    
-    for type in Account.AccountType:
-        account_name=type.name.lower()
-        account_type_key=account_name + "_accounts"
-        total_type_key="total_" + account_name
-        context[account_type_key] = [account for account in accounts if account.account_type==type and not account.mortgage]
-        context[total_type_key] = sum_account_balances_by_type(context[account_type_key])
-
-    return render(request, "accounts/index.html", context)
-
-def sum_account_balances_by_type(accounts):
-    return sum(account.current_balance for account in accounts)
-
-
-class UserViewSet(viewsets.ModelViewSet):
+    accounts = accessible_accounts(request.user, 'view_account')
+    return render(request, "accounts/index.html", build_dashboard(accounts))
+
+
+def metrics(request):
+    """
+    Per-view request histograms in the Prometheus text format, for scraping. They describe the
+    app's traffic, so only staff and scrapers holding `METRICS_TOKEN` may read them.
+    """
+    if not may_scrape(request):
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class UserViewSet(SparseFieldsMixin, viewsets.ModelViewSet):
     """
     API endpoint that allows users to be viewed or edited.
     """
@@ -45,7 +64,7 @@ class UserViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated, permissions.IsAdminUser]
 
 
-class GroupViewSet(viewsets.ModelViewSet):
+class GroupViewSet(SparseFieldsMixin, viewsets.ModelViewSet):
     """
     API endpoint that allows groups to be viewed or edited.
     """
@@ -53,29 +72,50 @@ class GroupViewSet(viewsets.ModelViewSet):
     serializer_class = GroupSerializer
     permission_classes = [permissions.IsAuthenticated, permissions.IsAdminUser]
 
-class CategoryViewSet(viewsets.ModelViewSet):
+class CategoryViewSet(ConditionalGetMixin, SparseFieldsMixin, viewsets.ModelViewSet):
     """
     API endpoint that allows categories to be viewed or edited.
     """
     queryset = Category.objects.all().order_by('name')
     serializer_class = CategorySerializer
     permission_classes = [permissions.IsAuthenticated]
+    required_columns = ['last_updated']
 
-class VendorViewSet(viewsets.ModelViewSet):
+class VendorViewSet(ConditionalGetMixin, SparseFieldsMixin, viewsets.ModelViewSet):
     """
     API endpoint that allows vendors to be viewed or edited.
     """
     queryset = Vendor.objects.all().order_by('name')
     serializer_class = VendorSerializer
     permission_classes = [permissions.IsAuthenticated]
+    required_columns = ['last_updated']
 
-class AccountViewSet(viewsets.ModelViewSet):
+    def create(self, request, *args, **kwargs):
+        """
+        Create a vendor, or return the existing one whose name normalizes the same ("AMAZON" and
+        "Amazon.com" are one vendor) with a 200 instead of a 201.
+        """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        vendor, created = get_or_create_vendor(serializer.validated_data['name'])
+        serializer = self.get_serializer(vendor)
+        headers = self.get_success_headers(serializer.data) if created else {}
+        return Response(serializer.data, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK,
+                        headers=headers)
+
+class AccountViewSet(CachedResponseMixin, ConditionalGetMixin, SparseFieldsMixin, FlatSerializationMixin,
+                     viewsets.ModelViewSet):
     """
     API endpoint that allows accounts to be viewed or edited.
+    `?format=flat` returns a compact representation with foreign keys as ids.
+    `?fields=` and `?exclude=` choose the fields returned; see `SparseFieldsMixin`.
+    `<id>/balance/` charts an account's balance over time.
     """
     queryset = Account.objects.all().order_by('id')
     serializer_class = AccountSerializer
     permission_classes = [permissions.IsAuthenticated, IsOwnerOrAdmin]
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, FlatJSONRenderer]
+    required_columns = ['account_owner', 'last_updated']
 
     def get_queryset(self):
         """
@@ -86,15 +126,52 @@ class AccountViewSet(viewsets.ModelViewSet):
             return self.queryset
 
         # Return accounts where the user is the owner
-        return self.queryset.filter(models.Q(account_owner=user)).distinct()
+        return self.queryset.filter(account_owner=user)
+
+    @action(detail=True)
+    def balance(self, request, pk=None):
+        """
+        The balance at the end of every `interval` (`day`, `week` or `month`) with transactions,
+        between optional `start` and `end` dates. `points` caps the series length by keeping
+        every n-th period.
+        """
+        account = self.get_object()
+        params = request.query_params
+        interval = params.get('interval') or 'day'
+        if interval not in INTERVALS:
+            raise serializers.ValidationError({'interval': ['"%s" is not a valid choice.' % interval]})
+        start = parse_date_param(params, 'start') if params.get('start') else None
+        end = parse_date_param(params, 'end') if params.get('end') else None
+        points = parse_count_param(params, 'points', MAX_POINTS) if params.get('points') else None
 
-class TransactionViewSet(viewsets.ModelViewSet):
+        series = balance_series(account, interval, start, end, points)
+        series = [{'date': date, 'balance': balance} for date, balance in series]
+        return Response({
+            'account': account.id,
+            'interval': interval,
+            'series': BalancePointSerializer(series, many=True).data,
+        })
+
+class TransactionViewSet(CachedResponseMixin, ConditionalGetMixin, SparseFieldsMixin, FlatSerializationMixin,
+                         viewsets.ModelViewSet):
     """
     API endpoint that allows transactions to be viewed or edited.
+    `?format=flat` returns a compact representation with foreign keys as ids.
+    `?fields=` and `?exclude=` choose the fields returned; see `SparseFieldsMixin`.
+    The list can be filtered by date, account, category, vendor, type, flags and amount; see `TransactionFilter`.
+    `search/?q=` finds transactions by description and vendor name.
+    `export/` streams every visible transaction as CSV, or as NDJSON with `?format=ndjson`.
+    `bulk-update/` and `bulk-delete/` change or delete many transactions with one statement.
     """
     queryset = Transaction.objects.all().order_by('date')
     serializer_class = TransactionSerializer
     permission_classes = [permissions.IsAuthenticated, IsOwnerOrAdmin]
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, FlatJSONRenderer]
+    pagination_class = TransactionPagination
+    filter_backends = [TransactionFilter]
+    deletion_models = [Transaction, Account, Vendor, Category, Recurrence]
+    # The cursor, the ownership check and the conditional GET validators read these.
+    required_columns = ['date', 'account', 'last_updated']
 
     def get_queryset(self):
         """
@@ -104,5 +181,273 @@ class TransactionViewSet(viewsets.ModelViewSet):
         if user.is_staff or user.is_superuser:
             return self.queryset
 
-        # Return accounts where the user is the owner
-        return self.queryset.filter(models.Q(account__account_owner=user)).distinct()
+        # Return transactions in accounts the user owns, reusing the ids the permission check loaded
+        return self.queryset.filter(account_id__in=owned_account_ids(self.request))
+
+    @action(detail=False)
+    def search(self, request):
+        """
+        Ranked full-text search over descriptions and vendor names; every term of `q` must match
+        the start of a word. Accepts the same filters as the list.
+        """
+        query = request.query_params.get('q', '')
+        if not search_terms(query):
+            return Response({'q': ['Enter a search term.']}, status=status.HTTP_400_BAD_REQUEST)
+
+        user = request.user
+        account_ids = None if user.is_staff or user.is_superuser else owned_account_ids(request)
+        queryset = search_transactions(self.filter_queryset(self.get_queryset()), query, account_ids)
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(self.get_serializer(page, many=True).data)
+        return Response(self.get_serializer(queryset, many=True).data)
+
+    @action(detail=False, renderer_classes=[CSVRenderer, NDJSONRenderer])
+    def export(self, request):
+        """
+        Stream every transaction the user can see, account by account and oldest first,
+        as CSV (importable again) or NDJSON.
+        Accepts the same filters as the list.
+        """
+        rows = export_rows(self.filter_queryset(self.get_queryset()))
+        if request.accepted_renderer.format == NDJSONRenderer.format:
+            response = StreamingHttpResponse(ndjson_stream(rows), content_type=NDJSONRenderer.media_type)
+            filename = 'transactions.ndjson'
+        else:
+            response = StreamingHttpResponse(csv_stream(rows), content_type='text/csv; charset=utf-8')
+            filename = 'transactions.csv'
+        response['Content-Disposition'] = 'attachment; filename="%s"' % filename
+        return response
+
+    @action(detail=False, methods=['post'], url_path='import', parser_classes=[MultiPartParser, FormParser])
+    def import_file(self, request):
+        """
+        Bulk import transactions from an uploaded CSV or OFX `file`.
+        `account` sets the account for rows that do not name one (required for OFX).
+        """
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({'file': ['No file was submitted.']}, status=status.HTTP_400_BAD_REQUEST)
+
+        format = detect_format(upload.name, request.data.get('format'))
+        if format not in FORMATS:
+            return Response({'format': ['"%s" is not a valid choice.' % format]}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            report = import_transactions(request.user, text_stream(upload.file), format, request.data.get('account'))
+        except UnreadableFile as error:
+            return Response({'file': [str(error)]}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(report, status=status.HTTP_201_CREATED if report['created'] else status.HTTP_400_BAD_REQUEST)
+
+    @action(detail=False, methods=['post'], url_path='bulk-update')
+    def bulk_update(self, request):
+        """
+        Apply `changes`, fields as in a PATCH, to the selected transactions with a single update.
+        Select them by `ids` or with the list filters in the query string. Returns the number updated.
+        """
+        queryset = self.get_bulk_queryset()
+        changes = request.data.get('changes')
+        if not isinstance(changes, dict) or not changes:
+            raise serializers.ValidationError({'changes': ['Expected an object with the fields to change.']})
+        unknown = sorted(set(changes) - set(UPDATABLE_FIELDS))
+        if unknown:
+            raise serializers.ValidationError({'changes': ['Cannot change: %s.' % ', '.join(unknown)]})
+
+        # Field by field: the serializer's own validators need a whole transaction.
+        fields = self.get_serializer().fields
+        validated, errors = {}, {}
+        for name, value in changes.items():
+            try:
+                validated[name] = fields[name].run_validation(value)
+            except serializers.ValidationError as exc:
+                errors[name] = exc.detail
+        if errors:
+            raise serializers.ValidationError({'changes': errors})
+        return Response({'updated': update_transactions(queryset, validated)})
+
+    @action(detail=False, methods=['post'], url_path='bulk-delete')
+    def bulk_delete(self, request):
+        """
+        Delete the selected transactions, chosen as for `bulk-update/`, with a single delete.
+        Returns the number deleted.
+        """
+        return Response({'deleted': delete_transactions(self.get_bulk_queryset())})
+
+    def get_bulk_queryset(self):
+        """
+        The transactions a bulk action applies to: the `ids` in the payload, or those matching the
+        list filters. Ownership is checked for the whole set at once, by narrowing it to the user's
+        accounts; ids of other users' transactions match nothing.
+        """
+        queryset = self.filter_queryset(self.get_queryset())
+        data = self.request.data
+        ids = data.get('ids') if hasattr(data, 'get') else None
+        if ids is None:
+            if not is_filtered(self.request):
+                raise serializers.ValidationError({'ids': ['Select transactions by ids or with filters.']})
+            return queryset
+        if not isinstance(ids, list) or not all(type(pk) is int for pk in ids):
+            raise serializers.ValidationError({'ids': ['Expected a list of ids.']})
+        if len(ids) > MAX_IDS:
+            raise serializers.ValidationError({'ids': ['Ensure this list has at most %d ids.' % MAX_IDS]})
+        return queryset.filter(pk__in=ids)
+
+
+class RecurrenceViewSet(ConditionalGetMixin, SparseFieldsMixin, viewsets.ModelViewSet):
+    """
+    API endpoint that allows recurrence schedules of transactions to be viewed or edited.
+    Occurrences are generated by the `materialize_recurring` command.
+    """
+    queryset = Recurrence.objects.all().order_by('id')
+    serializer_class = RecurrenceSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    deletion_models = [Recurrence, Transaction, Account]
+    required_columns = ['last_updated']
+
+    def get_queryset(self):
+        """
+        Schedules of transactions in accounts the user owns.
+        """
+        user = self.request.user
+        if user.is_staff or user.is_superuser:
+            return self.queryset
+        return self.queryset.filter(transaction__account_id__in=owned_account_ids(self.request))
+
+
+class RuleViewSet(ConditionalGetMixin, SparseFieldsMixin, viewsets.ModelViewSet):
+    """
+    API endpoint that allows the requesting user's categorization rules to be viewed or edited.
+    Rules fill in the vendor and category of transactions created without them, via the API or
+    an import; `reapply/` runs them over all of the user's transactions.
+    """
+    queryset = Rule.objects.all().order_by('priority', 'id')
+    serializer_class = RuleSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    required_columns = ['last_updated']
+
+    def get_queryset(self):
+        """
+        Only the requesting user's rules.
+        """
+        return self.queryset.filter(user=self.request.user)
+
+    @action(detail=False, methods=['post'])
+    def reapply(self, request):
+        """
+        Assign the vendor and category of the matching rules to every transaction of the user,
+        keeping the fields no rule assigns. Returns the number of transactions changed.
+        """
+        return Response({'updated': reapply_rules(request.user.id)})
+
+
+class SummaryViewSet(SparseFieldsMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    API endpoint with read-only spending summaries built from the monthly rollups.
+    Accepts `start` and `end` months (YYYY-MM) and `account` ids, as in the transaction filters,
+    to narrow the range.
+    """
+    queryset = MonthlyRollup.objects.all().order_by('month', 'id')
+    serializer_class = MonthlyRollupSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        """
+        Only the requesting user's rollups, narrowed by the query parameters.
+        """
+        queryset = self.queryset.filter(user=self.request.user)
+        params = self.request.query_params
+        if params.get('start'):
+            queryset = queryset.filter(month__gte=self.parse_month('start'))
+        if params.get('end'):
+            queryset = queryset.filter(month__lte=self.parse_month('end'))
+        if params.get('account'):
+            queryset = queryset.filter(account_id__in=parse_ids_param(params, 'account'))
+        return queryset
+
+    def parse_month(self, param):
+        value = self.request.query_params[param]
+        try:
+            return datetime.datetime.strptime(value[:7], '%Y-%m').date()
+        except ValueError:
+            raise serializers.ValidationError({param: ['Month has wrong format. Use YYYY-MM.']})
+
+    @action(detail=False)
+    def monthly(self, request):
+        """
+        Month-over-month income, spending and net totals.
+        """
+        return Response(list(summary(self.get_queryset(), 'month')))
+
+    @action(detail=False)
+    def categories(self, request):
+        """
+        Totals broken down by category over the requested months.
+        """
+        return Response(list(summary(self.get_queryset(), 'category', 'category__name')))
+
+    @action(detail=False)
+    def vendors(self, request):
+        """
+        Totals broken down by vendor over the requested months.
+        """
+        return Response(list(summary(self.get_queryset(), 'vendor', 'vendor__name')))
+
+
+class NetWorthViewSet(SparseFieldsMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    API endpoint with the requesting user's daily net worth snapshots: account balances summed
+    per account type, with mortgage accounts kept apart. Accepts `start` and `end` dates.
+    `trend/` pivots them into one point per day, ending with today's totals.
+    """
+    queryset = NetWorthSnapshot.objects.all().order_by('date', 'account_type', 'mortgage')
+    serializer_class = NetWorthSnapshotSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        """
+        Only the requesting user's snapshots, narrowed by the query parameters.
+        """
+        queryset = self.queryset.filter(user=self.request.user)
+        params = self.request.query_params
+        if params.get('start'):
+            queryset = queryset.filter(date__gte=parse_date_param(params, 'start'))
+        if params.get('end'):
+            queryset = queryset.filter(date__lte=parse_date_param(params, 'end'))
+        return queryset
+
+    @action(detail=False)
+    def trend(self, request):
+        """
+        One point per day with the total of each account type and of mortgages. Unless `end` is
+        in the past, the series ends with today's totals: the latest snapshot plus the transactions
+        dated since. `points` caps the series length by keeping every n-th day.
+        """
+        points = {}
+        for snapshot in self.get_queryset().values('date', 'account_type', 'mortgage', 'total'):
+            point = points.setdefault(snapshot['date'], trend_point(snapshot['date']))
+            point[trend_key(snapshot['account_type'], snapshot['mortgage'])] += snapshot['total']
+
+        params = request.query_params
+        today = timezone.localdate()
+        if not params.get('end') or parse_date_param(params, 'end') >= today:
+            date, totals = current_totals(request.user, today)
+            if date is not None and date < today:
+                points[today] = point = trend_point(today)
+                for (account_type, mortgage), total in totals.items():
+                    point[trend_key(account_type, mortgage)] += total
+
+        series = [points[date] for date in sorted(points)]
+        if params.get('points'):
+            step = -(-len(series) // parse_count_param(params, 'points', MAX_POINTS))
+            series = series[step - 1::step] + ([series[-1]] if len(series) % step else [])
+        return Response(NetWorthPointSerializer(series, many=True).data)
+
+
+def trend_point(date):
+    point = {'date': date, 'mortgage': ZERO}
+    point.update((type.name.lower(), ZERO) for type in Account.AccountType)
+    return point
+
+
+def trend_key(account_type, mortgage):
+    return 'mortgage' if mortgage else Account.AccountType(account_type).name.lower()
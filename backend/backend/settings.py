@@ -44,6 +44,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'accounts.metrics.RequestMetricsMiddleware',
+    'accounts.database.ReadYourWritesMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -81,7 +83,36 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        # Keep connections open between requests; health checks replace ones that went away.
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        # Seconds a writer waits for the write lock before "database is locked".
+        'OPTIONS': {'timeout': 20},
+    },
+    # The same file opened read-only. PrimaryReplicaRouter sends reads here, so reads never take
+    # the primary's connection or locks; in tests it is a mirror of 'default'.
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': (BASE_DIR / 'db.sqlite3').as_uri() + '?mode=ro',
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {'timeout': 20},
+        'TEST': {'MIRROR': 'default'},
+    },
+}
+
+DATABASE_ROUTERS = ['accounts.database.PrimaryReplicaRouter']
+
+# Once a request writes, its remaining reads go to the primary (see accounts/database.py).
+READ_YOUR_WRITES = True
+
+# Applied to every new SQLite connection. WAL lets readers run alongside a writer; synchronous=NORMAL
+# is safe in WAL mode; cache_size is in KiB when negative; mmap_size is in bytes.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'cache_size': -16000,
+    'mmap_size': 268435456,
 }
 
 
@@ -144,4 +175,24 @@ REST_FRAMEWORK = {
     ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 10,
-}
\ No newline at end of file
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Rendered account and transaction responses (see accounts/cache.py). The LRU cache is per process;
+    # use 'django.core.cache.backends.filebased.FileBasedCache' to share it between worker processes.
+    'responses': {
+        'BACKEND': 'accounts.cache.LRUCache',
+        'TIMEOUT': 300,
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    },
+}
+# Cache alias for API responses; None turns response caching off.
+RESPONSE_CACHE = 'responses'
+
+# Add Server-Timing headers with the per-request SQL and render timings.
+METRICS_SERVER_TIMING = DEBUG
+# Lets a scraper read /metrics with `Authorization: Bearer <token>`; with None only staff users may.
+METRICS_TOKEN = None
@@ -14,7 +14,9 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
-from accounts.views import AccountViewSet, CategoryViewSet, GroupViewSet, TransactionViewSet, UserViewSet, VendorViewSet
+from accounts import async_views
+from accounts.views import AccountViewSet, CategoryViewSet, GroupViewSet, NetWorthViewSet, RecurrenceViewSet, \
+    RuleViewSet, SummaryViewSet, TransactionViewSet, UserViewSet, VendorViewSet, index, metrics
 from django.contrib import admin
 from django.urls import path, include
 from rest_framework import routers
@@ -27,10 +29,20 @@ router.register(r'category', CategoryViewSet)
 router.register(r'vendors', VendorViewSet)
 router.register(r'accounts', AccountViewSet)
 router.register(r'transactions', TransactionViewSet)
+router.register(r'recurrences', RecurrenceViewSet)
+router.register(r'rules', RuleViewSet)
+router.register(r'summary', SummaryViewSet)
+router.register(r'networth', NetWorthViewSet)
 
 urlpatterns = [
     path('', include(router.urls)),
     # path("accounts/", include("accounts.urls")),
+    path('metrics', metrics, name='metrics'),
+    path('dashboard/', index, name='dashboard'),
+    # Async read endpoints for ASGI deployments (backend/asgi.py); same output as their sync counterparts.
+    path('async/transactions/', async_views.transaction_list, name='async-transaction-list'),
+    path('async/transactions/<int:pk>/', async_views.transaction_detail, name='async-transaction-detail'),
+    path('async/dashboard/', async_views.dashboard, name='async-dashboard'),
     path('admin/', admin.site.urls),
     path('user-accounts/', include('django.contrib.auth.urls')),
     path('api/', include('rest_framework.urls', namespace='rest_framework')),
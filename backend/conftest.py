@@ -0,0 +1,9 @@
+import pytest
+from django.core.cache import caches
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    """Start every test with empty caches; rolled-back test data reuses primary keys."""
+    for cache in caches.all():
+        cache.clear()